@@ -0,0 +1,29 @@
+from api.models import Author, Book
+from common.synthetic import GenerateDataCommand, bulk_insert, last_id, new_ids
+
+
+class Command(GenerateDataCommand):
+    help = 'Fill the database with seeded synthetic authors and books'
+
+    counts = {'authors': 5_000, 'books': 100_000}
+
+    def generate(self, synthetic, counts, options):
+        using, chunk_size, seed = options['database'], options['chunk_size'], options['seed']
+
+        after = last_id(Author, using)
+        authors = (Author(name=f'Author {seed}-{i}') for i in range(counts['authors']))
+        yield 'authors', bulk_insert(Author, authors, chunk_size, using)
+        author_ids = new_ids(Author, after, using)
+        if not author_ids:
+            return
+
+        # a few authors wrote most of the books
+        author_weights = synthetic.popularity(len(author_ids))
+        books = (
+            Book(
+                title=synthetic.title(), author_id=synthetic.pick(author_ids, author_weights)[0],
+                publication_year=synthetic.random.randint(1900, synthetic.now.year),
+            )
+            for _ in range(counts['books'])
+        )
+        yield 'books', bulk_insert(Book, books, chunk_size, using)
@@ -1,3 +1,15 @@
+import io
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Author, Book
+
+
+class GenerateDataTests(TestCase):
+    def test_generates_authors_and_books(self):
+        call_command('generate_data', seed=3, authors=10, books=40, chunk_size=15, stdout=io.StringIO())
+
+        self.assertEqual(Author.objects.count(), 10)
+        self.assertEqual(Book.objects.count(), 40)
+        self.assertFalse(Book.objects.filter(author__isnull=True).exists())
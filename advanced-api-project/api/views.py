@@ -3,9 +3,9 @@ from rest_framework import generics, permissions
 from rest_framework.exceptions import ValidationError
 from .models import Book
 from .serializers import BookSerializer
-from django.filters.rest_framework import DjangoFilterBackend
+from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as django_filters
-from rest_framework import filters.OrderingFilter, filters.SearchFilter
+from rest_framework import filters
 #  List and Create Books
 class BookListCreateAPIView(generics.ListCreateAPIView):
     queryset = Book.objects.all()
@@ -0,0 +1,22 @@
+from api.models import Book
+from common.synthetic import GenerateDataCommand, bulk_insert
+
+
+class Command(GenerateDataCommand):
+    help = 'Fill the database with seeded synthetic books'
+
+    counts = {'authors': 5_000, 'books': 100_000}
+
+    def generate(self, synthetic, counts, options):
+        using, chunk_size, seed = options['database'], options['chunk_size'], options['seed']
+        authors = [f'Author {seed}-{i}' for i in range(counts['authors'])]
+        if not authors:
+            return
+        # a few authors wrote most of the books
+        author_weights = synthetic.popularity(len(authors))
+
+        books = (
+            Book(title=synthetic.title(), author=synthetic.pick(authors, author_weights)[0])
+            for _ in range(counts['books'])
+        )
+        yield 'books', bulk_insert(Book, books, chunk_size, using)
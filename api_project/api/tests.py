@@ -1,3 +1,14 @@
+import io
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Book
+
+
+class GenerateDataTests(TestCase):
+    def test_generates_books(self):
+        call_command('generate_data', seed=3, authors=5, books=40, chunk_size=15, stdout=io.StringIO())
+
+        self.assertEqual(Book.objects.count(), 40)
+        self.assertLessEqual(Book.objects.values('author').distinct().count(), 5)
@@ -10,12 +10,17 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared middleware and tools used by every project live in <repo>/common
+sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -41,8 +46,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'api',
-    'bookshelf',
-    'relationship_app',
 ]
 
 REST_FRAMEWORK = {
@@ -56,8 +59,11 @@ REST_FRAMEWORK = {
     ],
 }
 
-AUTH_USER_MODEL = 'relationship_app.CustomModel'
 MIDDLEWARE = [
+    'common.metrics.MetricsMiddleware',
+    'common.accesslog.AccessLogMiddleware',
+    'common.profiling.ProfilerMiddleware',
+    'common.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "csp.middleware.CSPMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -68,7 +74,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'LibraryProject.urls'
+ROOT_URLCONF = 'api_project.urls'
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
@@ -134,10 +140,14 @@ WSGI_APPLICATION = 'api_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite in WAL mode with tuned pragmas and BEGIN IMMEDIATE (common/db/sqlite3),
+# keeping connections open between requests
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'common.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -162,7 +172,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-AUTH_USER_MODEL = 'bookshelf.CustomUser'
+# Per-request SQL and timing profiler (common/profiling.py)
+PROFILER = {
+    'SAMPLE_RATE': 0.0,
+    'LOG_FILE': BASE_DIR / 'profile.jsonl',
+    'SERVER_TIMING': True,
+}
+
+# Flags repeated same-shape queries per request (common/nplusone.py)
+NPLUSONE = {
+    'ENABLED': DEBUG,
+    'THRESHOLD': 3,
+    'ACTION': 'log',
+    'VIEWS': {},
+}
+
+# Request, query and cache metrics served at /metrics (common/metrics.py).
+# Point MULTIPROCESS_DIR at an empty directory when running several workers.
+METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+# JSON access log, written in batches by a background thread (common/accesslog.py)
+ACCESS_LOG = {
+    'ENABLED': True,
+    'FILE': BASE_DIR / 'access.log',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'QUEUE_SIZE': 10000,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -0,0 +1,205 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import Counter, count_queries, route_of
+
+
+ACCESS_LOG = {
+    'ENABLED': True,
+    # JSON lines go here; None turns the middleware off
+    'FILE': None,
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    # records waiting for the writer; past this they are dropped, never waited on
+    'QUEUE_SIZE': 10_000,
+    # lines per write, and the longest a line may sit unwritten when traffic is slow
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+DROPPED = Counter('access_log_dropped', 'Access log records dropped because the writer fell behind.')
+
+logger = logging.getLogger('common.accesslog')
+logger.propagate = False
+
+
+def get_config():
+    return {**ACCESS_LOG, **getattr(settings, 'ACCESS_LOG', {})}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the queue without blocking; a full queue drops the record."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+    def prepare(self, record):
+        # the record only carries a dict; formatting happens on the writer thread
+        return record
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """
+    Buffers formatted lines and writes them BATCH_SIZE at a time, rotating
+    before a batch would push the file past maxBytes. Only the writer thread
+    calls it.
+    """
+
+    def __init__(self, filename, batch_size=100, **kwargs):
+        super().__init__(filename, delay=True, encoding='utf-8', **kwargs)
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.buffer:
+                return
+            data = '\n'.join(self.buffer) + '\n'
+            self.buffer = []
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes and self.stream.tell() and self.stream.tell() + len(data) > self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class BatchingQueueListener(QueueListener):
+    """A QueueListener that also flushes its handlers whenever the queue goes quiet."""
+
+    def __init__(self, queue, *handlers, flush_interval=1.0):
+        super().__init__(queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def enqueue_sentinel(self):
+        # unlike records, the stop signal must get through even when the queue is full
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def start_writer(config):
+    """Start (once per process) the background writer and attach it to `logger`."""
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return _listener
+        records = queue.Queue(maxsize=config['QUEUE_SIZE'])
+        handler = BatchingRotatingFileHandler(
+            config['FILE'], batch_size=config['BATCH_SIZE'],
+            maxBytes=config['MAX_BYTES'], backupCount=config['BACKUP_COUNT'],
+        )
+        handler.setFormatter(JsonFormatter())
+        for old in logger.handlers[:]:
+            logger.removeHandler(old)
+        logger.addHandler(DroppingQueueHandler(records))
+        logger.setLevel(logging.INFO)
+        _listener = BatchingQueueListener(records, handler, flush_interval=config['FLUSH_INTERVAL'])
+        _listener.start()
+        _listener_pid = os.getpid()
+        return _listener
+
+
+def stop_writer():
+    """Write out everything queued and stop the writer thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+        for old in logger.handlers[:]:
+            logger.removeHandler(old)
+
+
+atexit.register(stop_writer)
+
+
+class AccessLogMiddleware:
+    """
+    One JSON line per request: route, user id, status, latency and query
+    count. The request thread only builds a dict and puts it on a bounded
+    queue; a background thread formats, batches and writes the lines.
+    """
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED'] or not config['FILE']:
+            raise MiddlewareNotUsed()
+        start_writer(config)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        # shares MetricsMiddleware's counter when that runs first
+        with count_queries(request) as queries:
+            response = self.get_response(request)
+        latency = time.perf_counter() - start
+
+        user = getattr(request, 'user', None)
+        logger.info({
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'method': request.method,
+            'path': request.path,
+            'route': route_of(request),
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'status': response.status_code,
+            'latency_ms': round(latency * 1000, 2),
+            'queries': queries.count,
+        })
+        return response
@@ -0,0 +1,121 @@
+"""
+Concurrent read/write throughput of the stock SQLite setup against the
+tuned one in base.py, on a scratch database:
+
+    python -m common.db.sqlite3.benchmark --readers 8 --writers 4 --seconds 5
+
+"stock" is what Django does without this backend: rollback journal, a new
+connection for every request, and deferred transactions. "tuned" keeps one
+connection per worker and uses PRAGMAS with BEGIN IMMEDIATE. Each worker is
+its own process, like a pre-forking app server.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from .base import PRAGMAS, apply_pragmas
+
+
+SCHEMA = 'CREATE TABLE post (id INTEGER PRIMARY KEY, author INTEGER, body TEXT, created REAL)'
+
+
+def connect(path, tuned):
+    connection = sqlite3.connect(path, isolation_level=None)
+    if tuned:
+        apply_pragmas(connection, PRAGMAS)
+    return connection
+
+
+def read(connection, rng):
+    # a detail lookup and a short list, as a typical page would
+    top = connection.execute('SELECT max(id) FROM post').fetchone()[0] or 1
+    connection.execute('SELECT * FROM post WHERE id = ?', (rng.randint(1, top),)).fetchall()
+    connection.execute('SELECT id, author FROM post WHERE author = ? ORDER BY id DESC LIMIT 20', (rng.randint(1, 100),)).fetchall()
+
+
+def write(connection, rng, tuned):
+    # read-then-write, like get_or_create or a form save with validation
+    connection.execute('BEGIN IMMEDIATE' if tuned else 'BEGIN')
+    try:
+        author = rng.randint(1, 100)
+        connection.execute('SELECT count(*) FROM post WHERE author = ?', (author,)).fetchone()
+        connection.execute(
+            'INSERT INTO post (author, body, created) VALUES (?, ?, ?)', (author, 'x' * 200, time.time()),
+        )
+        connection.execute('COMMIT')
+    except sqlite3.OperationalError:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def worker(path, tuned, writer, seconds, seed, results):
+    rng = random.Random(seed)
+    done = errors = 0
+    connection = connect(path, tuned) if tuned else None
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        conn = connection or connect(path, tuned)
+        try:
+            write(conn, rng, tuned) if writer else read(conn, rng)
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        finally:
+            if connection is None:
+                conn.close()
+    results.put(('writes' if writer else 'reads', done, errors))
+
+
+def run(tuned, readers, writers, seconds):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.sqlite3')
+        setup = connect(path, tuned)
+        setup.execute(SCHEMA)
+        setup.execute('CREATE INDEX post_author ON post (author, id)')
+        setup.executemany(
+            'INSERT INTO post (author, body, created) VALUES (?, ?, ?)',
+            ((i % 100 + 1, 'x' * 200, 0.0) for i in range(10_000)),
+        )
+        setup.close()
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, tuned, index < writers, seconds, index, results))
+            for index in range(readers + writers)
+        ]
+        for process in processes:
+            process.start()
+        totals = {'reads': [0, 0], 'writes': [0, 0]}
+        for _ in processes:
+            kind, done, errors = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += errors
+        for process in processes:
+            process.join()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s each')
+    print(f'{"":6} {"reads/s":>10} {"writes/s":>10} {"locked":>8}')
+    for name, tuned in (('stock', False), ('tuned', True)):
+        totals = run(tuned, args.readers, args.writers, args.seconds)
+        (reads, read_errors), (writes, write_errors) = totals['reads'], totals['writes']
+        print(
+            f'{name:6} {reads / args.seconds:10.0f} {writes / args.seconds:10.0f} '
+            f'{read_errors + write_errors:8d}'
+        )
+
+
+if __name__ == '__main__':
+    main()
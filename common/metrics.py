@@ -0,0 +1,510 @@
+import bisect
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+
+METRICS = {
+    'ENABLED': True,
+    # set when running several worker processes: each one keeps its values in
+    # a memory-mapped file here and /metrics adds them all up
+    'MULTIPROCESS_DIR': None,
+    # who may read /metrics
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def get_config():
+    return {**METRICS, **getattr(settings, 'METRICS', {})}
+
+
+# --- value storage ---
+
+class LocalValue:
+    """A float owned by this process. The lock is per value, so it is never contended for long."""
+
+    def __init__(self, kind, key):
+        self._key = key
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount):
+        with self._lock:
+            self._value += amount
+
+    def set(self, value):
+        self._value = float(value)
+
+    def get(self):
+        return self._value
+
+
+class ValueFile:
+    """
+    Append-only key/value file of doubles, memory-mapped and written only by
+    the process that owns it:
+
+        [4 bytes used][4 bytes padding]
+        [4 bytes key length][key, padded to 8][8 bytes value] ...
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.positions = {}
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.used = struct.unpack_from('<i', self._map, 0)[0] or 8
+        for key, _, position in _entries(self._map, self.used):
+            self.positions[key] = position
+
+    def _position(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            encoded = key.encode('utf-8')
+            padded = encoded + b' ' * (-(len(encoded) + 4) % 8)
+            entry = struct.pack(f'<i{len(padded)}sd', len(encoded), padded, 0.0)
+            while self.used + len(entry) > len(self._map):
+                self._grow()
+            self._map[self.used:self.used + len(entry)] = entry
+            self.used += len(entry)
+            struct.pack_into('<i', self._map, 0, self.used)
+            position = self.positions[key] = self.used - 8
+        return position
+
+    def _grow(self):
+        size = len(self._map) * 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def add(self, key, amount):
+        with self.lock:
+            position = self._position(key)
+            value = struct.unpack_from('<d', self._map, position)[0]
+            struct.pack_into('<d', self._map, position, value + amount)
+
+    def set(self, key, value):
+        with self.lock:
+            struct.pack_into('<d', self._map, self._position(key), value)
+
+    def get(self, key):
+        with self.lock:
+            return struct.unpack_from('<d', self._map, self._position(key))[0]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('<i', data, position)[0]
+        start = position + 4
+        key = bytes(data[start:start + length]).decode('utf-8')
+        position = start + length + (-(length + 4) % 8)
+        yield key, struct.unpack_from('<d', data, position)[0], position
+        position += 8
+
+
+def read_value_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return {}
+    return {key: value for key, value, _ in _entries(data, struct.unpack_from('<i', data, 0)[0])}
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def _value_file(kind):
+    # keyed by pid as well so a worker forked after import gets its own file
+    pid = os.getpid()
+    value_file = _files.get((kind, pid))
+    if value_file is None:
+        with _files_lock:
+            value_file = _files.get((kind, pid))
+            if value_file is None:
+                path = os.path.join(get_config()['MULTIPROCESS_DIR'], f'{kind}_{pid}.db')
+                value_file = _files[(kind, pid)] = ValueFile(path)
+    return value_file
+
+
+class FileValue:
+    def __init__(self, kind, key):
+        # gauges go to their own file so a dead worker's gauges can be dropped
+        self._kind = 'gauge' if kind == 'gauge' else 'counter'
+        self._key = key
+
+    def inc(self, amount):
+        _value_file(self._kind).add(self._key, amount)
+
+    def set(self, value):
+        _value_file(self._kind).set(self._key, float(value))
+
+    def get(self):
+        return _value_file(self._kind).get(self._key)
+
+
+def _value_class():
+    return FileValue if get_config()['MULTIPROCESS_DIR'] else LocalValue
+
+
+def mark_process_dead(pid, directory=None):
+    """Forget a finished worker's gauges; its counters and histograms stay counted."""
+    directory = directory or get_config()['MULTIPROCESS_DIR']
+    path = os.path.join(directory, f'gauge_{pid}.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# --- metrics ---
+
+def _sample_key(name, labels):
+    return json.dumps([name, labels])
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}')
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._make_child(list(zip(self.labelnames, values)))
+        return child
+
+    def _value(self, sample_name, labels):
+        return _value_class()(self.type, _sample_key(sample_name, labels))
+
+    def _make_child(self, labels):
+        raise NotImplementedError
+
+    def sample_names(self):
+        return [self.name]
+
+    def samples(self):
+        """{sample key: value} for every child this process has created."""
+        return {
+            value._key: value.get()
+            for child in list(self._children.values())
+            for value in child.values
+        }
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    class Child:
+        def __init__(self, value):
+            self.values = [value]
+
+        def inc(self, amount=1):
+            if amount < 0:
+                raise ValueError('counters only go up')
+            self.values[0].inc(amount)
+
+    def _make_child(self, labels):
+        return self.Child(self._value(f'{self.name}_total', labels))
+
+    def sample_names(self):
+        return [f'{self.name}_total']
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """In multiprocess mode the exported value is the sum over live workers."""
+
+    type = 'gauge'
+
+    class Child:
+        def __init__(self, value):
+            self.values = [value]
+
+        def inc(self, amount=1):
+            self.values[0].inc(amount)
+
+        def dec(self, amount=1):
+            self.values[0].inc(-amount)
+
+        def set(self, value):
+            self.values[0].set(value)
+
+    def _make_child(self, labels):
+        return self.Child(self._value(self.name, labels))
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    class Child:
+        def __init__(self, upper_bounds, buckets, total):
+            self.upper_bounds = upper_bounds
+            # counts are kept per bucket and made cumulative on export
+            self.buckets = buckets
+            self.total = total
+            self.values = [*buckets, total]
+
+        def observe(self, value):
+            self.total.inc(value)
+            self.buckets[bisect.bisect_left(self.upper_bounds, value)].inc(1)
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        if 'le' in labelnames:
+            raise ValueError("'le' is reserved for histogram buckets")
+        self.upper_bounds = tuple(sorted(float(bound) for bound in buckets if bound != math.inf)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _make_child(self, labels):
+        buckets = [
+            self._value(f'{self.name}_bucket', labels + [['le', _format_bound(bound)]])
+            for bound in self.upper_bounds
+        ]
+        return self.Child(self.upper_bounds, buckets, self._value(f'{self.name}_sum', labels))
+
+    def sample_names(self):
+        return [f'{self.name}_bucket', f'{self.name}_sum']
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'metric {metric.name!r} is already registered')
+            self.metrics[metric.name] = metric
+
+    def collect(self, directory=None):
+        """Current values as {sample key: value}, summed over all workers in multiprocess mode."""
+        directory = directory or get_config()['MULTIPROCESS_DIR']
+        if not directory:
+            samples = {}
+            for metric in list(self.metrics.values()):
+                samples.update(metric.samples())
+            return samples
+        samples = {}
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            for key, value in read_value_file(path).items():
+                samples[key] = samples.get(key, 0.0) + value
+        return samples
+
+    def exposition(self, directory=None):
+        """The collected values in the Prometheus text format."""
+        by_sample = {
+            sample_name: metric
+            for metric in self.metrics.values()
+            for sample_name in metric.sample_names()
+        }
+        grouped = {}
+        for key, value in self.collect(directory).items():
+            sample_name, labels = json.loads(key)
+            metric = by_sample.get(sample_name)
+            if metric is not None:
+                grouped.setdefault(metric.name, []).append((sample_name, labels, value))
+
+        lines = []
+        for name in sorted(grouped):
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            if metric.type == 'histogram':
+                samples = _cumulative(metric, grouped[name])
+            else:
+                samples = sorted(grouped[name], key=lambda sample: sample[1])
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _cumulative(metric, samples):
+    order = {_format_bound(bound): index for index, bound in enumerate(metric.upper_bounds)}
+    series = {}
+    for sample_name, labels, value in samples:
+        if sample_name.endswith('_sum'):
+            series.setdefault(json.dumps(labels), [[0.0] * len(order), 0.0])[1] = value
+        else:
+            le = labels[-1][1]
+            series.setdefault(json.dumps(labels[:-1]), [[0.0] * len(order), 0.0])[0][order[le]] = value
+
+    out = []
+    for key, (counts, total) in sorted(series.items()):
+        labels = json.loads(key)
+        running = 0.0
+        for bound, count in zip(metric.upper_bounds, counts):
+            running += count
+            out.append((f'{metric.name}_bucket', labels + [['le', _format_bound(bound)]], running))
+        out.append((f'{metric.name}_count', labels, running))
+        out.append((f'{metric.name}_sum', labels, total))
+    return out
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if value.is_integer() else repr(value)
+
+
+REGISTRY = Registry()
+
+
+# --- request metrics ---
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests.', ['route', 'method'],
+)
+REQUESTS = Counter(
+    'http_requests', 'Requests handled, by response status.', ['route', 'method', 'status'],
+)
+DB_QUERIES = Counter(
+    'db_queries', 'Database queries run while handling requests.', ['route'],
+)
+THROTTLED = Counter(
+    'throttled_requests', 'Requests rejected with 429 Too Many Requests.', ['route'],
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Cache-aside lookups, by cache and hit or miss.', ['cache', 'result'],
+)
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(request):
+    """
+    Count the queries run while handling `request`. Middleware further in
+    gets the counter already on the request instead of wrapping every query
+    a second time.
+    """
+    queries = getattr(request, '_query_counter', None)
+    if queries is not None:
+        yield queries
+        return
+    queries = request._query_counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        yield queries
+
+
+def route_of(request):
+    # the route pattern, not the path, so ids don't blow up the label count
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name or 'unmatched'
+
+
+class MetricsMiddleware:
+    """Latency, status and query counts per route and method."""
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with count_queries(request) as queries:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        route = route_of(request)
+        method = request.method if request.method in KNOWN_METHODS else 'other'
+        REQUEST_LATENCY.labels(route, method).observe(elapsed)
+        REQUESTS.labels(route, method, response.status_code).inc()
+        if queries.count:
+            DB_QUERIES.labels(route).inc(queries.count)
+        if response.status_code == 429:
+            THROTTLED.labels(route).inc()
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in get_config()['ALLOWED_IPS']:
+        raise Http404()
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,221 @@
+import logging
+import os
+import re
+import sys
+import sysconfig
+from collections import defaultdict
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Manager, QuerySet
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.template.base import Node, TokenType
+
+
+logger = logging.getLogger('common.nplusone')
+
+NPLUSONE = {
+    'ENABLED': False,
+    # how many queries of the same shape count as an N+1
+    'THRESHOLD': 3,
+    # 'log' or 'raise'
+    'ACTION': 'log',
+    # per view overrides by view name or dotted path: 'log', 'raise' or 'ignore'
+    'VIEWS': {},
+}
+
+IN_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+
+# frames from these paths are never blamed for a query
+_LIBRARY_PATHS = tuple({
+    os.path.dirname(django.__file__),
+    sysconfig.get_paths()['stdlib'],
+    sysconfig.get_paths()['purelib'],
+    sysconfig.get_paths()['platlib'],
+    __file__,
+})
+
+
+def get_config():
+    return {**NPLUSONE, **getattr(settings, 'NPLUSONE', {})}
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    # `IN (...)` lists of different lengths are still the same query
+    return IN_LIST_RE.sub('(%s...)', sql)
+
+
+def _suggestion(obj):
+    if isinstance(obj, ForwardManyToOneDescriptor):
+        field = obj.field
+        return f"{field.model.__name__}.{field.name}: add select_related('{field.name}')"
+    if isinstance(obj, Manager) and hasattr(obj, 'instance'):
+        model = type(obj.instance).__name__
+        if getattr(obj, 'prefetch_cache_name', None):
+            # many-to-many managers, including taggit's
+            return f"{model}.{obj.prefetch_cache_name}: add prefetch_related('{obj.prefetch_cache_name}')"
+        field = getattr(obj, 'field', None)
+        if field is not None and field.remote_field is not None:
+            accessor = field.remote_field.get_accessor_name()
+            return f"{model}.{accessor}: add prefetch_related('{accessor}')"
+    if isinstance(obj, QuerySet):
+        # a related manager's queryset evaluated later, e.g. by a template loop
+        return _queryset_suggestion(obj)
+    return None
+
+
+def _queryset_suggestion(queryset):
+    instance = queryset._hints.get('instance')
+    if instance is None:
+        return None
+    relations = [
+        field for field in instance._meta.get_fields()
+        if (field.one_to_many or field.many_to_many) and field.related_model is queryset.model
+    ]
+    if len(relations) != 1:
+        return None
+    field = relations[0]
+    name = field.name if field.concrete else field.get_accessor_name()
+    return f"{type(instance).__name__}.{name}: add prefetch_related('{name}')"
+
+
+def _describe_node(node):
+    token = node.token
+    tag = '{{ %s }}' if token.token_type == TokenType.VAR else '{%% %s %%}'
+    name = getattr(node.origin, 'template_name', None) or node.origin
+    return f'{name}:{token.lineno} ' + tag % token.contents
+
+
+def _wrapper_code(wrapper):
+    # plain functions and bound methods carry their code; instances via __call__
+    code = getattr(wrapper, '__code__', None)
+    if code is None:
+        code = getattr(getattr(type(wrapper), '__call__', None), '__code__', None)
+    return code
+
+
+def attribute(frame, skip=()):
+    """
+    Work out who triggered the query running in `frame`: the innermost
+    template node being rendered, the innermost frame of project code, and a
+    select_related/prefetch_related hint from the relation that was accessed.
+    Frames running any code object in `skip`, such as the other execute
+    wrappers stacked around the detector, are never blamed.
+    """
+    template = code = suggestion = None
+    while frame is not None and not (template and code and suggestion):
+        owner = frame.f_locals.get('self')
+        if suggestion is None and owner is not None:
+            suggestion = _suggestion(owner)
+        if template is None and isinstance(owner, Node) and getattr(owner, 'token', None):
+            template = _describe_node(owner)
+        filename = frame.f_code.co_filename
+        if (
+            code is None and frame.f_code not in skip
+            and not filename.startswith(_LIBRARY_PATHS) and not filename.startswith('<')
+        ):
+            code = f'{filename}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return {'template': template, 'code': code, 'suggestion': suggestion}
+
+
+class NPlusOneDetector:
+    """
+    Watches every query run in this thread while active and flags query
+    shapes that repeat `threshold` times or more:
+
+        with NPlusOneDetector(action='raise'):
+            response = client.get('/blog/')
+    """
+
+    def __init__(self, threshold=None, action=None):
+        config = get_config()
+        self.threshold = threshold or config['THRESHOLD']
+        self.action = action or config['ACTION']
+        self.counts = defaultdict(int)
+        self.sources = {}
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self._stack.close()
+        if exc_type is None:
+            self.report()
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        self.counts[shape] += 1
+        # walking the stack is slow, so only do it once a shape looks like an N+1
+        if self.counts[shape] == self.threshold:
+            # metrics, access log and profiler wrappers all sit between the
+            # detector and the code that ran the query
+            wrappers = context['connection'].execute_wrappers
+            skip = {_wrapper_code(wrapper) for wrapper in wrappers}
+            self.sources[shape] = attribute(sys._getframe(1), skip)
+        return execute(sql, params, many, context)
+
+    def problems(self):
+        return [
+            {'sql': shape, 'count': self.counts[shape], **source}
+            for shape, source in self.sources.items()
+        ]
+
+    def report(self, action=None):
+        action = action or self.action
+        problems = self.problems()
+        if not problems or action == 'ignore':
+            return problems
+        message = '\n\n'.join(format_problem(problem) for problem in problems)
+        if action == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+        return problems
+
+
+def format_problem(problem):
+    lines = [f"N+1 query: {problem['count']} queries shaped like\n    {problem['sql']}"]
+    if problem['template']:
+        lines.append(f"  rendering {problem['template']}")
+    if problem['code']:
+        lines.append(f"  from {problem['code']}")
+    if problem['suggestion']:
+        lines.append(f"  hint: {problem['suggestion']}")
+    return '\n'.join(lines)
+
+
+class NPlusOneMiddleware:
+    """Runs every request under an NPlusOneDetector when NPLUSONE['ENABLED']."""
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # the view isn't known until the response is back, so report after
+        with NPlusOneDetector(self.config['THRESHOLD'], action='ignore') as detector:
+            response = self.get_response(request)
+        detector.report(self.action_for(request))
+        return response
+
+    def action_for(self, request):
+        match = getattr(request, 'resolver_match', None)
+        views = self.config['VIEWS']
+        if match is not None:
+            for key in (match.view_name, match._func_path):
+                if key in views:
+                    return views[key]
+        return self.config['ACTION']
@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import re
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import DisallowedHost, MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import cc_delim_re, get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from .metrics import record_cache
+
+try:
+    import brotli
+except ImportError:  # optional; without it pages are only stored gzipped
+    brotli = None
+
+
+PAGE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    # seconds a page is kept; purges normally retire it long before that
+    'TIMEOUT': 600,
+    # besides the session cookie, cookies that may change what a page shows
+    'BYPASS_COOKIES': ('messages',),
+    # how long one request may hold the right to re-render a page, and how
+    # long the others wait for it when there is no stale copy to hand out
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2.0,
+    'COMPRESS_LEVEL': 6,
+    # used when the brotli package is installed
+    'BROTLI_QUALITY': 5,
+}
+
+# Views opt in by tagging their response, e.g. "posts post-4 tag-django".
+# Untagged responses are never cached, since nothing could purge them.
+SURROGATE_HEADER = 'Surrogate-Key'
+
+KEY_PREFIX = 'pagecache'
+
+# headers the middleware sets itself when serving a stored page
+UNSTORED_HEADERS = {'content-length', 'content-encoding', 'x-page-cache'}
+
+# a response that varies on anything else can't be shared between clients
+SHAREABLE_VARY = {'cookie', 'accept-encoding'}
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+
+
+def get_config():
+    return {**PAGE_CACHE, **getattr(settings, 'PAGE_CACHE', {})}
+
+
+def _cache():
+    return caches[get_config()['CACHE']]
+
+
+def _version_key(surrogate_key):
+    return f'{KEY_PREFIX}:key:{surrogate_key}'
+
+
+def add_surrogate_keys(response, *keys):
+    """Tag `response` with surrogate keys so the page cache may store it."""
+    existing = response.headers.get(SURROGATE_HEADER, '').split()
+    response[SURROGATE_HEADER] = ' '.join(dict.fromkeys([*existing, *map(str, keys)]))
+    return response
+
+
+def purge(*keys):
+    """
+    Retire every cached page tagged with any of `keys`. Each key's version is
+    the time it was last purged, and a page is only served while it was
+    rendered after all of its keys' versions, so nothing else is touched.
+    """
+    if keys:
+        now = time.time()
+        _cache().set_many({_version_key(key): now for key in keys}, timeout=None)
+
+
+def page_key(request):
+    url = request.build_absolute_uri()
+    return f'{KEY_PREFIX}:page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+class PageCacheMiddleware:
+    """
+    Serves anonymous GET and HEAD requests from gzipped (and, with brotli
+    installed, brotli) copies of earlier responses, answering conditional
+    requests with 304 when the page's ETag or Last-Modified says the client
+    is up to date. Requests with a session (or other personal) cookie always
+    reach the view, so this sits above the session and auth middleware and
+    a hit skips them. Streamed responses are compressed and stored as they
+    are sent, and served whole from then on.
+
+    A page that is missing or purged is re-rendered by one request at a
+    time: the others get the stale copy meanwhile, or wait briefly for the
+    fresh one when there is none.
+    """
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.cache = caches[self.config['CACHE']]
+        self.bypass_cookies = {settings.SESSION_COOKIE_NAME, *self.config['BYPASS_COOKIES']}
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or self.bypass_cookies & request.COOKIES.keys():
+            return self.get_response(request)
+        try:
+            key = page_key(request)
+        except DisallowedHost:
+            return self.get_response(request)
+
+        entry = self.cache.get(key)
+        if entry is not None and self.is_fresh(entry):
+            record_cache('page', True)
+            return self.serve(request, entry, 'hit')
+        record_cache('page', False)
+        if request.method == 'HEAD':
+            return self.get_response(request)
+
+        lock = f'{key}:lock'
+        locked = self.cache.add(lock, 1, timeout=self.config['LOCK_TIMEOUT'])
+        if not locked:
+            if entry is not None:
+                return self.serve(request, entry, 'stale')
+            entry = self.wait_for(key)
+            if entry is not None:
+                return self.serve(request, entry, 'hit')
+        try:
+            started = time.time()
+            response = self.get_response(request)
+            if self.is_storable(response):
+                if not response.streaming:
+                    # served from what was just stored, so it goes out compressed too
+                    return self.serve(request, self.store(key, started, response), 'miss')
+                # stored once the last chunk is sent, holding the lock till then
+                response.streaming_content = self.store_streamed(
+                    key, lock if locked else None, started, response, response.streaming_content,
+                )
+                locked = False
+        finally:
+            if locked:
+                self.cache.delete(lock)
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def is_fresh(self, entry):
+        versions = self.cache.get_many([_version_key(key) for key in entry['keys']])
+        # a version that was evicted may hide a purge, so treat it as one
+        return len(versions) == len(entry['keys']) and max(versions.values()) <= entry['started']
+
+    def wait_for(self, key):
+        deadline = time.monotonic() + self.config['WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.cache.get(key)
+            if entry is not None and self.is_fresh(entry):
+                return entry
+        return None
+
+    def is_storable(self, response):
+        if response.status_code != 200 or response.cookies:
+            return False
+        if SURROGATE_HEADER not in response or response.has_header('Content-Encoding'):
+            return False
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if any(directive in cache_control for directive in ('private', 'no-store', 'no-cache')):
+            return False
+        vary = {header.strip().lower() for header in cc_delim_re.split(response.headers.get('Vary', ''))}
+        return vary <= SHAREABLE_VARY | {''}
+
+    def store(self, key, started, response, gzipped=None, brotlied=None):
+        keys = response[SURROGATE_HEADER].split()
+        # a key that was never purged gets a version now; add() so a purge
+        # that raced this render is not overwritten
+        for surrogate_key in keys:
+            self.cache.add(_version_key(surrogate_key), started, timeout=None)
+        if gzipped is None:
+            gzipped = gzip.compress(response.content, compresslevel=self.config['COMPRESS_LEVEL'])
+            if brotli is not None:
+                brotlied = brotli.compress(response.content, quality=self.config['BROTLI_QUALITY'])
+        entry = {
+            'started': started,
+            'keys': keys,
+            'status': response.status_code,
+            'headers': [(name, value) for name, value in response.items() if name.lower() not in UNSTORED_HEADERS],
+            'body': gzipped,
+        }
+        if brotlied is not None:
+            entry['br'] = brotlied
+        self.cache.set(key, entry, timeout=self.config['TIMEOUT'])
+        return entry
+
+    def store_streamed(self, key, lock, started, response, content):
+        # wbits=31: a gzip stream, so the result reads like gzip.compress()'s
+        gzipper = zlib.compressobj(self.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+        brotlier = brotli.Compressor(quality=self.config['BROTLI_QUALITY']) if brotli is not None else None
+        gzipped, brotlied = [], []
+        try:
+            for chunk in content:
+                gzipped.append(gzipper.compress(chunk))
+                if brotlier is not None:
+                    brotlied.append(brotlier.process(chunk))
+                yield chunk
+            # only reached when the client took the whole body
+            gzipped.append(gzipper.flush())
+            if brotlier is not None:
+                brotlied.append(brotlier.finish())
+            self.store(key, started, response, b''.join(gzipped), b''.join(brotlied) if brotlier else None)
+        finally:
+            if lock is not None:
+                self.cache.delete(lock)
+
+    def serve(self, request, entry, state):
+        # resolve the URL anyway so metrics and the access log see the route
+        try:
+            request.resolver_match = resolve(request.path_info)
+        except Resolver404:
+            pass
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if 'br' in entry and ACCEPTS_BROTLI.search(accept_encoding):
+            response = HttpResponse(entry['br'], status=entry['status'])
+            response['Content-Encoding'] = 'br'
+        elif ACCEPTS_GZIP.search(accept_encoding):
+            response = HttpResponse(entry['body'], status=entry['status'])
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(entry['body']), status=entry['status'])
+        for name, value in entry['headers']:
+            response[name] = value
+        patch_vary_headers(response, ['Accept-Encoding'])
+        etag = response.get('ETag')
+        if etag and response.has_header('Content-Encoding') and not etag.startswith('W/'):
+            # the encoded bytes differ from what the strong ETag was made for
+            response['ETag'] = etag = f'W/{etag}'
+        if etag or response.has_header('Last-Modified'):
+            last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+        if response.status_code != 304:
+            response['Content-Length'] = len(response.content)
+        response['X-Page-Cache'] = state
+        return response
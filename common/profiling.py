@@ -0,0 +1,139 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+PROFILER = {
+    # fraction of requests profiled; 0 turns the middleware into a pass-through
+    'SAMPLE_RATE': 0.0,
+    # sampled requests are appended here as one JSON object per line (None = off)
+    'LOG_FILE': None,
+    'SERVER_TIMING': True,
+    # how many repeated statements of each kind to keep per record
+    'TOP_DUPLICATES': 5,
+}
+
+
+def get_config():
+    return {**PROFILER, **getattr(settings, 'PROFILER', {})}
+
+
+class QueryProfile:
+    """
+    Records every query run on any database connection in this thread while
+    active, with its time in seconds:
+
+        with QueryProfile() as profile:
+            list(Post.objects.all())
+        profile.count, profile.duration, profile.duplicates()
+
+    Duplicates are identical statements with identical parameters; similar
+    queries share the SQL but not the parameters (the usual N+1 shape).
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def duplicates(self, limit=None):
+        """Statements run more than once with the same params: [(sql, times)]."""
+        counts = Counter((sql, params) for sql, params, _ in self.queries)
+        return [(sql, times) for (sql, _), times in counts.most_common(limit) if times > 1]
+
+    def similar(self, limit=None):
+        """Statements run more than once with any params: [(sql, times)]."""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return [(sql, times) for sql, times in counts.most_common(limit) if times > 1]
+
+
+_log_lock = threading.Lock()
+
+
+def write_record(path, record):
+    line = json.dumps(record, default=str) + '\n'
+    with _log_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a sample of requests: query count, SQL time, repeated statements
+    and total time. Results go out as a Server-Timing header and, if
+    PROFILER['LOG_FILE'] is set, as a JSONL record. Unsampled requests are
+    passed straight through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+
+    def __call__(self, request):
+        rate = self.config['SAMPLE_RATE']
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with QueryProfile() as profile:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        db_ms, total_ms = profile.duration * 1000, total * 1000
+        if self.config['SERVER_TIMING']:
+            timing = (
+                f'db;dur={db_ms:.1f};desc="{profile.count} queries", '
+                f'app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        if self.config['LOG_FILE']:
+            match = getattr(request, 'resolver_match', None)
+            write_record(self.config['LOG_FILE'], {
+                'time': time.time(),
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'db_ms': round(db_ms, 2),
+                'queries': profile.count,
+                'duplicates': [
+                    {'sql': sql, 'count': times}
+                    for sql, times in profile.duplicates(self.config['TOP_DUPLICATES'])
+                ],
+                'similar': [
+                    {'sql': sql, 'count': times}
+                    for sql, times in profile.similar(self.config['TOP_DUPLICATES'])
+                ],
+            })
+        return response
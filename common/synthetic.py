@@ -0,0 +1,196 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+
+WORDS = (
+    'alpha bravo cedar delta ember fable glade harbor island jasper kettle lumen meadow '
+    'nectar orbit pepper quartz river saddle timber umber velvet willow xenon yonder zephyr '
+    'amber basil cobalt dune echo fern granite hazel indigo juniper kelp lantern maple '
+    'nimbus olive prairie quill raven sierra thistle upland vista walnut yarrow zenith '
+    'the a of and to in is on for with at by from that this it as be are was'
+).split()
+
+TAGS = (
+    'django python web api design data music travel food books science art news '
+    'sports health games film code history nature photo tech life'
+).split()
+
+
+class Synthetic:
+    """
+    Seeded random data. The same seed and arguments always produce the same
+    rows (dates are relative to when the command runs), so a dataset can be
+    described by its command line.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def power_law(self, count, mean, exponent=1.5, maximum=None):
+        """`count` sizes from a Pareto distribution: most small, a few huge."""
+        scale = mean * (exponent - 1) / exponent
+        sizes = (int(scale * self.random.paretovariate(exponent)) for _ in range(count))
+        return [min(size, maximum) if maximum is not None else size for size in sizes]
+
+    def popularity(self, count, exponent=1.1):
+        """Cumulative Zipf weights over `count` items, in random rank order."""
+        ranks = list(range(1, count + 1))
+        self.random.shuffle(ranks)
+        return list(accumulate(1 / rank ** exponent for rank in ranks))
+
+    def pick(self, population, cum_weights, k=1):
+        return self.random.choices(population, cum_weights=cum_weights, k=k)
+
+    def words(self, low, high):
+        return ' '.join(self.random.choices(WORDS, k=self.random.randint(low, high)))
+
+    def title(self):
+        return self.words(3, 8).capitalize()
+
+    def body(self, median_words=60, tags=()):
+        # log-normal lengths: mostly short, with a long tail of long posts
+        length = max(1, int(self.random.lognormvariate(0, 0.8) * median_words))
+        words = self.random.choices(WORDS, k=length)
+        words.extend(f'#{tag}' for tag in tags)
+        return ' '.join(words).capitalize() + '.'
+
+    def timestamps(self, count, days):
+        """`count` times over the last `days` days, oldest first."""
+        offsets = sorted((self.random.uniform(0, days) for _ in range(count)), reverse=True)
+        return [self.now - timedelta(days=offset) for offset in offsets]
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def bulk_insert(model, objects, chunk_size=5000, using=DEFAULT_DB_ALIAS):
+    """
+    Insert a (possibly lazy) stream of unsaved objects, one transaction per
+    chunk, so memory stays flat however many rows are generated. Returns the
+    number of rows inserted.
+    """
+    inserted = 0
+    manager = model._base_manager.db_manager(using)
+    for chunk in chunks(objects, chunk_size):
+        with transaction.atomic(using=using):
+            manager.bulk_create(chunk, batch_size=chunk_size)
+        inserted += len(chunk)
+    return inserted
+
+
+def new_ids(model, after, using=DEFAULT_DB_ALIAS):
+    """
+    Primary keys of rows inserted since the largest pk was `after`. Bulk
+    inserts into a table nobody else writes to get consecutive ids, so this
+    is normally a range and no ids are loaded at all; if another writer left
+    gaps, the ids are read in pk order into a compact array instead.
+    """
+    rows = model._base_manager.db_manager(using).filter(pk__gt=after or 0)
+    first, last = (after or 0) + 1, last_id(model, using)
+    if rows.count() == last - first + 1:
+        return range(first, last + 1)
+    return array('q', rows.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=10000))
+
+
+def last_id(model, using=DEFAULT_DB_ALIAS):
+    return model._base_manager.db_manager(using).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let generated rows keep their own auto_now/auto_now_add values."""
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def sqlite_tuning(using=DEFAULT_DB_ALIAS):
+    """
+    Trade durability for speed while loading: no fsync, an in-memory journal
+    and a big page cache. Only for throwaway data; settings are restored after.
+    """
+    connection = connections[using]
+    # SQLite refuses to change these inside a transaction (e.g. in tests)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA cache_size')
+        cache_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA journal_mode = MEMORY')
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA cache_size = -262144')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+            cursor.execute(f'PRAGMA cache_size = {int(cache_size)}')
+            cursor.execute('PRAGMA temp_store = DEFAULT')
+
+
+class GenerateDataCommand(BaseCommand):
+    """
+    Base for each project's `generate_data` command. Subclasses set
+    `counts` (rows per table at --scale 1), may add their own arguments, and
+    implement generate(synthetic, counts, options), yielding (table, rows)
+    as each table is filled.
+    """
+
+    counts = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplies every default row count')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        for name, count in self.counts.items():
+            parser.add_argument(f'--{name}', type=int, default=None, help=f'Defaults to {count} x scale')
+
+    def handle(self, *args, **options):
+        counts = {
+            name: options[name] if options[name] is not None else int(count * options['scale'])
+            for name, count in self.counts.items()
+        }
+        synthetic = Synthetic(options['seed'])
+        total = 0
+        started = time.perf_counter()
+        with sqlite_tuning(options['database']):
+            for table, rows in self.generate(synthetic, counts, options):
+                total += rows
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{table}: {rows} rows ({elapsed:.1f}s elapsed)')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)'
+        ))
+
+    def generate(self, synthetic, counts, options):
+        raise NotImplementedError
@@ -0,0 +1,439 @@
+import gzip
+import json
+import logging
+import queue
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import path
+
+from . import accesslog, metrics, pagecache
+from .db.sqlite3.base import DatabaseWrapper
+from .nplusone import NPlusOneDetector, NPlusOneError, NPlusOneMiddleware
+from .profiling import ProfilerMiddleware, QueryProfile
+from .synthetic import bulk_insert, last_id, new_ids
+
+
+def n_plus_one_view(request):
+    for pk in range(3):
+        Group.objects.filter(pk=pk).exists()
+    Group.objects.filter(pk=0).exists()
+    return HttpResponse('ok')
+
+
+class QueryProfileTests(TestCase):
+    def test_counts_duplicate_and_similar_queries(self):
+        with QueryProfile() as profile:
+            n_plus_one_view(None)
+
+        self.assertEqual(profile.count, 4)
+        self.assertEqual([times for _, times in profile.duplicates()], [2])
+        self.assertEqual([times for _, times in profile.similar()], [4])
+
+
+class ProfilerMiddlewareTests(TestCase):
+    def setUp(self):
+        self.log = tempfile.NamedTemporaryFile(suffix='.jsonl', delete=False)
+        self.log.close()
+        self.addCleanup(os.unlink, self.log.name)
+
+    def test_unsampled_requests_pass_through(self):
+        with override_settings(PROFILER={'SAMPLE_RATE': 0, 'LOG_FILE': self.log.name}):
+            middleware = ProfilerMiddleware(n_plus_one_view)
+        response = middleware(RequestFactory().get('/'))
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(os.path.getsize(self.log.name), 0)
+
+    def test_sampled_request_gets_header_and_record(self):
+        with override_settings(PROFILER={'SAMPLE_RATE': 1, 'LOG_FILE': self.log.name}):
+            middleware = ProfilerMiddleware(n_plus_one_view)
+        response = middleware(RequestFactory().get('/books/'))
+
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+        with open(self.log.name) as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record['path'], '/books/')
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['similar'][0]['count'], 4)
+
+
+def describe_permissions():
+    return [str(permission) for permission in Permission.objects.all()[:5]]
+
+
+class NPlusOneDetectorTests(TestCase):
+    def test_foreign_key_lookups_in_str_are_attributed_to_caller(self):
+        with NPlusOneDetector(action='ignore') as detector:
+            describe_permissions()
+
+        problem, = detector.problems()
+        self.assertEqual(problem['count'], 5)
+        self.assertIn('common/tests.py', problem['code'])
+        self.assertIn("select_related('content_type')", problem['suggestion'])
+
+    def test_many_to_many_in_template_loop_is_attributed_to_tag(self):
+        User = get_user_model()
+        for name in ('a', 'b', 'c'):
+            User.objects.create_user(username=name, password='testpass')
+        template = Template(
+            '{% for user in users %}\n'
+            '{% for group in user.groups.all %}{{ group }}{% endfor %}\n'
+            '{% endfor %}'
+        )
+
+        with self.assertRaises(NPlusOneError) as raised:
+            with NPlusOneDetector(action='raise'):
+                template.render(Context({'users': User.objects.all()}))
+
+        message = str(raised.exception)
+        self.assertIn(':2 {% for group in user.groups.all %}', message)
+        self.assertIn("prefetch_related('groups')", message)
+
+    @override_settings(METRICS={'ENABLED': True}, NPLUSONE={'ENABLED': True, 'ACTION': 'raise'})
+    def test_wrappers_around_the_middleware_are_not_blamed(self):
+        def view(request):
+            describe_permissions()
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(NPlusOneMiddleware(view))
+        with QueryProfile():
+            with self.assertRaises(NPlusOneError) as raised:
+                middleware(RequestFactory().get('/'))
+
+        message = str(raised.exception)
+        self.assertIn('common/tests.py', message)
+        self.assertNotIn('common/metrics.py', message)
+        self.assertNotIn('common/profiling.py', message)
+
+    def test_prefetched_queries_pass(self):
+        with NPlusOneDetector(action='raise') as detector:
+            [str(p) for p in Permission.objects.select_related('content_type')[:5]]
+        self.assertEqual(detector.problems(), [])
+
+
+urlpatterns = [path('metrics', metrics.metrics_view)]
+
+
+class MetricsTests(TestCase):
+    def test_exposition_format(self):
+        registry = metrics.Registry()
+        requests = metrics.Counter('requests', 'Requests.', ['method'], registry=registry)
+        latency = metrics.Histogram('latency_seconds', 'Latency.', ['route'], registry=registry, buckets=(0.1, 1))
+        requests.labels('GET').inc()
+        requests.labels(method='GET').inc(2)
+        latency.labels('a/').observe(0.05)
+        latency.labels('a/').observe(0.5)
+
+        text = registry.exposition()
+        self.assertIn('# TYPE requests counter\nrequests_total{method="GET"} 3\n', text)
+        self.assertIn(
+            'latency_seconds_bucket{route="a/",le="0.1"} 1\n'
+            'latency_seconds_bucket{route="a/",le="1.0"} 2\n'
+            'latency_seconds_bucket{route="a/",le="+Inf"} 2\n'
+            'latency_seconds_count{route="a/"} 2\n'
+            'latency_seconds_sum{route="a/"} 0.55\n',
+            text,
+        )
+
+    def test_multiprocess_values_are_summed_across_files(self):
+        registry = metrics.Registry()
+        metrics.Counter('jobs', 'Jobs.', registry=registry)
+        metrics.Gauge('queue', 'Queue.', registry=registry)
+        with tempfile.TemporaryDirectory() as directory:
+            for pid, jobs in ((1, 2), (2, 5)):
+                counters = metrics.ValueFile(os.path.join(directory, f'counter_{pid}.db'))
+                counters.add(metrics._sample_key('jobs_total', []), jobs)
+                counters.close()
+                gauges = metrics.ValueFile(os.path.join(directory, f'gauge_{pid}.db'))
+                gauges.set(metrics._sample_key('queue', []), 4)
+                gauges.close()
+            metrics.mark_process_dead(2, directory)
+
+            text = registry.exposition(directory)
+
+        self.assertIn('jobs_total 7\n', text)
+        self.assertIn('queue 4\n', text)
+
+    def test_value_file_grows_and_reopens(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'counter_1.db')
+            values = metrics.ValueFile(path)
+            for i in range(5000):
+                values.add(f'key-{i}', i)
+            values.close()
+            self.assertEqual(metrics.ValueFile(path).get('key-4999'), 4999)
+            self.assertEqual(len(metrics.read_value_file(path)), 5000)
+
+    @override_settings(ROOT_URLCONF='common.tests')
+    def test_middleware_and_endpoint(self):
+        self.client.get('/metrics')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('http_requests_total{route="metrics",method="GET",status="200"}', response.content.decode())
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+
+class NewIdsTests(TestCase):
+    def test_consecutive_ids_are_a_range_and_gaps_are_read(self):
+        Group.objects.create(name='existing')
+        after = last_id(Group)
+        bulk_insert(Group, (Group(name=f'group {i}') for i in range(5)), chunk_size=2)
+
+        with self.assertNumQueries(2):
+            ids = new_ids(Group, after)
+        self.assertEqual(ids, range(after + 1, after + 6))
+
+        Group.objects.filter(pk=after + 3).delete()
+        self.assertEqual(list(new_ids(Group, after)), [after + 1, after + 2, after + 4, after + 5])
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def connect(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {
+            **connections.settings['default'],
+            'ENGINE': 'common.db.sqlite3',
+            'NAME': os.path.join(directory, 'db.sqlite3'),
+            'OPTIONS': options,
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias='sqlite-test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_wal_and_tuned_pragmas(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+    def test_options_override_defaults(self):
+        wrapper = self.connect(pragmas={'synchronous': 'FULL', 'mmap_size': None}, transaction_mode='DEFERRED')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)
+        self.assertEqual(self.pragma(wrapper, 'mmap_size'), 0)
+        self.assertEqual(wrapper.transaction_mode, 'DEFERRED')
+
+
+class AccessLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'access.log')
+        accesslog.stop_writer()
+        self.addCleanup(accesslog.stop_writer)
+
+    def test_middleware_writes_json_lines_in_background(self):
+        user = get_user_model().objects.create_user(username='reader', password='testpass')
+        config = {'FILE': self.path, 'BATCH_SIZE': 2, 'FLUSH_INTERVAL': 0.05}
+        with override_settings(ACCESS_LOG=config):
+            middleware = accesslog.AccessLogMiddleware(n_plus_one_view)
+        request = RequestFactory().get('/groups/')
+        request.user = user
+
+        middleware(request)
+        accesslog.stop_writer()
+
+        with open(self.path) as f:
+            record, = [json.loads(line) for line in f]
+        self.assertEqual(record['user_id'], user.pk)
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['route'], 'unmatched')
+        self.assertGreater(record['latency_ms'], 0)
+
+    def test_shares_the_metrics_query_counter(self):
+        wrappers = []
+
+        def view(request):
+            wrappers.append(len(connections['default'].execute_wrappers))
+            return n_plus_one_view(request)
+
+        with override_settings(ACCESS_LOG={'FILE': self.path}):
+            middleware = metrics.MetricsMiddleware(accesslog.AccessLogMiddleware(view))
+        middleware(RequestFactory().get('/groups/'))
+        accesslog.stop_writer()
+
+        self.assertEqual(wrappers, [1])
+        with open(self.path) as f:
+            self.assertEqual(json.loads(f.readline())['queries'], 4)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = accesslog.DroppingQueueHandler(queue.Queue(maxsize=1))
+        before = accesslog.DROPPED.labels().values[0].get()
+        for i in range(3):
+            handler.handle(logging.makeLogRecord({'msg': {'i': i}}))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(accesslog.DROPPED.labels().values[0].get() - before, 2)
+
+    def test_batches_rotate_by_size(self):
+        # each batch of ten lines is over 250 bytes, so every batch starts a new file
+        handler = accesslog.BatchingRotatingFileHandler(self.path, batch_size=10, maxBytes=500, backupCount=2)
+        handler.setFormatter(accesslog.JsonFormatter())
+        for i in range(25):
+            handler.handle(logging.makeLogRecord({'msg': {'n': i, 'pad': 'x' * 20}}))
+        self.assertEqual(len(handler.buffer), 5)
+        handler.close()
+
+        lines = []
+        for path in (self.path, self.path + '.1', self.path + '.2'):
+            with open(path) as f:
+                lines.append([json.loads(line)['n'] for line in f])
+        self.assertEqual(lines, [list(range(20, 25)), list(range(10, 20)), list(range(10))])
+
+
+# purge() and the middleware must agree on the cache under any project's settings
+@override_settings(PAGE_CACHE={'CACHE': 'default'})
+class PageCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.renders = 0
+
+    def view(self, request):
+        self.renders += 1
+        response = HttpResponse(f'page {self.renders} ' + 'x' * 500)
+        return pagecache.add_surrogate_keys(response, *request.GET.get('keys', 'post-1').split(','))
+
+    def middleware(self, view=None, **config):
+        with override_settings(PAGE_CACHE={'CACHE': 'default', **config}):
+            return pagecache.PageCacheMiddleware(view or self.view)
+
+    def get(self, middleware, path='/posts/', **extra):
+        return middleware(RequestFactory().get(path, **extra))
+
+    def test_anonymous_pages_are_stored_gzipped(self):
+        middleware = self.middleware()
+        first = self.get(middleware)
+        plain = self.get(middleware)
+        gzipped = self.get(middleware, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(self.renders, 1)
+        self.assertEqual((first['X-Page-Cache'], plain['X-Page-Cache']), ('miss', 'hit'))
+        self.assertEqual(plain.content, first.content)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertLess(len(gzipped.content), len(first.content))
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+
+    def test_conditional_requests_get_not_modified(self):
+        def view(request):
+            response = self.view(request)
+            response['ETag'] = '"v1"'
+            response['Last-Modified'] = 'Mon, 05 Oct 2026 10:00:00 GMT'
+            return response
+
+        middleware = self.middleware(view)
+        first = self.get(middleware, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((first['X-Page-Cache'], first['ETag']), ('miss', 'W/"v1"'))
+        self.assertEqual(self.get(middleware)['ETag'], '"v1"')
+
+        for headers in ({'HTTP_IF_NONE_MATCH': '"v1"'}, {'HTTP_IF_MODIFIED_SINCE': first['Last-Modified']}):
+            response = self.get(middleware, HTTP_ACCEPT_ENCODING='gzip', **headers)
+            self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(self.get(middleware, HTTP_IF_NONE_MATCH='"v0"').status_code, 200)
+        self.assertEqual(self.renders, 1)
+
+    def test_streamed_pages_are_stored_once_fully_sent(self):
+        def streamed(request):
+            self.renders += 1
+            response = StreamingHttpResponse(f'line {i}\n' for i in range(1000))
+            return pagecache.add_surrogate_keys(response, 'post-1')
+
+        middleware = self.middleware(streamed)
+        abandoned = self.get(middleware)
+        next(iter(abandoned.streaming_content))
+        abandoned.close()
+        first = self.get(middleware)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        body = b''.join(first.streaming_content)
+
+        gzipped = self.get(middleware, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((gzipped['X-Page-Cache'], gzipped['Content-Encoding']), ('hit', 'gzip'))
+        self.assertEqual(gzip.decompress(gzipped.content), body)
+        self.assertEqual(self.get(middleware).content, body)
+        self.assertEqual(self.renders, 2)
+
+    @skipUnless(pagecache.brotli, 'brotli is not installed')
+    def test_brotli_when_accepted(self):
+        middleware = self.middleware()
+        self.get(middleware)
+        response = self.get(middleware, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(pagecache.brotli.decompress(response.content), self.get(middleware).content)
+
+    def test_personal_and_untagged_responses_reach_the_view(self):
+        def untagged(request):
+            self.renders += 1
+            return HttpResponse('ok')
+
+        def with_cookie(request):
+            response = self.view(request)
+            response.set_cookie('csrftoken', 'abc')
+            return response
+
+        middleware = self.middleware()
+        self.get(middleware, HTTP_COOKIE='sessionid=abc')
+        self.get(middleware, HTTP_COOKIE='sessionid=abc')
+        for view in (untagged, with_cookie):
+            self.get(self.middleware(view), '/other/')
+            self.get(self.middleware(view), '/other/')
+        self.assertEqual(self.renders, 6)
+
+    def test_purge_retires_only_tagged_pages(self):
+        middleware = self.middleware()
+        self.get(middleware, '/posts/', data={'keys': 'posts,post-1'})
+        self.get(middleware, '/post/2/', data={'keys': 'post-2'})
+        time.sleep(0.01)
+
+        pagecache.purge('post-1')
+        self.assertEqual(self.get(middleware, '/posts/', data={'keys': 'posts,post-1'})['X-Page-Cache'], 'miss')
+        self.assertEqual(self.get(middleware, '/post/2/', data={'keys': 'post-2'})['X-Page-Cache'], 'hit')
+
+    def test_one_request_regenerates_while_others_get_the_stale_copy(self):
+        middleware = self.middleware()
+        self.get(middleware)
+        time.sleep(0.01)
+        pagecache.purge('post-1')
+        # another worker is already re-rendering this page
+        cache.add(pagecache.page_key(RequestFactory().get('/posts/')) + ':lock', 1)
+
+        response = self.get(middleware)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertEqual(self.renders, 1)
+
+    def test_concurrent_misses_render_once(self):
+        def slow_view(request):
+            time.sleep(0.2)
+            return self.view(request)
+
+        middleware = self.middleware(slow_view, WAIT=2.0)
+        states = []
+        threads = [
+            threading.Thread(target=lambda: states.append(self.get(middleware)['X-Page-Cache']))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(sorted(states), ['hit'] * 4 + ['miss'])
@@ -0,0 +1,158 @@
+import json
+from collections import namedtuple
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.feedgenerator import Atom1Feed, SyndicationFeed
+from django.utils.http import http_date
+
+from common.metrics import record_cache
+from common.pagecache import add_surrogate_keys
+
+from .fragments import POSTS_KEY, post_key, post_versions, tag_key
+from .models import Post
+from .rerender import render_stale
+from .views import tag_and_posts
+
+
+# Every feed shows the newest FEED_ITEMS posts, all of them or one tag's.
+# The entries are a snapshot kept in the cache under each post's version
+# stamp (fragments.py), shared by all the feeds and formats the post is
+# in, so after a change only the posts that changed are read again. Whole
+# feed responses are then kept by the page cache until a post in them, or
+# the list itself, changes.
+FEED_ITEMS = 20
+ITEM_KEY = 'blog:feed-item:{}:{}'
+# a day, like the fragments: entries of old versions are never asked for again
+ITEM_TIMEOUT = 86400
+
+
+def feed_item(post):
+    return {
+        'pk': post.pk,
+        'title': post.title,
+        'link': post.get_absolute_url(),
+        'author': post.author.username,
+        'published': post.published_date,
+        'content_html': post.content_html,
+        'tags': [tag.name for tag in post.tags.all()],
+    }
+
+
+def feed_items(posts):
+    """Entries of the newest FEED_ITEMS of `posts`, newest first."""
+    ids = list(posts.order_by('-published_date', '-pk').values_list('pk', flat=True)[:FEED_ITEMS])
+    versions = post_versions(ids)
+    keys = {pk: ITEM_KEY.format(pk, versions[pk]) for pk in ids}
+    items = cache.get_many(keys.values())
+    for key in keys.values():
+        record_cache('blog-feed-item', key in items)
+    missing = [pk for pk, key in keys.items() if key not in items]
+    if missing:
+        posts = Post.objects.filter(pk__in=missing).defer('content').select_related('author').prefetch_related('tags')
+        built = {keys[post.pk]: feed_item(post) for post in render_stale(posts)}
+        cache.set_many(built, timeout=ITEM_TIMEOUT)
+        items.update(built)
+    return [items[keys[pk]] for pk in ids]
+
+
+# what a feed is of: the tag (None for all posts) and its entries
+FeedSource = namedtuple('FeedSource', 'tag items')
+
+
+class JSONFeed(SyndicationFeed):
+    """JSON Feed 1.1 (https://jsonfeed.org/version/1.1)."""
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write(self, outfile, encoding):
+        feed = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'items': [self.item(item) for item in self.items],
+        }
+        outfile.write(json.dumps(feed, ensure_ascii=False))
+
+    def item(self, item):
+        entry = {
+            'id': item['unique_id'] or item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_html': item['description'],
+            'tags': item['categories'],
+        }
+        if item['pubdate']:
+            entry['date_published'] = item['pubdate'].isoformat()
+        if item['author_name']:
+            entry['authors'] = [{'name': item['author_name']}]
+        return entry
+
+
+class PostsFeed(Feed):
+    """The newest posts as RSS, or a tag's newest posts when given its slug."""
+
+    def get_object(self, request, slug=None):
+        tag, posts = tag_and_posts(slug) if slug else (None, Post.objects.all())
+        return FeedSource(tag, feed_items(posts))
+
+    def __call__(self, request, *args, **kwargs):
+        # Feed.__call__, plus surrogate keys and conditional GET
+        source = self.get_object(request, *args, **kwargs)
+        feedgen = self.get_feed(source, request)
+        response = HttpResponse(content_type=feedgen.content_type)
+        last_modified = int(feedgen.latest_post_date().timestamp())
+        response['Last-Modified'] = http_date(last_modified)
+        feedgen.write(response, 'utf-8')
+        # Last-Modified only follows new posts; the ETag changes on edits too
+        set_response_etag(response)
+        add_surrogate_keys(
+            response, tag_key(source.tag.slug) if source.tag else POSTS_KEY,
+            *(post_key(item['pk']) for item in source.items),
+        )
+        return get_conditional_response(request, etag=response['ETag'], last_modified=last_modified, response=response)
+
+    def title(self, source):
+        return f'Django Blog: {source.tag.name}' if source.tag else 'Django Blog'
+
+    def link(self, source):
+        return reverse('tagged-posts', args=[source.tag.slug]) if source.tag else reverse('posts')
+
+    def description(self, source):
+        return f'Newest posts tagged "{source.tag.name}"' if source.tag else 'Newest posts'
+
+    def items(self, source):
+        return source.items
+
+    def item_title(self, item):
+        return item['title']
+
+    def item_description(self, item):
+        return item['content_html']
+
+    def item_link(self, item):
+        return item['link']
+
+    def item_pubdate(self, item):
+        return item['published']
+
+    def item_author_name(self, item):
+        return item['author']
+
+    def item_categories(self, item):
+        return item['tags']
+
+
+class AtomPostsFeed(PostsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, source):
+        return self.description(source)
+
+
+class JSONPostsFeed(PostsFeed):
+    feed_type = JSONFeed
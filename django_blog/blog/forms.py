@@ -6,14 +6,12 @@ class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ['title', 'content', 'tags']
-        tags = forms.CharField(
-        widget=forms.TextInput(attrs={'placeholder': 'Add tags separated by commas'}),
-        help_text="Separate tags with commas"
         widgets = {
             'tags': TagWidget(attrs={'placeholder': 'Add tags separated by commas'}),
         }
-        TagWidget()
-    )
+        help_texts = {
+            'tags': 'Separate tags with commas',
+        }
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,62 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from common.metrics import record_cache
+
+
+# Rendered post cards and comment blocks are cached by the {% cache %} tag
+# under the post's pk and version stamp. Stamps live in the default cache
+# and are replaced whenever something a fragment shows changes (see
+# signals.py), so old fragments are simply never asked for again and age
+# out of the fragment cache. A stamp that was evicted gets a new random
+# value, which can't collide with anything rendered before.
+VERSION_KEY = 'blog:post-version:{}'
+
+
+def new_stamp():
+    return uuid4().hex[:12]
+
+
+def post_versions(post_ids):
+    """Current stamp of each post id, in one cache round trip."""
+    keys = {VERSION_KEY.format(pk): pk for pk in post_ids}
+    found = cache.get_many(keys)
+    missing = {key: new_stamp() for key in keys if key not in found}
+    for key in keys:
+        record_cache('blog-fragment-version', key in found)
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return {pk: found.get(key) or missing[key] for key, pk in keys.items()}
+
+
+def attach_versions(posts):
+    """Set `cache_version` on each post, for use as a {% cache %} vary-on value."""
+    posts = list(posts)
+    versions = post_versions([post.pk for post in posts])
+    for post in posts:
+        post.cache_version = versions[post.pk]
+    return posts
+
+
+def bump_versions(post_ids):
+    """Invalidate every cached fragment of these posts."""
+    stamps = {VERSION_KEY.format(pk): new_stamp() for pk in post_ids}
+    if stamps:
+        cache.set_many(stamps, timeout=None)
+
+
+# Surrogate keys the page cache (common/pagecache.py) tags whole pages
+# with: a page carries the key of every post it shows, the all-posts lists
+# also POSTS_KEY (any new or deleted post shifts them), a tag's page the
+# tag's key and pages listing tag counts TAGS_KEY.
+POSTS_KEY = 'posts'
+TAGS_KEY = 'tags'
+
+
+def post_key(pk):
+    return f'post-{pk}'
+
+
+def tag_key(slug):
+    return f'tag-{slug}'
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.related import RELATED_LIMIT, build_related_posts
+
+
+class Command(BaseCommand):
+    help = "Recompute every post's related posts from the tags they share"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=RELATED_LIMIT, help='Related posts kept per post')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = build_related_posts(options['limit'], options['chunk_size'], options['database'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Updated the related posts of {count} posts in {elapsed:.1f}s'))
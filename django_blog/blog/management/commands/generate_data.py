@@ -0,0 +1,103 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from blog.models import Comment, Post, Profile
+from blog.related import build_related_posts
+from blog.rerender import render_stale_posts
+from blog.search import rebuild_index
+from blog.tagstats import rebuild_tag_stats
+from common.synthetic import TAGS, GenerateDataCommand, bulk_insert, explicit_timestamps, last_id, new_ids
+
+
+class Command(GenerateDataCommand):
+    help = 'Fill the database with seeded synthetic users, posts, tags and comments'
+
+    counts = {'users': 2_000, 'posts': 50_000, 'comments': 200_000}
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--days', type=int, default=730, help='How far back posts go')
+
+    def generate(self, synthetic, counts, options):
+        using, chunk_size, seed = options['database'], options['chunk_size'], options['seed']
+
+        # every generated user has the password "password"; hashing it once keeps this fast
+        password = make_password('password', salt=f'synthetic{seed}')
+        after = last_id(User, using)
+        users = (
+            User(username=f'user{seed}_{i}', email=f'user{seed}_{i}@example.com', password=password)
+            for i in range(counts['users'])
+        )
+        yield 'users', bulk_insert(User, users, chunk_size, using)
+        user_ids = new_ids(User, after, using)
+        if not user_ids:
+            return
+        profiles = (Profile(user_id=user_id, bio=synthetic.words(5, 20)) for user_id in user_ids)
+        yield 'profiles', bulk_insert(Profile, profiles, chunk_size, using)
+
+        existing = set(Tag.objects.using(using).filter(name__in=TAGS).values_list('name', flat=True))
+        tags = [Tag(name=name, slug=slugify(name)) for name in TAGS if name not in existing]
+        yield 'tags', bulk_insert(Tag, tags, chunk_size, using)
+        tag_ids = list(Tag.objects.using(using).filter(name__in=TAGS).order_by('name').values_list('pk', flat=True))
+
+        # a few prolific authors write most posts, a few tags are on most of them
+        author_weights = synthetic.popularity(len(user_ids))
+        tag_weights = synthetic.popularity(len(tag_ids))
+        post_times = synthetic.timestamps(counts['posts'], options['days'])
+
+        def posts():
+            for published_date in post_times:
+                yield Post(
+                    title=synthetic.title(), content=synthetic.body(),
+                    author_id=synthetic.pick(user_ids, author_weights)[0], published_date=published_date,
+                )
+
+        after = last_id(Post, using)
+        with explicit_timestamps(Post, Comment):
+            yield 'posts', bulk_insert(Post, posts(), chunk_size, using)
+            post_ids = new_ids(Post, after, using)
+            if not post_ids:
+                return
+
+            content_type = ContentType.objects.db_manager(using).get_for_model(Post)
+
+            def tagged_items():
+                for post_id in post_ids:
+                    for tag_id in set(synthetic.pick(tag_ids, tag_weights, synthetic.random.randint(0, 4))):
+                        yield TaggedItem(tag_id=tag_id, content_type=content_type, object_id=post_id)
+
+            # bulk inserts skip Post.save, so the stored HTML is rendered afterwards on all CPUs
+            yield 'rendered posts', render_stale_posts(chunk_size, using=using)
+
+            yield 'tagged items', bulk_insert(TaggedItem, tagged_items(), chunk_size, using)
+            # bulk inserts skip the signals that keep the search index and tag counts current
+            yield 'search index', rebuild_index(using)
+            yield 'tag stats', rebuild_tag_stats(using)
+            yield 'related posts', build_related_posts(chunk_size=chunk_size, using=using)
+
+            # most comments land on a few popular posts
+            post_weights = synthetic.popularity(len(post_ids))
+            post_starts = [published_date.timestamp() for published_date in post_times]
+            now = synthetic.now.timestamp()
+
+            def comments():
+                for _ in range(counts['comments']):
+                    index = synthetic.pick(range(len(post_ids)), post_weights)[0]
+                    created_at = synthetic.now.fromtimestamp(
+                        synthetic.random.uniform(post_starts[index], now), synthetic.now.tzinfo,
+                    )
+                    yield Comment(
+                        post_id=post_ids[index], author_id=synthetic.pick(user_ids, author_weights)[0],
+                        content=synthetic.body(median_words=15), created_at=created_at, updated_at=created_at,
+                    )
+
+            yield 'comments', bulk_insert(Comment, comments(), chunk_size, using)
+            # all top level: each path is just the comment's own id (see Comment.path)
+            yield 'comment paths', Comment.objects.using(using).filter(path='').update(
+                path=LPad(Cast('id', output_field=CharField()), Comment.PATH_STEP, Value('0')),
+            )
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.rendering import RENDERER_VERSION
+from blog.rerender import render_stale_posts
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored HTML of posts rendered by an older renderer version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=None, help='Rendering processes (defaults to CPU count)')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = render_stale_posts(options['chunk_size'], options['workers'], options['database'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {count} posts with renderer v{RENDERER_VERSION} in {elapsed:.1f}s '
+            f'({count / max(elapsed, 1e-9):.0f}/s)'
+        ))
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+# The FTS5 search index used by blog/search.py. SQLite only; on other
+# databases search falls back to substring matching and this is a no-op.
+# column order matters: the rank's bm25 weights are (title, content, tags)
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE blog_post_fts USING fts5(
+        title, content, tags,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    "INSERT INTO blog_post_fts (blog_post_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')",
+    """
+    INSERT INTO blog_post_fts (rowid, title, content, tags)
+    SELECT post.id, post.title, post.content, coalesce((
+        SELECT group_concat(tag.name, ' ')
+        FROM taggit_taggeditem item JOIN taggit_tag tag ON tag.id = item.tag_id
+        WHERE item.object_id = post.id AND item.content_type_id = type.id
+    ), '')
+    FROM blog_post post
+    LEFT JOIN django_content_type type ON type.app_label = 'blog' AND type.model = 'post'
+    """,
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE blog_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_rename_post_comment_post_tags_delete_tag'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
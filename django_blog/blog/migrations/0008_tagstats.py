@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# counts for the posts tagged so far; from here on blog/tagstats.py keeps them current
+FILL_SQL = """
+    INSERT INTO blog_tagstats (tag_id, post_count, last_used)
+    SELECT item.tag_id, count(*), max(post.published_date)
+    FROM taggit_taggeditem item
+    JOIN django_content_type type ON type.id = item.content_type_id AND type.app_label = 'blog' AND type.model = 'post'
+    JOIN blog_post post ON post.id = item.object_id
+    GROUP BY item.tag_id
+"""
+
+
+def fill_stats(apps, schema_editor):
+    schema_editor.execute(FILL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_post_search_index'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='taggit.tag')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-post_count'], name='blog_tagstats_popular_idx'), models.Index(fields=['-last_used'], name='blog_tagstats_recent_idx')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+
+from .rendering import RENDERER_VERSION, render_post
 
 
 class Author(models.Model):
@@ -17,6 +20,25 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     published_date = models.DateTimeField(auto_now_add=True)
     tags = TaggableManager()
+    # content rendered by blog/rendering.py when the post is saved, so pages
+    # output it as is instead of running filters over the content each time
+    content_html = models.TextField(blank=True, editable=False)
+    excerpt_html = models.TextField(blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+
+    RENDERED_FIELDS = ('content_html', 'excerpt_html', 'render_version')
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            render_post(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+
+    @property
+    def is_rendered(self):
+        return self.render_version == RENDERER_VERSION
 
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={'pk': self.pk})
@@ -38,12 +60,71 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Replies form a tree stored as a materialized path: the zero-padded ids
+    # of every ancestor and then the comment's own. Paths sort depth first
+    # in posting order, and a comment's whole subtree is the (post, path)
+    # index range just after its own path; see descendants().
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    PATH_STEP = 10
+    # replies to a comment this deep become its siblings instead
+    MAX_DEPTH = 8
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['post', 'path'], name='blog_comment_thread_idx')]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.parent_id:
+            if self.parent.depth >= self.MAX_DEPTH:
+                self.parent = self.parent.parent
+            self.post_id = self.parent.post_id
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if not self.path:
+            # the path ends with our own id, so it is only known after the insert
+            self.path = (self.parent.path if self.parent_id else '') + str(self.pk).zfill(self.PATH_STEP)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    def descendants(self):
+        """Every reply below this one, in thread order, from one index range scan."""
+        # '~' sorts after every digit, so this is everything under our path
+        return Comment.objects.filter(
+            post_id=self.post_id, path__gt=self.path, path__lt=self.path + '~',
+        ).order_by('path')
 
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={'pk': self.post.pk})
 
     def __str__(self):
-        return f"Comment by {self.author.username} on {self.post.title}"
\ No newline at end of file
+        return f"Comment by {self.author.username} on {self.post.title}"
+
+class TagStats(models.Model):
+    """How many posts use a tag and when it was last added to one; see blog/tagstats.py."""
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    post_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-post_count'], name='blog_tagstats_popular_idx'),
+            models.Index(fields=['-last_used'], name='blog_tagstats_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag.name}: {self.post_count} posts"
+
+class RelatedPost(models.Model):
+    """One of a post's most similar posts by shared tags, best first; see blog/related.py."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='linked_from')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['post', 'rank'], name='blog_relatedpost_rank_uniq')]
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.related_id} ({self.score:.2f})"
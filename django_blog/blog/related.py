@@ -0,0 +1,148 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from taggit.models import TaggedItem
+
+from common.pagecache import purge
+
+from .fragments import post_key
+from .models import Post, RelatedPost
+
+
+# A post's related posts are the RELATED_LIMIT others with the most similar
+# tags, by Jaccard similarity (shared tags / tags of either), newest first
+# among equals. They are stored in RelatedPost, so the detail page reads
+# them in one query instead of self-joining the tagged items every time.
+# build_related_posts() computes every list offline; a retagged post gets
+# its own list recomputed as soon as the change commits (update_related),
+# and appears in other posts' lists from the next build.
+RELATED_LIMIT = 5
+
+RELATED_SQL = """
+    WITH mine AS (
+        SELECT tag_id FROM taggit_taggeditem WHERE content_type_id = %(type)s AND object_id = %(post)s
+    )
+    SELECT other.object_id, count(*) * 1.0 / (
+        (SELECT count(*) FROM mine)
+        + (SELECT count(*) FROM taggit_taggeditem t WHERE t.content_type_id = %(type)s AND t.object_id = other.object_id)
+        - count(*)
+    ) AS score
+    FROM taggit_taggeditem other
+    JOIN mine ON mine.tag_id = other.tag_id
+    JOIN blog_post post ON post.id = other.object_id
+    WHERE other.content_type_id = %(type)s AND other.object_id <> %(post)s
+    GROUP BY other.object_id, post.published_date, post.id
+    ORDER BY score DESC, post.published_date DESC, post.id DESC
+    LIMIT %(limit)s
+"""
+
+
+def _tag_sets(using):
+    """Each tagged post's set of tag ids, newest post first."""
+    content_type = ContentType.objects.db_manager(using).get_for_model(Post)
+    tags = defaultdict(set)
+    items = TaggedItem.objects.using(using).filter(content_type=content_type)
+    for post_id, tag_id in items.values_list('object_id', 'tag_id').iterator(chunk_size=10000):
+        tags[post_id].add(tag_id)
+    newest = Post.objects.using(using).order_by('-published_date', '-pk').values_list('pk', flat=True)
+    return {pk: frozenset(tags[pk]) for pk in newest.iterator(chunk_size=10000) if pk in tags}
+
+
+def compute_related(tag_sets, limit=RELATED_LIMIT):
+    """
+    Yield (post id, [(related id, score), ...]) for every post in
+    `tag_sets`, a dict of post id -> tag ids in newest-first order.
+
+    Posts are rows of a sparse post-by-tag matrix. Rows are few compared to
+    posts (most posts share their exact tags with many others), so scores
+    are computed once per distinct row: its overlap with every other row is
+    counted from the postings of its tags, and posts are then taken from
+    the best rows down, newest first within a score, until `limit` are found.
+    """
+    rows = defaultdict(list)  # tag set -> its posts as (age, id), newest first
+    for age, (pk, tags) in enumerate(tag_sets.items()):
+        rows[tags].append((age, pk))
+    postings = defaultdict(list)  # tag -> the rows that have it
+    for tags in rows:
+        for tag in tags:
+            postings[tag].append(tags)
+
+    for tags, posts in rows.items():
+        overlap = Counter(other for tag in tags for other in postings[tag])
+        by_score = defaultdict(list)
+        for other, shared in overlap.items():
+            by_score[shared / (len(tags) + len(other) - shared)].append(rows[other])
+        # one more than needed, since each post skips itself
+        best = []
+        for score in sorted(by_score, reverse=True):
+            merged = heapq.merge(*by_score[score])
+            best += [(pk, score) for _, pk in islice(merged, limit + 1 - len(best))]
+            if len(best) > limit:
+                break
+        for _, pk in posts:
+            yield pk, [(other, score) for other, score in best if other != pk][:limit]
+
+
+def build_related_posts(limit=RELATED_LIMIT, chunk_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Recompute every post's related posts, writing only the lists that
+    changed, a chunk of posts per transaction. Returns how many changed.
+    """
+    tag_sets = _tag_sets(using)
+    related = compute_related(tag_sets, limit)
+    changed = 0
+    while chunk := dict(islice(related, chunk_size)):
+        changed += _save(chunk, using)
+    # posts that have lost all their tags have nothing related any more
+    listed = RelatedPost.objects.using(using).values_list('post_id', flat=True).distinct()
+    stale = set(listed) - tag_sets.keys()
+    if stale:
+        RelatedPost.objects.using(using).filter(post_id__in=stale).delete()
+        purge(*map(post_key, stale))
+    return changed + len(stale)
+
+
+def _save(chunk, using):
+    current = defaultdict(list)
+    links = RelatedPost.objects.using(using).filter(post_id__in=chunk).order_by('post_id', 'rank')
+    for post_id, related_id, score in links.values_list('post_id', 'related_id', 'score'):
+        current[post_id].append((related_id, score))
+    changed = [pk for pk, related in chunk.items() if current.get(pk, []) != related]
+    if changed:
+        with transaction.atomic(using=using):
+            RelatedPost.objects.using(using).filter(post_id__in=changed).delete()
+            RelatedPost.objects.using(using).bulk_create(
+                RelatedPost(post_id=pk, related_id=other, rank=rank, score=score)
+                for pk in changed
+                for rank, (other, score) in enumerate(chunk[pk])
+            )
+        purge(*map(post_key, changed))
+    return len(changed)
+
+
+def update_related(post_id, limit=RELATED_LIMIT, using=DEFAULT_DB_ALIAS):
+    """Recompute the related posts of one post, straight from the tagged items."""
+    content_type = ContentType.objects.db_manager(using).get_for_model(Post)
+    with connections[using].cursor() as cursor:
+        cursor.execute(RELATED_SQL, {'type': content_type.pk, 'post': post_id, 'limit': limit})
+        related = cursor.fetchall()
+    with transaction.atomic(using=using):
+        RelatedPost.objects.using(using).filter(post_id=post_id).delete()
+        RelatedPost.objects.using(using).bulk_create(
+            RelatedPost(post_id=post_id, related_id=other, rank=rank, score=score)
+            for rank, (other, score) in enumerate(related)
+        )
+    purge(post_key(post_id))
+    return related
+
+
+def related_posts(post, limit=RELATED_LIMIT):
+    """The stored related posts of `post`, best first, in one query."""
+    return list(
+        Post.objects.filter(linked_from__post=post)
+        .only('title', 'published_date')
+        .order_by('linked_from__rank')[:limit]
+    )
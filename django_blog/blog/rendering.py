@@ -0,0 +1,33 @@
+from django.utils.html import escape, linebreaks, urlize
+from django.utils.text import Truncator
+
+
+# Bump whenever render_html or render_excerpt change output; posts rendered
+# by an older version are re-rendered by `manage.py render_posts`, or when
+# a page shows them, whichever comes first.
+RENDERER_VERSION = 1
+
+EXCERPT_WORDS = 50
+
+
+def render_html(text):
+    """
+    Post content as HTML: paragraphs, line breaks and links. Everything the
+    author typed is escaped first, so the result is safe to output as is.
+    """
+    return linebreaks(urlize(text, nofollow=True, autoescape=True))
+
+
+def render_excerpt(text):
+    return escape(Truncator(text).words(EXCERPT_WORDS))
+
+
+def render(text):
+    return render_html(text), render_excerpt(text)
+
+
+def render_post(post):
+    """Fill in the stored HTML of `post` (not saved)."""
+    post.content_html, post.excerpt_html = render(post.content)
+    post.render_version = RENDERER_VERSION
+    return post
@@ -0,0 +1,90 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import DEFAULT_DB_ALIAS
+
+from common.pagecache import purge
+
+from .fragments import post_key
+from .models import Post
+from .rendering import RENDERER_VERSION, render
+
+
+def _init_worker():
+    # spawned workers start without Django; forked ones already have it
+    django.setup()
+
+
+def _render_rows(rows):
+    return [(pk, *render(content)) for pk, content in rows]
+
+
+def _stale_chunks(posts, chunk_size):
+    # keyset pagination: each chunk starts after the last id of the one before
+    last = 0
+    while True:
+        rows = list(posts.filter(pk__gt=last).order_by('pk').values_list('pk', 'content')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def render_stale_posts(chunk_size=500, workers=None, using=DEFAULT_DB_ALIAS):
+    """
+    Re-render every post whose stored HTML is from an older renderer, on a
+    process pool since rendering is all CPU. Returns how many were written.
+    """
+    workers = workers or os.cpu_count() or 1
+    stale = Post.objects.using(using).filter(render_version__lt=RENDERER_VERSION)
+    chunks = _stale_chunks(stale, chunk_size)
+    if workers == 1:
+        return sum(_save(stale, _render_rows(rows)) for rows in chunks)
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # a couple of chunks per worker in flight keeps them busy while this
+        # process reads and writes, without loading every stale post at once
+        pending = deque()
+        for rows in chunks:
+            pending.append(pool.submit(_render_rows, rows))
+            if len(pending) >= workers * 2:
+                written += _save(stale, pending.popleft().result())
+        while pending:
+            written += _save(stale, pending.popleft().result())
+    return written
+
+
+def _save(stale, rendered):
+    posts = [
+        Post(pk=pk, content_html=html, excerpt_html=excerpt, render_version=RENDERER_VERSION)
+        for pk, html, excerpt in rendered
+    ]
+    # filtered on the old version, so a post edited since it was read keeps
+    # what its own save rendered
+    count = stale.bulk_update(posts, Post.RENDERED_FIELDS)
+    purge(*(post_key(post.pk) for post in posts))
+    return count
+
+
+def render_stale(posts):
+    """
+    Render and store the HTML of any of `posts` still on an older renderer,
+    so a page never has to wait for render_posts to reach them.
+    """
+    posts = list(posts)
+    stale = [post for post in posts if not post.is_rendered]
+    if not stale:
+        return posts
+    # list pages defer content, so read it for all of them in one query
+    # rather than one per post
+    deferred = [post.pk for post in stale if 'content' in post.get_deferred_fields()]
+    contents = dict(Post.objects.filter(pk__in=deferred).values_list('pk', 'content')) if deferred else {}
+    for post in stale:
+        content = contents[post.pk] if post.pk in contents else post.content
+        post.content_html, post.excerpt_html = render(content)
+        post.render_version = RENDERER_VERSION
+    # filtered on the old version, like _save
+    Post.objects.filter(render_version__lt=RENDERER_VERSION).bulk_update(stale, Post.RENDERED_FIELDS)
+    return posts
@@ -0,0 +1,150 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+from .models import Post
+
+
+# Posts are indexed in an SQLite FTS5 table keyed by post id (the rowid).
+# Its rank is configured as bm25 weighting title 10, content 1 and tags 5,
+# so `ORDER BY rank` returns the best matches first; see migration 0007.
+FTS_TABLE = 'blog_post_fts'
+
+# Only the newest MAX_RESULTS matches are ranked and counted. bm25 has to
+# score every row it orders, which for a word in most posts of a large blog
+# takes over a second, even with a LIMIT; the newest matches come straight
+# off the index in rowid order, so a bounded pool keeps common words about
+# as cheap as rare ones. The price: for such words, older posts never show
+# up however well they match, and the count stops at MAX_RESULTS.
+MAX_RESULTS = 1000
+
+TERM_RE = re.compile(r'(\w+)(\*?)')
+
+REBUILD_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, content, tags)
+    SELECT post.id, post.title, post.content, coalesce((
+        SELECT group_concat(tag.name, ' ')
+        FROM taggit_taggeditem item JOIN taggit_tag tag ON tag.id = item.tag_id
+        WHERE item.object_id = post.id AND item.content_type_id = type.id
+    ), '')
+    FROM blog_post post
+    LEFT JOIN django_content_type type ON type.app_label = 'blog' AND type.model = 'post'
+"""
+
+
+def has_index(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match(query):
+    """
+    Turn what the user typed into an FTS5 MATCH expression: every word must
+    appear, and a trailing * makes a word a prefix (`djan*`). Everything is
+    quoted, so FTS5 operators in the input are searched for as plain words.
+    """
+    terms = [
+        f'"{word}"*' if star else f'"{word}"'
+        for word, star in TERM_RE.findall(query.lower())
+    ]
+    return ' '.join(terms) or None
+
+
+def index_post(post, using=DEFAULT_DB_ALIAS):
+    if not has_index(using):
+        return
+    tags = ' '.join(post.tags.names())
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (%s, %s, %s, %s)',
+            [post.pk, post.title, post.content, tags],
+        )
+
+
+def remove_post(post_id, using=DEFAULT_DB_ALIAS):
+    if not has_index(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    """Reindex every post from scratch, e.g. after bulk loads that skip signals."""
+    if not has_index(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(REBUILD_SQL)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+class SearchResults:
+    """
+    Ranked matches for a query, shaped for Paginator: count() and slicing
+    each run one query against the index, and a slice fetches just that
+    page of posts. `capped` is true when there were more matches than
+    MAX_RESULTS, so count() is a lower bound.
+    """
+
+    def __init__(self, query, posts=None, using=DEFAULT_DB_ALIAS):
+        self.match = build_match(query)
+        self.posts = posts if posts is not None else Post.objects.all()
+        self.using = using
+        self._count = None
+
+    def _execute(self, sql, params):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if self._count is None:
+            if self.match is None:
+                self._count = 0
+            else:
+                self._count = self._execute(
+                    f'SELECT count(*) FROM (SELECT 1 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)',
+                    [self.match, MAX_RESULTS],
+                )[0][0]
+        return self._count
+
+    @property
+    def capped(self):
+        return self.count() >= MAX_RESULTS
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, min(index.stop or MAX_RESULTS, MAX_RESULTS)
+        if self.match is None or stop <= start:
+            return []
+        # equal ranks: newest first
+        rows = self._execute(
+            f'SELECT rowid FROM ('
+            f'  SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s'
+            f') ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+            [self.match, MAX_RESULTS, stop - start, start],
+        )
+        ids = [row[0] for row in rows]
+        found = self.posts.filter(pk__in=ids).in_bulk()
+        return [found[pk] for pk in ids if pk in found]
+
+
+def search_posts(query, posts=None, using=DEFAULT_DB_ALIAS):
+    """Posts matching `query`, best first. Without FTS5 it falls back to substring matching."""
+    if has_index(using):
+        return SearchResults(query, posts, using)
+    posts = posts if posts is not None else Post.objects.all()
+    if not query.strip():
+        return posts.none()
+    return posts.filter(
+        Q(title__icontains=query) |
+        Q(content__icontains=query) |
+        Q(tags__name__icontains=query)
+    ).distinct().order_by('-published_date', '-pk')
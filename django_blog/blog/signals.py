@@ -0,0 +1,136 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from common.pagecache import purge
+
+from .fragments import POSTS_KEY, TAGS_KEY, bump_versions, post_key, tag_key
+from .models import Comment, Post
+from .related import update_related
+from .search import index_post, remove_post
+from .sitemaps import post_shard_key
+from .tagstats import popular_tags_changed, tags_added, tags_removed
+
+
+# Keep the search index in step with posts and their tags. Forms save the
+# post before its tags, so the tag signals reindex it a second time.
+@receiver(post_save, sender=Post)
+def reindex_saved_post(sender, instance, **kwargs):
+    index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    remove_post(instance.pk)
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def reindex_retagged_post(sender, instance, action, **kwargs):
+    if isinstance(instance, Post) and action in ('post_add', 'post_remove', 'post_clear'):
+        index_post(instance)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, **kwargs):
+    if not created:
+        for post in Post.objects.filter(tags=instance):
+            index_post(post)
+
+
+# Cached post cards and comment blocks (fragments.py) and whole cached
+# pages (common/pagecache.py) show the post, its author's name, its tags
+# and its comments; a change to any of them gives the post a new fragment
+# version and purges the pages showing it. Pages are purged once the change
+# is committed, or a request still reading the old rows could cache them
+# again.
+def posts_changed(post_ids, *page_keys):
+    post_ids = list(post_ids)
+    bump_versions(post_ids)
+    keys = [*page_keys, *map(post_key, post_ids)]
+    transaction.on_commit(lambda: purge(*keys))
+
+
+@receiver(post_save, sender=Post)
+def refresh_saved_post(sender, instance, created, **kwargs):
+    posts_changed([instance.pk], *([POSTS_KEY, post_shard_key(instance.pk)] if created else []))
+
+
+@receiver(pre_delete, sender=Post)
+def refresh_deleted_post(sender, instance, **kwargs):
+    # before the delete, while its tags can still be read
+    tags = instance.tags.values_list('slug', flat=True)
+    posts_changed([instance.pk], POSTS_KEY, TAGS_KEY, post_shard_key(instance.pk), *map(tag_key, tags))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def refresh_commented_post(sender, instance, **kwargs):
+    posts_changed([instance.post_id])
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def refresh_retagged_post(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Post):
+        return
+    if action in ('post_add', 'post_remove'):
+        tags = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+    elif action == 'pre_clear':
+        tags = instance.tags.values_list('slug', flat=True)
+    else:
+        return
+    # tag counts changed too
+    posts_changed([instance.pk], TAGS_KEY, *map(tag_key, tags))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def refresh_posts_with_tag(sender, instance, created=False, **kwargs):
+    # pre_delete, while the tagged items still say which posts had the tag
+    if not created:
+        posts = Post.objects.filter(tags=instance).values_list('pk', flat=True)
+        posts_changed(posts, TAGS_KEY, tag_key(instance.slug))
+
+
+@receiver(post_save, sender=User)
+def refresh_posts_by_author(sender, instance, created, update_fields=None, **kwargs):
+    # logging in saves last_login, which no page shows
+    if not created and update_fields != frozenset({'last_login'}):
+        posts_changed(Post.objects.filter(author=instance).values_list('pk', flat=True))
+
+
+# Tag statistics (tagstats.py) follow tags being added to and removed from
+# posts. Deleting a post drops its tagged items without m2m_changed, so
+# that is counted from pre_delete.
+@receiver(m2m_changed, sender=TaggedItem)
+def count_post_tags(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Post):
+        return
+    if action == 'post_add':
+        tags_added(pk_set)
+    elif action == 'post_remove':
+        tags_removed(pk_set)
+    elif action == 'pre_clear':
+        tags_removed(list(instance.tags.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Post)
+def uncount_deleted_post_tags(sender, instance, **kwargs):
+    tags_removed(list(instance.tags.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def refresh_popular_tags(sender, instance, created=False, **kwargs):
+    # the cached popular tags carry names, and a deleted tag's stats go with it
+    if not created:
+        popular_tags_changed()
+
+
+# Related posts (related.py) are rebuilt offline; a retagged post gets its
+# own list recomputed once the new tags are committed.
+@receiver(m2m_changed, sender=TaggedItem)
+def relate_retagged_post(sender, instance, action, **kwargs):
+    if isinstance(instance, Post) and action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: update_related(instance.pk))
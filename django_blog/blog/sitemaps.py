@@ -0,0 +1,123 @@
+from xml.sax.saxutils import escape
+
+from django.db.models import F, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from common.pagecache import add_surrogate_keys
+
+from .fragments import POSTS_KEY, TAGS_KEY
+from .models import Post, TagStats
+
+
+# /sitemap.xml is an index of shards, each a sitemap of at most SHARD_SIZE
+# URLs (the protocol's limit is 50,000): posts, then tag pages. Shard n of
+# a section holds the rows with n * SHARD_SIZE <= pk < (n + 1) * SHARD_SIZE,
+# so a post always stays in the same shard and adding or deleting one
+# purges only that shard from the page cache (signals.py). Shards are read
+# CHUNK_SIZE rows at a time and streamed, never held in memory whole; the
+# page cache keeps the finished copy.
+SHARD_SIZE = 50000
+CHUNK_SIZE = 2000
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def shard_key(section, number):
+    return f'sitemap-{section}-{number}'
+
+
+def post_shard_key(pk):
+    return shard_key('posts', pk // SHARD_SIZE)
+
+
+def _post_rows(start, end):
+    return Post.objects.filter(pk__gte=start, pk__lt=end).values_list('pk', 'published_date')
+
+
+def _tag_rows(start, end):
+    return (
+        TagStats.objects.filter(tag_id__gte=start, tag_id__lt=end, post_count__gt=0)
+        .values_list('tag_id', 'tag__slug', 'last_used')
+    )
+
+
+# section: (rows of one shard, URL name of their pages, columns of its argument and lastmod)
+SECTIONS = {
+    'posts': (_post_rows, 'post-detail', 0, 1),
+    'tags': (_tag_rows, 'tagged-posts', 1, 2),
+}
+
+
+def _url_parts(request, name):
+    """
+    The absolute URL of `name` split around its one argument. Reversing once
+    per shard instead of once per row saves most of the time; the sample
+    argument's digits pass both the int and the slug converters.
+    """
+    sample = '9876543210'
+    return request.build_absolute_uri(reverse(name, args=[sample])).split(sample)
+
+
+def _keyset_chunks(rows, chunk_size):
+    # keyset pagination on the first column, the primary key
+    last = None
+    while True:
+        chunk = rows if last is None else rows.filter(pk__gt=last)
+        chunk = list(chunk.order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1][0]
+
+
+def _lastmod(when):
+    return f'<lastmod>{when.isoformat(timespec="seconds")}</lastmod>' if when else ''
+
+
+def _shard_lastmods():
+    """(section, shard number, newest lastmod) of every non-empty shard."""
+    shards = [
+        Post.objects.annotate(shard=F('pk') / SHARD_SIZE).values('shard')
+        .annotate(lastmod=Max('published_date')).order_by('shard'),
+        TagStats.objects.filter(post_count__gt=0).annotate(shard=F('tag_id') / SHARD_SIZE).values('shard')
+        .annotate(lastmod=Max('last_used')).order_by('shard'),
+    ]
+    for section, rows in zip(SECTIONS, shards):
+        for row in rows:
+            yield section, row['shard'], row['lastmod']
+
+
+def sitemap_index(request):
+    lines = [XML_HEADER, f'<sitemapindex xmlns="{XMLNS}">\n']
+    for section, number, lastmod in _shard_lastmods():
+        url = request.build_absolute_uri(reverse('sitemap-shard', args=[section, number]))
+        lines.append(f'<sitemap><loc>{escape(url)}</loc>{_lastmod(lastmod)}</sitemap>\n')
+    lines.append('</sitemapindex>\n')
+    response = HttpResponse(''.join(lines), content_type='application/xml')
+    return add_surrogate_keys(response, POSTS_KEY, TAGS_KEY)
+
+
+def sitemap_shard(request, section, number):
+    if section not in SECTIONS:
+        raise Http404('No such sitemap section')
+    shard_rows, url_name, argument, lastmod = SECTIONS[section]
+    rows = shard_rows(number * SHARD_SIZE, (number + 1) * SHARD_SIZE)
+    if not rows.exists():
+        raise Http404('Empty sitemap shard')
+    before, after = _url_parts(request, url_name)
+
+    def urlset():
+        yield f'{XML_HEADER}<urlset xmlns="{XMLNS}">\n'
+        for chunk in _keyset_chunks(rows, CHUNK_SIZE):
+            yield ''.join(
+                f'<url><loc>{escape(f"{before}{row[argument]}{after}")}</loc>{_lastmod(row[lastmod])}</url>\n'
+                for row in chunk
+            )
+        yield '</urlset>\n'
+
+    response = StreamingHttpResponse(urlset(), content_type='application/xml')
+    # a post shard is purged when a post in it comes or goes, tag shards
+    # whenever tags or their counts change
+    return add_surrogate_keys(response, shard_key(section, number) if section == 'posts' else TAGS_KEY)
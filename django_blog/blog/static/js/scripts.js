@@ -1,4 +1,17 @@
 // Basic example script to demonstrate dynamic behavior
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Blog page loaded');
-});
\ No newline at end of file
+});
+
+// Comment replies are fetched only when asked for; without JavaScript the
+// link opens them as a page instead.
+document.addEventListener('click', function(event) {
+    var link = event.target.closest('a.load-replies');
+    if (!link) {
+        return;
+    }
+    event.preventDefault();
+    fetch(link.href)
+        .then(function(response) { return response.text(); })
+        .then(function(html) { link.parentNode.innerHTML = html; });
+});
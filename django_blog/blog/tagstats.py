@@ -0,0 +1,93 @@
+import math
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F
+from django.utils import timezone
+
+from common.metrics import record_cache
+
+from .models import TagStats
+
+
+# Tag counts are kept in TagStats, one row per tag, and adjusted as tags
+# are added to and removed from posts (signals.py), so showing them never
+# needs a GROUP BY over the tagged items. The most used tags, which every
+# list page shows, are also cached until the counts next change.
+POPULAR_KEY = 'blog:popular-tags'
+POPULAR_LIMIT = 20
+
+# font-size steps of the tag cloud
+CLOUD_STEPS = 5
+
+REBUILD_SQL = """
+    INSERT INTO blog_tagstats (tag_id, post_count, last_used)
+    SELECT item.tag_id, count(*), max(post.published_date)
+    FROM taggit_taggeditem item
+    JOIN django_content_type type ON type.id = item.content_type_id AND type.app_label = 'blog' AND type.model = 'post'
+    JOIN blog_post post ON post.id = item.object_id
+    GROUP BY item.tag_id
+"""
+
+
+def tags_added(tag_ids, when=None):
+    """Count one more post for each tag in `tag_ids`."""
+    if not tag_ids:
+        return
+    TagStats.objects.bulk_create([TagStats(tag_id=pk) for pk in tag_ids], ignore_conflicts=True)
+    TagStats.objects.filter(tag_id__in=tag_ids).update(
+        post_count=F('post_count') + 1, last_used=when or timezone.now(),
+    )
+    popular_tags_changed()
+
+
+def tags_removed(tag_ids):
+    """Count one post fewer for each tag in `tag_ids`."""
+    if not tag_ids:
+        return
+    TagStats.objects.filter(tag_id__in=tag_ids, post_count__gt=0).update(post_count=F('post_count') - 1)
+    popular_tags_changed()
+
+
+def popular_tags_changed():
+    cache.delete(POPULAR_KEY)
+
+
+def popular_tags():
+    """The POPULAR_LIMIT most used tags, most used first, each with its stats."""
+    tags = cache.get(POPULAR_KEY)
+    record_cache('blog-popular-tags', tags is not None)
+    if tags is None:
+        tags = list(
+            TagStats.objects.filter(post_count__gt=0)
+            .select_related('tag')
+            .order_by('-post_count', 'tag__name')[:POPULAR_LIMIT]
+        )
+        cache.set(POPULAR_KEY, tags, timeout=None)
+    return tags
+
+
+def tag_cloud(stats, steps=CLOUD_STEPS):
+    """
+    `stats` in name order, each with a `weight` from 1 to `steps`. Weights
+    follow the log of the post count, so one huge tag doesn't flatten the rest.
+    """
+    stats = sorted(stats, key=lambda stat: stat.tag.name.lower())
+    counts = [math.log(stat.post_count) for stat in stats if stat.post_count]
+    low, high = min(counts, default=0), max(counts, default=0)
+    for stat in stats:
+        if high == low or not stat.post_count:
+            stat.weight = 1 if not stat.post_count else (steps + 1) // 2
+        else:
+            stat.weight = 1 + round((steps - 1) * (math.log(stat.post_count) - low) / (high - low))
+    return stats
+
+
+def rebuild_tag_stats(using=DEFAULT_DB_ALIAS):
+    """Recount every tag from scratch, e.g. after bulk loads that skip signals."""
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM blog_tagstats')
+        cursor.execute(REBUILD_SQL)
+        count = cursor.rowcount
+    popular_tags_changed()
+    return count
@@ -1,3 +1,651 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from unittest.mock import patch
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+from taggit.models import Tag, TaggedItem
+
+from .models import Comment, Post, RelatedPost, TagStats
+from .related import build_related_posts, update_related
+from .rendering import RENDERER_VERSION, render_html
+from .rerender import render_stale, render_stale_posts
+from .search import build_match, rebuild_index, search_posts
+from . import sitemaps
+from .tagstats import popular_tags, rebuild_tag_stats, tag_cloud
+from .views import COMMENTS_PER_PAGE, POSTS_PER_PAGE
+
+
+# views are tested as rendered; PageCacheTests turns the page cache back on
+@override_settings(PAGE_CACHE={'ENABLED': False})
+class BlogTestCase(TestCase):
+    def setUp(self):
+        # test rollbacks reuse primary keys, so fragments cached by an
+        # earlier test could otherwise be served for a different post
+        for alias in ('default', 'template_fragments', 'pages'):
+            caches[alias].clear()
+
+
+class PostListQueryTests(BlogTestCase):
+    # count, page of posts (author joined, comments counted), tags for the
+    # page, popular tags (adding posts below retags, so never cached here)
+    LIST_QUERIES = 4
+
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create_user(username=f'writer{i}', password='testpass') for i in range(3)]
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(title=f'Post {i}', content='Some words', author=self.users[i % 3])
+            post.tags.add('django', f'topic{i % 4}')
+            Comment.objects.create(post=post, author=self.users[0], content='Nice')
+
+    def assertConstantQueries(self, url, queries):
+        self.add_posts(3)
+        with self.assertNumQueries(queries):
+            small = self.client.get(url)
+        self.add_posts(POSTS_PER_PAGE * 2)
+        with self.assertNumQueries(queries):
+            large = self.client.get(url)
+        self.assertEqual(small.status_code, 200)
+        self.assertEqual(len(large.context['posts']), POSTS_PER_PAGE)
+        return large
+
+    def test_post_list(self):
+        response = self.assertConstantQueries(reverse('home'), self.LIST_QUERIES)
+        self.assertTrue(response.context['is_paginated'])
+        post = response.context['posts'][0]
+        self.assertEqual(post.comment_count, 1)
+        self.assertContains(response, reverse('tagged-posts', args=['django']))
+
+    def test_home(self):
+        response = self.assertConstantQueries('/', self.LIST_QUERIES)
+        self.assertEqual(response.context['paginator'].count, 3 + POSTS_PER_PAGE * 2)
+
+    def test_tagged_posts(self):
+        # plus one for the tag itself
+        response = self.assertConstantQueries(reverse('tagged-posts', args=['django']), self.LIST_QUERIES + 1)
+        self.assertEqual(response.context['paginator'].count, 3 + POSTS_PER_PAGE * 2)
+        response = self.client.get(reverse('tagged-posts', args=['topic1']))
+        self.assertEqual(response.context['paginator'].count, 1 + 5)
+
+    def test_pages_follow_newest_first(self):
+        self.add_posts(POSTS_PER_PAGE + 1)
+        response = self.client.get(reverse('home'), {'page': 2})
+        self.assertEqual([post.title for post in response.context['posts']], ['Post 0'])
+
+
+class PostSearchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+
+    def post(self, title, content, tags=()):
+        post = Post.objects.create(title=title, content=content, author=self.user)
+        post.tags.add(*tags)
+        return post
+
+    def titles(self, query):
+        return [post.title for post in search_posts(query)[:10]]
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.post('Cooking pasta', 'A long note that mentions django once among many other words')
+        self.post('Django tips', 'Short')
+        self.post('Gardening', 'Nothing relevant')
+        self.assertEqual(self.titles('django'), ['Django tips', 'Cooking pasta'])
+
+    def test_prefix_and_all_words(self):
+        self.post('Django tips', 'testing views')
+        self.post('Django models', 'fields')
+        # equal ranks: newest first
+        self.assertEqual(self.titles('djan*'), ['Django models', 'Django tips'])
+        self.assertEqual(self.titles('djan'), [])
+        self.assertEqual(self.titles('django testing'), ['Django tips'])
+
+    def test_index_follows_saves_tags_and_deletes(self):
+        post = self.post('First', 'body', tags=['python'])
+        self.assertEqual(self.titles('python'), ['First'])
+
+        post.tags.set(['rust'])
+        self.assertEqual(self.titles('python'), [])
+        self.assertEqual(self.titles('rust'), ['First'])
+
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(self.titles('renamed'), ['Renamed'])
+
+        post.delete()
+        self.assertEqual(self.titles('rust'), [])
+
+    def test_rebuild_matches_incremental_index(self):
+        self.post('One', 'alpha', tags=['beta'])
+        self.post('Two', 'gamma')
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(self.titles('beta'), ['One'])
+
+    @patch('blog.search.MAX_RESULTS', 10)
+    def test_only_the_newest_matches_are_ranked_and_counted(self):
+        self.post('Django', 'django')
+        Post.objects.bulk_create(
+            Post(title=f'Note {i}', content='a long note that mentions django once', author=self.user)
+            for i in range(15)
+        )
+        rebuild_index()
+        results = search_posts('django')
+        self.assertEqual(results.count(), 10)
+        self.assertTrue(results.capped)
+        # the oldest post would rank first, but it is outside the pool
+        self.assertNotIn('Django', [post.title for post in results[:20]])
+        self.assertEqual(len(results[5:]), 5)
+
+        response = self.client.get(reverse('post-search'), {'q': 'django'})
+        self.assertContains(response, '10+ results')
+
+    def test_operators_are_searched_as_words(self):
+        self.assertEqual(build_match('title:x OR "y" NEAR(z)'), '"title" "x" "or" "y" "near" "z"')
+        self.assertIsNone(build_match('  '))
+
+    def test_view_paginates_with_constant_queries(self):
+        for i in range(POSTS_PER_PAGE * 2):
+            self.post(f'Django {i}', 'words', tags=['web'])
+        url = reverse('post-search')
+        # count and page of ids from the index, then the posts and their tags
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'q': 'django', 'page': 2})
+        self.assertEqual(response.context['paginator'].count, POSTS_PER_PAGE * 2)
+        self.assertEqual(len(response.context['posts']), POSTS_PER_PAGE)
+        self.assertContains(response, '?q=django&amp;page=1')
+
+
+class FragmentCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        self.post = Post.objects.create(title='Cached', content='original words', author=self.user)
+        self.post.tags.add('django')
+
+    def assertShows(self, url, *texts):
+        response = self.client.get(url)
+        for text in texts:
+            self.assertContains(response, text)
+
+    def test_warm_list_reuses_cards(self):
+        self.assertShows(reverse('home'), 'original words')
+        # a queryset update sends no signals, so the cached card stays
+        Post.objects.filter(pk=self.post.pk).update(excerpt_html='sneaky words')
+        self.assertShows(reverse('home'), 'original words')
+
+    def test_post_save_refreshes_card_and_detail(self):
+        detail = reverse('post-detail', args=[self.post.pk])
+        self.assertShows(reverse('home'), 'original words')
+        self.assertShows(detail, 'original words')
+        self.post.content = 'edited words'
+        self.post.save()
+        self.assertShows(reverse('home'), 'edited words')
+        self.assertShows(detail, 'edited words')
+
+    def test_comments_refresh_count_and_block(self):
+        detail = reverse('post-detail', args=[self.post.pk])
+        self.assertShows(reverse('home'), '0 comments')
+        self.assertShows(detail, '0 comments')
+        comment = Comment.objects.create(post=self.post, author=self.user, content='First!')
+        self.assertShows(reverse('home'), '1 comment')
+        self.assertShows(detail, '1 comment', 'First!')
+        comment.delete()
+        self.assertShows(detail, '0 comments')
+
+    def test_tag_changes_refresh_cards(self):
+        self.assertShows(reverse('home'), '>django<')
+        self.post.tags.add('python')
+        self.assertShows(reverse('home'), '>python<')
+        Tag.objects.filter(name='python').update(name='ignored')
+        tag = Tag.objects.get(slug='python')
+        tag.name = 'Python3'
+        tag.save()
+        self.assertShows(reverse('home'), '>Python3<')
+        tag.delete()
+        self.assertNotContains(self.client.get(reverse('home')), 'Python3')
+
+    def test_author_rename_refreshes_cards(self):
+        self.assertShows(reverse('home'), 'By writer')
+        self.user.username = 'novelist'
+        self.user.save()
+        self.assertShows(reverse('home'), 'By novelist')
+
+    def test_warm_detail_skips_comment_and_tag_queries(self):
+        detail = reverse('post-detail', args=[self.post.pk])
+        self.client.get(detail)
+        # only the post itself (author joined) and its related posts
+        with self.assertNumQueries(2):
+            self.client.get(detail)
+
+
+@override_settings(PAGE_CACHE={'ENABLED': True, 'CACHE': 'pages'})
+class PageCacheTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = Post.objects.create(title='First', content='one', author=self.user)
+            self.first.tags.add('django')
+            self.second = Post.objects.create(title='Second', content='two', author=self.user)
+            self.second.tags.add('python')
+        self.pages = {
+            'list': reverse('home'),
+            'first': reverse('post-detail', args=[self.first.pk]),
+            'second': reverse('post-detail', args=[self.second.pk]),
+            'django': reverse('tagged-posts', args=['django']),
+            'python': reverse('tagged-posts', args=['python']),
+        }
+        for url in self.pages.values():
+            self.client.get(url)
+
+    def states(self):
+        return {name: self.client.get(url)['X-Page-Cache'] for name, url in self.pages.items()}
+
+    def change(self, action):
+        # page keys are purged once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(set(self.states().values()), {'hit'})
+
+    def test_logged_in_users_are_never_served_cached_pages(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.pages['list'])
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Create New Post')
+
+    def test_editing_a_post_purges_only_its_pages(self):
+        self.first.content = 'changed'
+        self.change(self.first.save)
+        self.assertEqual(self.states(), {
+            'list': 'miss', 'first': 'miss', 'second': 'hit', 'django': 'miss', 'python': 'hit',
+        })
+
+    def test_comment_purges_the_post_and_lists_showing_it(self):
+        self.change(lambda: Comment.objects.create(post=self.second, author=self.user, content='Hi'))
+        self.assertEqual(self.states(), {
+            'list': 'miss', 'first': 'hit', 'second': 'miss', 'django': 'hit', 'python': 'miss',
+        })
+
+    def test_retagging_purges_old_and_new_tag_pages(self):
+        self.change(lambda: self.first.tags.set(['python']))
+        states = self.states()
+        self.assertEqual((states['django'], states['python'], states['second']), ('miss', 'miss', 'hit'))
+        self.assertContains(self.client.get(self.pages['python']), 'First')
+
+    def test_new_post_purges_post_lists(self):
+        self.change(lambda: Post.objects.create(title='Third', content='three', author=self.user))
+        self.assertEqual(self.states(), {
+            'list': 'miss', 'first': 'hit', 'second': 'hit', 'django': 'hit', 'python': 'hit',
+        })
+
+    def test_feeds_are_cached_until_a_post_in_them_changes(self):
+        feeds = {'all': reverse('feed-rss'), 'django': reverse('tag-feed-json', args=['django'])}
+        first = {name: self.client.get(url) for name, url in feeds.items()}
+        hit = self.client.get(feeds['all'], HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['all']['ETag'])
+        self.assertEqual((hit.status_code, hit['X-Page-Cache']), (304, 'hit'))
+        self.assertEqual(self.client.get(feeds['all'], HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+
+        self.change(lambda: Post.objects.create(title='Third', content='three', author=self.user))
+        self.assertEqual(self.client.get(feeds['all'])['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(feeds['django'])['X-Page-Cache'], 'hit')
+        self.change(self.first.save)
+        self.assertEqual(self.client.get(feeds['django'])['X-Page-Cache'], 'miss')
+
+
+class TagStatsTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+
+    def post(self, *tags):
+        post = Post.objects.create(title='Post', content='words', author=self.user)
+        post.tags.add(*tags)
+        return post
+
+    def counts(self):
+        return dict(TagStats.objects.filter(post_count__gt=0).values_list('tag__name', 'post_count'))
+
+    def test_counts_follow_tag_changes(self):
+        first = self.post('django', 'python')
+        second = self.post('django')
+        self.post('django', 'rust')
+        self.assertEqual(self.counts(), {'django': 3, 'python': 1, 'rust': 1})
+
+        first.tags.add('django')
+        first.tags.remove('python')
+        second.tags.set(['python', 'rust'])
+        self.assertEqual(self.counts(), {'django': 2, 'python': 1, 'rust': 2})
+
+        second.tags.clear()
+        first.delete()
+        incremental = self.counts()
+        self.assertEqual(incremental, {'django': 1, 'rust': 1})
+        rebuild_tag_stats()
+        self.assertEqual(self.counts(), incremental)
+
+    def test_popular_tags_are_cached_until_counts_change(self):
+        self.post('django', 'python')
+        self.post('django')
+        self.assertEqual([stat.tag.name for stat in popular_tags()], ['django', 'python'])
+        with self.assertNumQueries(0):
+            popular_tags()
+        self.post('python')
+        self.post('python')
+        self.assertEqual([(stat.tag.name, stat.post_count) for stat in popular_tags()], [('python', 3), ('django', 2)])
+
+    def test_cloud_weights_follow_log_counts(self):
+        for _ in range(8):
+            self.post('big')
+        self.post('small')
+        self.post('medium', 'big')
+        self.post('medium')
+        self.post('medium')
+        cloud = tag_cloud(popular_tags())
+        self.assertEqual([(stat.tag.name, stat.weight) for stat in cloud], [('big', 5), ('medium', 3), ('small', 1)])
+
+    def test_index_and_sidebar(self):
+        self.post('django', 'python')
+        self.post('django')
+        response = self.client.get(reverse('tag-index'), {'sort': 'popular'})
+        self.assertEqual([stat.tag.name for stat in response.context['tags']], ['django', 'python'])
+        self.assertContains(response, 'class="weight-5"')
+        self.assertContains(self.client.get(reverse('home')), 'django</a> (2)')
+
+
+class RenderedContentTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+
+    def test_html_is_escaped_with_paragraphs_and_links(self):
+        html = render_html('Hi <script>alert(1)</script>\nsee https://example.com\n\nBye')
+        self.assertEqual(html, (
+            '<p>Hi &lt;script&gt;alert(1)&lt;/script&gt;<br>'
+            'see <a href="https://example.com" rel="nofollow">https://example.com</a></p>\n\n<p>Bye</p>'
+        ))
+
+    def test_save_stores_html_and_excerpt(self):
+        post = Post.objects.create(title='T', content=' '.join(['word'] * 80) + ' <b>', author=self.user)
+        self.assertEqual(post.render_version, RENDERER_VERSION)
+        self.assertTrue(post.excerpt_html.endswith('word…'))
+        post.content = 'new <b>'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual((post.content_html, post.excerpt_html), ('<p>new &lt;b&gt;</p>', 'new &lt;b&gt;'))
+
+    def test_pages_output_stored_html(self):
+        post = Post.objects.create(title='T', content='body', author=self.user)
+        Post.objects.filter(pk=post.pk).update(content_html='<p>stored</p>', excerpt_html='stored excerpt')
+        self.assertContains(self.client.get(reverse('post-detail', args=[post.pk])), '<p>stored</p>', html=True)
+        self.assertContains(self.client.get(reverse('home')), 'stored excerpt')
+
+    def test_stale_posts_are_rendered_when_shown(self):
+        post = Post.objects.create(title='T', content='fresh', author=self.user)
+        Post.objects.filter(pk=post.pk).update(content_html='', excerpt_html='', render_version=0)
+        self.assertContains(self.client.get(reverse('home')), 'fresh')
+        post.refresh_from_db()
+        self.assertEqual((post.content_html, post.render_version), ('<p>fresh</p>', RENDERER_VERSION))
+
+    def test_stale_posts_render_in_a_fixed_number_of_queries(self):
+        for i in range(5):
+            Post.objects.create(title=f'T{i}', content=f'body {i}', author=self.user)
+        Post.objects.update(content_html='', excerpt_html='', render_version=0)
+        # the list, their content, one update
+        with self.assertNumQueries(3):
+            posts = render_stale(Post.objects.defer('content').order_by('pk'))
+        self.assertEqual(posts[4].content_html, '<p>body 4</p>')
+        self.assertEqual(
+            dict(Post.objects.values_list('title', 'excerpt_html'))['T4'], 'body 4',
+        )
+
+    def test_bulk_rerender_in_parallel(self):
+        for i in range(7):
+            Post.objects.create(title=f'T{i}', content=f'body {i}', author=self.user)
+        Post.objects.update(content_html='', excerpt_html='', render_version=0)
+        edited = Post.objects.get(title='T0')
+        edited.content = 'edited'
+        edited.save()
+
+        self.assertEqual(render_stale_posts(chunk_size=2, workers=2), 6)
+        self.assertEqual(
+            dict(Post.objects.values_list('title', 'content_html'))['T6'], '<p>body 6</p>',
+        )
+        self.assertFalse(Post.objects.filter(render_version__lt=RENDERER_VERSION).exists())
+        self.assertEqual(render_stale_posts(workers=1), 0)
+
+
+class CommentThreadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        self.post = Post.objects.create(title='Thread', content='body', author=self.user)
+
+    def comment(self, content, parent=None):
+        return Comment.objects.create(post=self.post, author=self.user, content=content, parent=parent)
+
+    def test_paths_nest_replies_in_thread_order(self):
+        root = self.comment('root')
+        first = self.comment('first', root)
+        other = self.comment('other root')
+        nested = self.comment('nested', first)
+        second = self.comment('second', root)
+
+        self.assertEqual(nested.path, root.path + first.path[-10:] + nested.path[-10:])
+        self.assertEqual((root.depth, first.depth, nested.depth), (0, 1, 2))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [(c.content, c.author.username) for c in root.descendants().select_related('author')],
+                [('first', 'writer'), ('nested', 'writer'), ('second', 'writer')],
+            )
+        self.assertEqual(list(other.descendants()), [])
+        second.delete()
+        first.delete()
+        self.assertEqual(list(root.descendants()), [])
+
+    def test_replies_past_max_depth_become_siblings(self):
+        comment = self.comment('0')
+        for i in range(Comment.MAX_DEPTH):
+            comment = self.comment(str(i + 1), comment)
+        reply = self.comment('too deep', comment)
+        self.assertEqual((reply.parent_id, reply.depth), (comment.parent_id, Comment.MAX_DEPTH))
+
+    def test_post_page_lists_top_level_comments_a_page_at_a_time(self):
+        for i in range(COMMENTS_PER_PAGE + 3):
+            root = self.comment(f'comment {i}')
+        reply = self.comment('a reply', root)
+        self.comment('a reply to the reply', reply)
+        url = reverse('post-detail', args=[self.post.pk])
+        # post, related posts, tags, comment total, top-level count, page of comments (authors joined)
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        # the whole thread below a comment, as the replies view shows it
+        self.assertContains(response, 'View 2 replies')
+        self.assertNotContains(response, 'a reply')
+        self.assertContains(response, '?comments=2')
+        self.assertEqual(len(response.context['comments_page']), COMMENTS_PER_PAGE)
+
+        replies = self.client.get(reverse('comment-replies', args=[root.pk]))
+        self.assertContains(replies, 'a reply to the reply')
+        self.assertContains(self.client.get(url, {'comments': 2}), 'comment 0')
+
+    def test_reply_form_threads_under_parent(self):
+        root = self.comment('root')
+        self.client.force_login(self.user)
+        url = reverse('comment-create', args=[self.post.pk])
+        response = self.client.post(f'{url}?parent={root.pk}', {'content': 'answer'})
+        reply = Comment.objects.get(content='answer')
+        self.assertRedirects(response, f'{self.post.get_absolute_url()}#comment-{reply.pk}')
+        self.assertEqual((reply.parent, reply.post, reply.author), (root, self.post, self.user))
+
+
+class RelatedPostTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        self.posts = {}
+        for title, tags in [('a', 'xy'), ('b', 'xy'), ('c', 'x'), ('d', 'z'), ('e', 'xyz')]:
+            self.posts[title] = Post.objects.create(title=title, content='words', author=self.user)
+            self.posts[title].tags.add(*tags)
+
+    def related(self, title):
+        links = RelatedPost.objects.filter(post=self.posts[title]).select_related('related').order_by('rank')
+        return [(link.related.title, link.score) for link in links]
+
+    def test_build_ranks_by_shared_tags_then_recency(self):
+        self.assertEqual(build_related_posts(), 5)
+        self.assertEqual(self.related('a'), [('b', 1.0), ('e', 2 / 3), ('c', 0.5)])
+        self.assertEqual(self.related('d'), [('e', 1 / 3)])
+        self.assertEqual(self.related('e'), [('b', 2 / 3), ('a', 2 / 3), ('d', 1 / 3), ('c', 1 / 3)])
+        # only lists that changed are written again
+        self.assertEqual(build_related_posts(), 0)
+
+    def test_build_respects_limit(self):
+        build_related_posts(limit=2)
+        self.assertEqual(self.related('e'), [('b', 2 / 3), ('a', 2 / 3)])
+
+    def test_single_post_update_matches_build(self):
+        build_related_posts()
+        built = {title: self.related(title) for title in self.posts}
+        RelatedPost.objects.all().delete()
+        for title, post in self.posts.items():
+            update_related(post.pk)
+            self.assertEqual(self.related(title), built[title])
+
+    def test_retagging_recomputes_the_posts_list(self):
+        build_related_posts()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts['d'].tags.set(['x', 'y'])
+        self.assertEqual(self.related('d'), [('b', 1.0), ('a', 1.0), ('e', 2 / 3), ('c', 0.5)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts['d'].tags.clear()
+        self.assertEqual(self.related('d'), [])
+
+    def test_untagged_posts_lose_their_list_on_build(self):
+        build_related_posts()
+        TaggedItem.objects.filter(object_id=self.posts['c'].pk).delete()
+        build_related_posts()
+        self.assertEqual(self.related('c'), [])
+
+    def test_detail_page_lists_related_posts(self):
+        build_related_posts()
+        response = self.client.get(reverse('post-detail', args=[self.posts['a'].pk]))
+        self.assertEqual([post.title for post in response.context['related_posts']], ['b', 'e', 'c'])
+        self.assertContains(response, 'Related posts')
+        self.assertContains(response, self.posts['e'].get_absolute_url())
+
+
+class FeedTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        self.old = Post.objects.create(title='Old news', content='first <b>post</b>', author=self.user)
+        self.old.tags.add('django')
+        self.new = Post.objects.create(title='Fresh news', content='second', author=self.user)
+        self.new.tags.add('python')
+
+    def test_all_posts_in_every_format(self):
+        rss = self.client.get(reverse('feed-rss'))
+        self.assertEqual(rss['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertLess(rss.content.index(b'Fresh news'), rss.content.index(b'Old news'))
+        # the stored HTML, XML-escaped; the author's own markup stays text
+        self.assertContains(rss, '<description>&lt;p&gt;first &amp;lt;b&amp;gt;post&amp;lt;/b&amp;gt;&lt;/p&gt;</description>')
+
+        atom = self.client.get(reverse('feed-atom'))
+        self.assertEqual(atom['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertContains(atom, '<category term="django"/>')
+
+        feed = self.client.get(reverse('feed-json')).json()
+        self.assertEqual(feed['version'], 'https://jsonfeed.org/version/1.1')
+        self.assertEqual([item['title'] for item in feed['items']], ['Fresh news', 'Old news'])
+        self.assertEqual(feed['items'][1]['content_html'], self.old.content_html)
+        self.assertEqual(feed['items'][1]['authors'], [{'name': 'writer'}])
+        self.assertTrue(feed['items'][1]['url'].endswith(self.old.get_absolute_url()))
+
+    def test_tag_feeds(self):
+        feed = self.client.get(reverse('tag-feed-json', args=['django'])).json()
+        self.assertEqual([item['title'] for item in feed['items']], ['Old news'])
+        self.assertEqual(feed['title'], 'Django Blog: django')
+        self.assertEqual(self.client.get(reverse('tag-feed-rss', args=['missing'])).status_code, 404)
+        self.assertContains(self.client.get(reverse('tagged-posts', args=['django'])), reverse('tag-feed-atom', args=['django']))
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('feed-rss'))
+        self.assertEqual(response['Last-Modified'], http_date(self.new.published_date.timestamp()))
+        self.assertEqual(self.client.get(reverse('feed-rss'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse('feed-rss'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+        self.new.title = 'Edited news'
+        self.new.save()
+        self.assertEqual(self.client.get(reverse('feed-rss'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_entries_are_cached_and_shared_between_feeds(self):
+        self.client.get(reverse('feed-rss'))
+        # only the list of ids; both entries come from the cache
+        with self.assertNumQueries(1):
+            self.client.get(reverse('feed-json'))
+        self.new.title = 'Edited news'
+        self.new.save()
+        # ids, then the edited post and its tags
+        with self.assertNumQueries(3):
+            feed = self.client.get(reverse('feed-json')).json()
+        self.assertEqual([item['title'] for item in feed['items']], ['Edited news', 'Old news'])
+
+
+# small shards and chunks, so a handful of posts spans several of each
+@patch.object(sitemaps, 'SHARD_SIZE', 3)
+@patch.object(sitemaps, 'CHUNK_SIZE', 2)
+class SitemapTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='writer', password='testpass')
+        self.posts = [Post.objects.create(title=f'Post {i}', content='words', author=self.user) for i in range(7)]
+        self.posts[0].tags.add('django')
+
+    def shard(self, section, number):
+        response = self.client.get(reverse('sitemap-shard', args=[section, number]))
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_index_lists_non_empty_shards(self):
+        for post in self.posts[3:6]:
+            post.delete()
+        index = self.client.get(reverse('sitemap-index')).content.decode()
+        shards = {post.pk // 3 for post in self.posts[:3] + self.posts[6:]}
+        for number in shards:
+            self.assertIn(f'/sitemap-posts-{number}.xml</loc>', index)
+        self.assertIn('/sitemap-tags-0.xml</loc>', index)
+        self.assertEqual(index.count('<sitemap>'), len(shards) + 1)
+        self.assertIn(f'<lastmod>{self.posts[6].published_date.isoformat(timespec="seconds")}</lastmod>', index)
+
+    def test_shards_stream_every_url_in_their_range(self):
+        urls = {number: self.shard('posts', number) for number in {post.pk // 3 for post in self.posts}}
+        for post in self.posts:
+            self.assertIn(f'<loc>http://testserver{post.get_absolute_url()}</loc>', urls[post.pk // 3])
+        self.assertEqual(sum(shard.count('<url>') for shard in urls.values()), len(self.posts))
+        self.assertIn(f'<loc>http://testserver{reverse("tagged-posts", args=["django"])}</loc>', self.shard('tags', 0))
+
+    def test_empty_or_unknown_shards_are_not_found(self):
+        self.assertEqual(self.client.get(reverse('sitemap-shard', args=['posts', 100])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('sitemap-shard', args=['users', 0])).status_code, 404)
+
+    @override_settings(PAGE_CACHE={'ENABLED': True, 'CACHE': 'pages'})
+    def test_new_post_purges_only_its_shard(self):
+        shards = {post.pk // 3 for post in self.posts}
+        for number in shards:
+            self.shard('posts', number)
+        with self.captureOnCommitCallbacks(execute=True):
+            new = Post.objects.create(title='Post 7', content='words', author=self.user)
+        states = {
+            number: self.client.get(reverse('sitemap-shard', args=['posts', number]))['X-Page-Cache']
+            for number in shards | {new.pk // 3}
+        }
+        self.assertEqual(states.pop(new.pk // 3), 'miss')
+        self.assertEqual(set(states.values()), {'hit'})
@@ -4,9 +4,11 @@ from . import views
 from .views import (
     PostCreateView, PostListView, PostDetailView, PostDeleteView, PostUpdateView,
     CommentCreateView, CommentDeleteView, CommentListView, CommentUpdateView,
-    TaggedPostListView  # ✅ NEW: for tag filtering
+    TaggedPostListView, TagIndexView,  # ✅ NEW: for tag filtering
+    CommentRepliesView,
 )
 from .views import PostSearchView
+from .feeds import AtomPostsFeed, JSONPostsFeed, PostsFeed
 
 
 urlpatterns = [
@@ -18,9 +20,18 @@ urlpatterns = [
     path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
 
     # --- Tag Filter View ---
+    path('tags/', TagIndexView.as_view(), name='tag-index'),
     path('tags/<slug:slug>/', TaggedPostListView.as_view(), name='tagged-posts'),  # ✅ NEW
     path('search/', PostSearchView.as_view(), name='post-search'),
 
+    # --- Feeds ---
+    path('feed/', PostsFeed(), name='feed-rss'),
+    path('feed/atom/', AtomPostsFeed(), name='feed-atom'),
+    path('feed/json/', JSONPostsFeed(), name='feed-json'),
+    path('tags/<slug:slug>/feed/', PostsFeed(), name='tag-feed-rss'),
+    path('tags/<slug:slug>/feed/atom/', AtomPostsFeed(), name='tag-feed-atom'),
+    path('tags/<slug:slug>/feed/json/', JSONPostsFeed(), name='tag-feed-json'),
+
     # --- Auth & Profile ---
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(template_name='registration/logout.html'), name='logout'),
@@ -30,6 +41,7 @@ urlpatterns = [
     # --- Comment Views ---
     path('post/<int:pk>/comments/', CommentListView.as_view(), name='comment-list'),  # ✅ FIXED: clearer URL
     path('post/<int:pk>/comments/new/', CommentCreateView.as_view(), name='comment-create'),  # ✅ FIXED: unique route
+    path('comment/<int:pk>/replies/', CommentRepliesView.as_view(), name='comment-replies'),
     path('comment/<int:pk>/update/', CommentUpdateView.as_view(), name='comment-update'),
     path('comment/<int:pk>/delete/', CommentDeleteView.as_view(), name='comment-delete'),
     path('tags/<slug:slug>/', views.TaggedPostListView.as_view(), name='tagged-posts'),
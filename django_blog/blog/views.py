@@ -8,9 +8,18 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy, reverse
-from .models import Profile, Post, Comment, Author
+from .models import Profile, Post, Comment, TagStats
+from common.pagecache import add_surrogate_keys
+from .fragments import POSTS_KEY, TAGS_KEY, attach_versions, post_key, tag_key
+from .related import related_posts
+from .rerender import render_stale
+from .search import search_posts
+from .tagstats import popular_tags, tag_cloud
 from taggit.models import Tag  # ✅ NEW: for tag filtering
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
 
 
 # --- Registration & Profile ---
@@ -42,49 +51,125 @@ def profile(request):
     return render(request, "profile/profile.html", context)
 
 # --- Home & Post Views ---
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+
+def post_list_queryset(posts=None):
+    # what every post list shows, fetched up front: one query for the page
+    # (author joined, comments counted) and one for all of its tags. Cards
+    # show the stored excerpt, so the full content is left in the database.
+    posts = Post.objects.all() if posts is None else posts
+    return (
+        posts
+        .defer('content', 'content_html')
+        .select_related('author')
+        .prefetch_related('tags')
+        .annotate(comment_count=Count('comments', distinct=True))
+        .order_by('-published_date', '-pk')
+    )
+
 def home(request):
-    posts = Post.objects.all().order_by('-published_date')
-    context = {'posts': posts}
-    return render(request, 'blog/home.html', context)
+    paginator = Paginator(post_list_queryset(), POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'posts': attach_versions(render_stale(page_obj.object_list)),
+        'page_obj': page_obj,
+        'paginator': paginator,
+        'is_paginated': page_obj.has_other_pages(),
+        'popular_tags': popular_tags(),
+    }
+    response = render(request, 'blog/home.html', context)
+    return add_surrogate_keys(response, POSTS_KEY, TAGS_KEY, *(post_key(post.pk) for post in context['posts']))
+
 
-class PostListView(ListView):
+class SurrogateKeyMixin:
+    """Tags the response with get_surrogate_keys() so the page cache can store and purge it."""
+
+    def get_surrogate_keys(self, context):
+        return [post_key(post.pk) for post in context['posts']]
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        return add_surrogate_keys(response, *self.get_surrogate_keys(context))
+
+class PostListView(SurrogateKeyMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
-    ordering = ['-published_date']
+    paginate_by = POSTS_PER_PAGE
+
+    def get_queryset(self):
+        return post_list_queryset()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['posts'] = attach_versions(render_stale(context['posts']))
+        context['popular_tags'] = popular_tags()
+        return context
+
+    def get_surrogate_keys(self, context):
+        return [POSTS_KEY, TAGS_KEY, *super().get_surrogate_keys(context)]
 
 class PostSearchView(ListView):
     model = Post
     template_name = 'blog/post_search.html'
     context_object_name = 'posts'
+    paginate_by = POSTS_PER_PAGE
 
     def get_queryset(self):
-        query = self.request.GET.get('q')
-        if query:
-            return Post.objects.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).distinct()
-        return Post.objects.none()
+        # ranked by the full-text index, see blog/search.py
+        return search_posts(self.request.GET.get('q', ''), post_list_queryset())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['posts'] = attach_versions(render_stale(context['posts']))
         context['query'] = self.request.GET.get('q', '')
         return context
 
 
-class PostDetailView(DetailView):
+class PostDetailView(SurrogateKeyMixin, DetailView):
     model = Post
     template_name = 'blog/post_detail.html'
     context_object_name = 'post'
 
+    def get_queryset(self):
+        return Post.objects.defer('content').select_related('author')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['comments'] = Comment.objects.filter(Post_id=self.object.pk)
+        attach_versions(render_stale([self.object]))
+        # top-level comments only, newest first (a top-level path is just the
+        # zero-padded id), a page at a time; replies are fetched by
+        # CommentRepliesView when asked for. That view shows the whole
+        # thread, so every descendant is counted: the index range under each
+        # path, as in Comment.descendants()
+        descendants = (
+            Comment.objects
+            .filter(post=OuterRef('post'), path__gt=OuterRef('path'), path__lt=Concat(OuterRef('path'), Value('~')))
+            .order_by().values('post').annotate(count=Count('pk')).values('count')
+        )
+        comments = (
+            self.object.comments
+            .filter(parent=None)
+            .select_related('author')
+            .annotate(reply_count=Coalesce(Subquery(descendants), 0))
+            .order_by('-path')
+        )
+        paginator = Paginator(comments, COMMENTS_PER_PAGE)
+        number = self.request.GET.get('comments', '1')
+        number = int(number) if number.isdigit() else 1
+        context['comments_page_number'] = number
+        # all of these stay unevaluated until a cached fragment misses
+        context['comments_page'] = SimpleLazyObject(lambda: paginator.get_page(number))
         context['tags'] = self.object.tags.all()  # ✅ NEW: pass tags to template
+        context['related_posts'] = related_posts(self.object)
         return context
 
+    def get_surrogate_keys(self, context):
+        # the related posts' titles are shown too
+        return [post_key(self.object.pk), *(post_key(post.pk) for post in context['related_posts'])]
+
 @login_required
 def AddComment(request, pk):
     post = get_object_or_404(Post, pk=pk)
@@ -129,31 +214,101 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user == Post.author
 
 # --- Tag Filter View ---
-class TaggedPostListView(ListView):  # ✅ NEW: filter posts by tag
+def tag_and_posts(slug):
+    """The tag with `slug`, or 404, and its posts."""
+    tag = get_object_or_404(Tag, slug=slug)
+    return tag, Post.objects.filter(tags__in=[tag])
+
+
+class TaggedPostListView(SurrogateKeyMixin, ListView):  # ✅ NEW: filter posts by tag
     model = Post
     template_name = 'blog/tagged_posts.html'
     context_object_name = 'posts'
+    paginate_by = POSTS_PER_PAGE
 
     def get_queryset(self):
-        self.tag = get_object_or_404(Tag, slug=self.kwargs['slug'])
-        return Post.objects.filter(tags__in=[self.tag])
+        self.tag, posts = tag_and_posts(self.kwargs['slug'])
+        return post_list_queryset(posts)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['posts'] = attach_versions(render_stale(context['posts']))
         context['tag'] = self.tag
+        context['popular_tags'] = popular_tags()
+        return context
+
+    def get_surrogate_keys(self, context):
+        return [tag_key(self.tag.slug), TAGS_KEY, *super().get_surrogate_keys(context)]
+
+
+class TagIndexView(SurrogateKeyMixin, ListView):
+    model = TagStats
+    template_name = 'blog/tag_index.html'
+    context_object_name = 'tags'
+    paginate_by = 100
+    orderings = {
+        'name': ('tag__name',),
+        'popular': ('-post_count', 'tag__name'),
+        'recent': ('-last_used', 'tag__name'),
+    }
+
+    def get_queryset(self):
+        ordering = self.orderings.get(self.request.GET.get('sort'), self.orderings['name'])
+        return TagStats.objects.filter(post_count__gt=0).select_related('tag').order_by(*ordering)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cloud'] = tag_cloud(popular_tags())
         return context
 
+    def get_surrogate_keys(self, context):
+        return [TAGS_KEY]
+
 # --- Comment Views ---
 class CommentCreateView(LoginRequiredMixin, CreateView):
     model = Comment
     fields = ['content']
     template_name = 'blog/comment_create.html'
-    success_url = reverse_lazy('home')
+
+    def dispatch(self, request, *args, **kwargs):
+        self.post_obj = get_object_or_404(Post, pk=kwargs['pk'])
+        # ?parent=<id> makes it a reply
+        parent = request.GET.get('parent')
+        self.parent = get_object_or_404(Comment, pk=parent, post=self.post_obj) if parent else None
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['post'] = self.post_obj
+        context['parent'] = self.parent
+        return context
 
     def form_valid(self, form):
         form.instance.author = self.request.user
+        form.instance.post = self.post_obj
+        form.instance.parent = self.parent
         return super().form_valid(form)
 
+    def get_success_url(self):
+        return f'{self.post_obj.get_absolute_url()}#comment-{self.object.pk}'
+
+class CommentRepliesView(SurrogateKeyMixin, DetailView):
+    """Every reply under a comment, as an HTML fragment the post page loads on demand."""
+    model = Comment
+    template_name = 'blog/comment_replies.html'
+    context_object_name = 'comment'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        replies = list(self.object.descendants().select_related('author'))
+        for reply in replies:
+            reply.indent = reply.depth - self.object.depth - 1
+        context['replies'] = replies
+        return context
+
+    def get_surrogate_keys(self, context):
+        return [post_key(self.object.post_id)]
+
 class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Comment
     template_name = 'blog/comment_delete.html'
@@ -10,11 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared middleware and tools used by every project live in <repo>/common
+sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -42,6 +47,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'common.metrics.MetricsMiddleware',
+    'common.accesslog.AccessLogMiddleware',
+    'common.profiling.ProfilerMiddleware',
+    'common.nplusone.NPlusOneMiddleware',
+    'common.pagecache.PageCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,14 +84,43 @@ WSGI_APPLICATION = 'django_blog.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite in WAL mode with tuned pragmas and BEGIN IMMEDIATE (common/db/sqlite3),
+# keeping connections open between requests
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'common.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-        
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Post version stamps live in 'default', rendered fragments in
+# 'template_fragments' (blog/fragments.py) and whole anonymous pages in
+# 'pages' (common/pagecache.py). All are per-process here; with several
+# workers point them at a shared backend such as Redis so a change made in
+# one worker invalidates fragments and pages in all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-default',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-pages',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -102,6 +141,49 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Per-request SQL and timing profiler (common/profiling.py)
+PROFILER = {
+    'SAMPLE_RATE': 0.0,
+    'LOG_FILE': BASE_DIR / 'profile.jsonl',
+    'SERVER_TIMING': True,
+}
+
+# Flags repeated same-shape queries per request (common/nplusone.py)
+NPLUSONE = {
+    'ENABLED': DEBUG,
+    'THRESHOLD': 3,
+    'ACTION': 'log',
+    'VIEWS': {},
+}
+
+# Request, query and cache metrics served at /metrics (common/metrics.py).
+# Point MULTIPROCESS_DIR at an empty directory when running several workers.
+METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+# JSON access log, written in batches by a background thread (common/accesslog.py)
+ACCESS_LOG = {
+    'ENABLED': True,
+    'FILE': BASE_DIR / 'access.log',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'QUEUE_SIZE': 10000,
+}
+
+# Gzipped copies of anonymous pages, purged by surrogate key when the posts,
+# tags or comments on them change (common/pagecache.py, blog/signals.py)
+PAGE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'pages',
+    'TIMEOUT': 600,
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2.0,
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -16,11 +16,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from common.metrics import metrics_view
 from blog import views
+from blog.sitemaps import sitemap_index, sitemap_shard
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('blog/', include('blog.urls')),
     path('', views.home, name='home'),
     path('posts/', views.home, name='posts'),
+    path('sitemap.xml', sitemap_index, name='sitemap-index'),
+    path('sitemap-<slug:section>-<int:number>.xml', sitemap_shard, name='sitemap-shard'),
 ]
@@ -0,0 +1,65 @@
+import bisect
+from array import array
+
+from django.core.cache import cache
+
+from common.metrics import record_cache
+
+from .models import CustomUser
+
+
+# Each user's block and mute relations are cached as sorted arrays of user ids,
+# so membership is a bisect and the feed can subtract them without a subquery.
+# Blocking works both ways: the block set holds who you block and who blocks you.
+# Muting doesn't: the mute set is only who you mute.
+def block_key(user_id):
+    return f'block-set:{user_id}'
+
+
+def mute_key(user_id):
+    return f'mute-set:{user_id}'
+
+
+def _cached_ids(key, load):
+    ids = cache.get(key)
+    record_cache(key.split(':')[0], ids is not None)
+    if ids is None:
+        ids = array('q', sorted(set(load())))
+        cache.set(key, ids, timeout=None)
+    return ids
+
+
+def blocked_ids(user_id):
+    return _cached_ids(block_key(user_id), lambda: [
+        *CustomUser.blocking.through.objects.filter(from_customuser_id=user_id).values_list('to_customuser_id', flat=True),
+        *CustomUser.blocking.through.objects.filter(to_customuser_id=user_id).values_list('from_customuser_id', flat=True),
+    ])
+
+
+def muted_ids(user_id):
+    return _cached_ids(mute_key(user_id), lambda: (
+        CustomUser.muting.through.objects.filter(from_customuser_id=user_id).values_list('to_customuser_id', flat=True)
+    ))
+
+
+def is_blocked(user_id, other_id):
+    ids = blocked_ids(user_id)
+    i = bisect.bisect_left(ids, other_id)
+    return i < len(ids) and ids[i] == other_id
+
+
+def hidden_author_ids(user_id):
+    return set(blocked_ids(user_id)).union(muted_ids(user_id))
+
+
+def visible_following_ids(user):
+    following = set(user.following.values_list('id', flat=True))
+    return following - hidden_author_ids(user.pk)
+
+
+def forget_blocks(*user_ids):
+    cache.delete_many([block_key(user_id) for user_id in user_ids])
+
+
+def forget_mutes(*user_ids):
+    cache.delete_many([mute_key(user_id) for user_id in user_ids])
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+
+from common.metrics import Counter, Gauge
+
+
+LOGIN_GATE = {
+    'WORKERS': 4,
+    'QUEUE': 16,
+    'TIMEOUT': 10,
+    'MAX_FAILURES_PER_USER': 5,
+    'MAX_FAILURES_PER_IP': 20,
+    'FAILURE_WINDOW': 15 * 60,
+}
+
+
+def get_config():
+    return {**LOGIN_GATE, **getattr(settings, 'LOGIN_GATE', {})}
+
+
+HASHING_JOBS = Gauge('login_hashing_jobs', 'Password hashing jobs running or queued on the login pool.')
+HASHING_REJECTED = Counter('login_hashing_rejected', 'Logins turned away because the hashing pool was full.')
+
+
+class Overloaded(Exception):
+    pass
+
+
+class LoginUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'login_unavailable'
+
+
+class HashingPool:
+    """
+    Runs password hashing on a small fixed pool of threads. At most
+    workers + queue_size jobs may be in flight; anything beyond that is
+    rejected straight away instead of tying up another request worker.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login-hash')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.timeout = timeout
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            HASHING_REJECTED.inc()
+            raise Overloaded()
+        HASHING_JOBS.inc()
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        HASHING_JOBS.dec()
+        self.slots.release()
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result(timeout=self.timeout)
+
+    async def arun(self, fn, *args):
+        # for async views: the event loop waits, no request thread is held
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(fn, *args)), self.timeout)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = get_config()
+                _pool = HashingPool(config['WORKERS'], config['QUEUE'], config['TIMEOUT'])
+    return _pool
+
+
+# --- failed attempt tracking ---
+
+def _failure_keys(username, ip):
+    config = get_config()
+    return {
+        f'login-fail:user:{username.casefold()}': config['MAX_FAILURES_PER_USER'],
+        f'login-fail:ip:{ip}': config['MAX_FAILURES_PER_IP'],
+    }
+
+
+def is_locked_out(username, ip):
+    limits = _failure_keys(username, ip)
+    counts = cache.get_many(limits.keys())
+    return any(counts.get(key, 0) >= limit for key, limit in limits.items())
+
+
+def record_failure(username, ip):
+    window = get_config()['FAILURE_WINDOW']
+    for key in _failure_keys(username, ip):
+        # add() starts the window, incr() keeps the original expiry
+        if not cache.add(key, 1, timeout=window):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, timeout=window)
+
+
+def clear_failures(username):
+    cache.delete(f'login-fail:user:{username.casefold()}')
+
+
+# --- credential checks ---
+
+def _verify(password, encoded):
+    # runs on the pool; a rehash for an outdated hasher happens here as well
+    upgraded = []
+    valid = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+def check_credentials(username, password, pool=None):
+    """
+    Same outcome as ModelBackend.authenticate(), but the hashing is done on
+    the bounded pool. Raises Overloaded when the pool is full.
+    """
+    pool = pool or get_hashing_pool()
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.get_by_natural_key(username)
+    except UserModel.DoesNotExist:
+        # hash anyway so unknown usernames take as long as wrong passwords
+        pool.run(make_password, password)
+        return None
+
+    valid, upgraded = pool.run(_verify, password, user.password)
+    if not valid:
+        return None
+    if upgraded:
+        UserModel._default_manager.filter(pk=user.pk).update(password=upgraded)
+        user.password = upgraded
+    return user
+
+
+async def acheck_credentials(username, password, pool=None):
+    """check_credentials() for async views, awaiting the pool instead of blocking on it."""
+    pool = pool or get_hashing_pool()
+    UserModel = get_user_model()
+    try:
+        user = await UserModel._default_manager.aget(**{UserModel.USERNAME_FIELD: username})
+    except UserModel.DoesNotExist:
+        await pool.arun(make_password, password)
+        return None
+
+    valid, upgraded = await pool.arun(_verify, password, user.password)
+    if not valid:
+        return None
+    if upgraded:
+        await UserModel._default_manager.filter(pk=user.pk).aupdate(password=upgraded)
+        user.password = upgraded
+    return user
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend with the password hashing done on the bounded login pool,
+    so authenticate() and aauthenticate() keep their usual behaviour, other
+    backends and the user_login_failed signal included. Overloaded and
+    TimeoutError are raised through to the caller.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = check_credentials(username, password)
+        if user is not None and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = await acheck_credentials(username, password)
+        if user is not None and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+def get_token_key(user):
+    # read first: only the very first login for a user writes a token
+    key = Token.objects.filter(user=user).values_list('key', flat=True).first()
+    if key is None:
+        key = Token.objects.get_or_create(user=user)[0].key
+    return key
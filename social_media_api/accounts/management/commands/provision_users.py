@@ -0,0 +1,40 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import provision_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users and auth tokens in bulk from a CSV file with username,email and '
+        'password or password_hash columns; rows with a password_hash are not hashed again'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes (defaults to CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='') as f:
+                # empty cells count as missing, so a row can fill either password column
+                rows = [{key: value for key, value in row.items() if value} for row in csv.DictReader(f)]
+        except OSError as exc:
+            raise CommandError(exc)
+
+        started = time.perf_counter()
+        result = provision_users(rows, chunk_size=options['chunk_size'], workers=options['workers'])
+        elapsed = time.perf_counter() - started
+
+        for username in result['duplicates']:
+            self.stdout.write(f'duplicate: {username}')
+        for invalid in result['invalid']:
+            self.stdout.write(f"invalid row {invalid['row'] + 2}: {dict(invalid['errors'])}")
+        created = len(result['created'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} users in {elapsed:.1f}s ({created / max(elapsed, 1e-9):.0f}/s), '
+            f"{len(result['duplicates'])} duplicates, {len(result['invalid'])} invalid"
+        ))
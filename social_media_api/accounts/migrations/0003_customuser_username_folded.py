@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+def fold_usernames(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    for user in CustomUser.objects.only('id', 'username').iterator(chunk_size=2000):
+        CustomUser.objects.filter(pk=user.pk).update(username_folded=user.username.casefold())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_customuser_feed_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='username_folded',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(fold_usernames, migrations.RunPython.noop),
+    ]
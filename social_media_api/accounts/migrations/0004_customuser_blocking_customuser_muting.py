@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_username_folded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='blocking',
+            field=models.ManyToManyField(blank=True, related_name='blocked_by', to='accounts.customuser'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='muting',
+            field=models.ManyToManyField(blank=True, related_name='muted_by', to='accounts.customuser'),
+        ),
+    ]
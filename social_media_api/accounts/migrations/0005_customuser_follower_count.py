@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def count_followers(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    Follow = CustomUser.following.through
+    followers = (
+        Follow.objects.filter(to_customuser=OuterRef('pk'))
+        .values('to_customuser').annotate(count=Count('*')).values('count')
+    )
+    CustomUser.objects.filter(pk__in=Follow.objects.values('to_customuser')).update(follower_count=Subquery(followers))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_blocking_customuser_muting'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['username_folded', 'follower_count'], name='user_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['-follower_count', 'username_folded'], name='user_popular_idx'),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,14 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import AbstractUser
 
+
+def fold_username(username):
+    # the one case folding used for search; bulk inserts skip save() and call it themselves
+    return username.casefold()
+
+
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
@@ -11,10 +19,58 @@ class CustomUser(AbstractUser):
         related_name='followers',
         blank=True
     )
+    blocking = models.ManyToManyField(
+        'self',
+        symmetrical=False,
+        related_name='blocked_by',
+        blank=True
+    )
+    muting = models.ManyToManyField(
+        'self',
+        symmetrical=False,
+        related_name='muted_by',
+        blank=True
+    )
+
+    # last time the home feed was read, used for the unread badge
+    feed_seen_at = models.DateTimeField(null=True, blank=True)
+    # case-folded copy of username so prefix search can range-scan an index
+    username_folded = models.CharField(max_length=150, db_index=True, editable=False, default='')
+    # kept by accounts/signals.py so search can rank without counting follows
+    follower_count = models.PositiveIntegerField(default=0, editable=False)
 
     groups = models.ManyToManyField('auth.Group', related_name='customuser_groups', blank=True)
     user_permissions = models.ManyToManyField('auth.Permission', related_name='customuser_permissions', blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # prefix search: a narrow prefix range-scans the first, a broad one
+            # walks the second from the most followed down (accounts/search.py)
+            models.Index(fields=['username_folded', 'follower_count'], name='user_search_idx'),
+            models.Index(fields=['-follower_count', 'username_folded'], name='user_popular_idx'),
+        ]
+
+    @classmethod
+    def add_followers(cls, counts):
+        """Apply {user id: change} to follower_count."""
+        by_change = {}
+        for pk, change in counts.items():
+            if change:
+                by_change.setdefault(change, []).append(pk)
+        for change, ids in by_change.items():
+            cls.objects.filter(pk__in=ids).update(follower_count=Greatest(F('follower_count') + change, 0))
+
+    def save(self, *args, **kwargs):
+        self.username_folded = fold_username(self.username)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # follower_count only moves through add_followers(); writing back
+            # the copy loaded with this instance would undo follows since then
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'follower_count'
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username
 
@@ -0,0 +1,177 @@
+import bisect
+import threading
+
+from django.conf import settings
+
+from .models import CustomUser, fold_username
+
+
+MAX_LIMIT = 50
+
+# Prefixes with more matches than this are answered by walking the most
+# followed users first and stopping at `limit` hits, which is quick because
+# so many users match; fewer matches are cheaper to range-scan and sort.
+BROAD_PREFIX_MATCHES = 1000
+
+
+def prefix_upper_bound(prefix):
+    # smallest string greater than every string starting with `prefix`
+    return prefix[:-1] + chr(min(ord(prefix[-1]) + 1, 0x10FFFF))
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        # best matches in this subtree: (-follower_count, username_folded, id, username)
+        self.top = []
+
+
+class UsernameTrie:
+    """
+    Case-folded username trie where every node keeps the `top_k` most followed
+    users below it, so a prefix lookup costs one walk down len(prefix) nodes.
+    """
+
+    def __init__(self, top_k=50):
+        self.top_k = top_k
+        self.root = _Node()
+        self.entries = {}  # user id -> its entry, to find it again on rename or delete
+        self._lock = threading.Lock()
+
+    def insert(self, user_id, username, follower_count=0):
+        folded = fold_username(username)
+        entry = (-follower_count, folded, user_id, username)
+        with self._lock:
+            self.entries[user_id] = entry
+            node = self.root
+            self._offer(node, entry)
+            for char in folded:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, entry)
+
+    def remove(self, user_id):
+        """
+        Take a user out. Returns False when a full node lost the user: the
+        next best match below it was never kept, so the trie is now short.
+        """
+        with self._lock:
+            entry = self.entries.pop(user_id, None)
+            if entry is None:
+                return True
+            path = [self.root]
+            for char in entry[1]:
+                path.append(path[-1].children[char])
+            complete = True
+            for node in path:
+                i = bisect.bisect_left(node.top, entry)
+                if i < len(node.top) and node.top[i] == entry:
+                    complete = complete and len(node.top) < self.top_k
+                    del node.top[i]
+            return complete
+
+    def rename(self, user_id, username):
+        entry = self.entries.get(user_id)
+        if entry is None or entry[3] == username:
+            return True
+        complete = self.remove(user_id)
+        self.insert(user_id, username, -entry[0])
+        return complete
+
+    def set_followers(self, user_id, follower_count):
+        entry = self.entries.get(user_id)
+        if entry is None or -entry[0] == follower_count:
+            return True
+        complete = self.remove(user_id)
+        self.insert(user_id, entry[3], follower_count)
+        # moving up never pushes anyone out of a node the user was already in
+        return complete or follower_count > -entry[0]
+
+    def _offer(self, node, entry):
+        if len(node.top) < self.top_k or entry < node.top[-1]:
+            bisect.insort(node.top, entry)
+            del node.top[self.top_k:]
+
+    def search(self, prefix, limit):
+        node = self.root
+        for char in fold_username(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [
+            {'id': user_id, 'username': username, 'follower_count': -followers}
+            for followers, _, user_id, username in node.top[:limit]
+        ]
+
+
+_trie = None
+_trie_lock = threading.Lock()
+
+
+def get_username_trie():
+    """Return the in-memory snapshot, building it on first use when enabled."""
+    global _trie
+    if not getattr(settings, 'USER_SEARCH_TRIE', False):
+        return None
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                trie = UsernameTrie(top_k=MAX_LIMIT)
+                users = CustomUser.objects.values_list('id', 'username', 'follower_count')
+                for user_id, username, followers in users.iterator(chunk_size=10000):
+                    trie.insert(user_id, username, followers)
+                _trie = trie
+    return _trie
+
+
+def add_to_username_trie(user):
+    # only keep an already built snapshot up to date, never build one here
+    if _trie is not None:
+        _trie.insert(user.pk, user.username)
+
+
+# a snapshot that can't be patched is dropped and rebuilt on next use
+def rename_in_username_trie(user):
+    if _trie is not None and not _trie.rename(user.pk, user.username):
+        reset_username_trie()
+
+
+def recount_in_username_trie(changes):
+    """Pick up follower_count for the users in `changes` after a follow or unfollow."""
+    trie = _trie
+    if trie is None or not changes:
+        return
+    counts = CustomUser.objects.filter(pk__in=list(changes)).values_list('pk', 'follower_count')
+    for user_id, follower_count in counts:
+        if not trie.set_followers(user_id, follower_count):
+            reset_username_trie()
+            return
+
+
+def remove_from_username_trie(user_id):
+    if _trie is not None and not _trie.remove(user_id):
+        reset_username_trie()
+
+
+def reset_username_trie():
+    global _trie
+    _trie = None
+
+
+def search_users(prefix, limit=10):
+    folded = fold_username(prefix)
+    limit = max(1, min(limit, MAX_LIMIT))
+    if not folded:
+        return []
+
+    trie = get_username_trie()
+    if trie is not None:
+        return trie.search(folded, limit)
+
+    users = CustomUser.objects.filter(username_folded__gte=folded, username_folded__lt=prefix_upper_bound(folded))
+    if users[BROAD_PREFIX_MATCHES:BROAD_PREFIX_MATCHES + 1].exists():
+        # LIKE can't use the username index, so SQLite reads user_popular_idx in order
+        users = CustomUser.objects.filter(username_folded__startswith=folded)
+    users = users.order_by('-follower_count', 'username_folded')
+    return list(users.values('id', 'username', 'follower_count')[:limit])
@@ -2,9 +2,15 @@
         #IMPORT ESSENTILAS
 
 from rest_framework import serializers
+from rest_framework.exceptions import Throttled
 from .models import CustomUser
 from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import identify_hasher
 from rest_framework.authtoken.models import Token
+from .login import (
+    LoginUnavailable, Overloaded, clear_failures, get_config,
+    get_token_key, is_locked_out, record_failure,
+)
 
 
 class RegisterSerializer(serializers.Serializer):
@@ -21,17 +27,53 @@ class RegisterSerializer(serializers.Serializer):
         Token.objects.create(user=user)
         return user
 
+# A row of a bulk import: a plain password, hashed on import, or one
+# already hashed by a Django site (e.g. exported from another install),
+# which is stored as is and costs no hashing at all.
+class ProvisionSerializer(RegisterSerializer):
+    password = serializers.CharField(max_length=30, required=False)
+    password_hash = serializers.CharField(max_length=128, required=False)
+
+    def validate_password_hash(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError('Not a password hash this site can check.')
+        return value
+
+    def validate(self, data):
+        if ('password' in data) == ('password_hash' in data):
+            raise serializers.ValidationError('Give either password or password_hash.')
+        return data
+
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
 
     def validate(self, data):
-        user = authenticate(username=data['username'], password=data['password'])
+        request = self.context.get('request')
+        ip = request.META.get('REMOTE_ADDR', '') if request else ''
+        # repeat offenders are turned away before any hashing happens
+        if is_locked_out(data['username'], ip):
+            raise Throttled(wait=get_config()['FAILURE_WINDOW'], detail='Too many failed login attempts.')
+
+        try:
+            # hashed on the login pool by accounts.login.PooledModelBackend
+            user = authenticate(request, username=data['username'], password=data['password'])
+        except (Overloaded, TimeoutError):
+            raise LoginUnavailable()
+
         if user:
-            Token, created = Token.objects.get_or_create(user=user)
+            clear_failures(data['username'])
             return {
                 'user': user,
-                'token': Token.key
+                'token': get_token_key(user)
             }
+        record_failure(data['username'], ip)
         raise serializers.ValidationError('Invalid Credentials')
-    
+
+
+class UserSearchSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    follower_count = serializers.IntegerField()
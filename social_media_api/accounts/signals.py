@@ -0,0 +1,69 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .blocking import forget_blocks, forget_mutes
+from .models import CustomUser
+from .search import (
+    add_to_username_trie, recount_in_username_trie, remove_from_username_trie, rename_in_username_trie,
+)
+
+
+@receiver(post_save, sender=CustomUser)
+def index_new_user(sender, instance, created, **kwargs):
+    if created:
+        add_to_username_trie(instance)
+    else:
+        rename_in_username_trie(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+def unindex_deleted_user(sender, instance, **kwargs):
+    remove_from_username_trie(instance.pk)
+
+
+def _changed_user_ids(instance, action, pk_set, relation):
+    if action == 'pre_clear':
+        # pk_set isn't sent for clear(), so collect the other side up front
+        pk_set = set(getattr(instance, relation).values_list('id', flat=True))
+    return [instance.pk, *(pk_set or ())]
+
+
+@receiver(m2m_changed, sender=CustomUser.blocking.through)
+def refresh_block_sets(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        relation = 'blocked_by' if reverse else 'blocking'
+        forget_blocks(*_changed_user_ids(instance, action, pk_set, relation))
+
+
+@receiver(m2m_changed, sender=CustomUser.muting.through)
+def refresh_mute_sets(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        relation = 'muted_by' if reverse else 'muting'
+        forget_mutes(*_changed_user_ids(instance, action, pk_set, relation))
+
+
+@receiver(m2m_changed, sender=CustomUser.following.through)
+def count_followers(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        # add() only reports the follows it actually created
+        changes = {instance.pk: len(pk_set)} if reverse else dict.fromkeys(pk_set, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() reports every pk it was given, followed or not, so look up
+        # the rows that are about to go while they are still there
+        if reverse:
+            rows = sender.objects.filter(to_customuser=instance.pk)
+            if action == 'pre_remove':
+                rows = rows.filter(from_customuser__in=pk_set)
+            instance._follower_changes = {instance.pk: -rows.count()}
+        else:
+            rows = sender.objects.filter(from_customuser=instance.pk)
+            if action == 'pre_remove':
+                rows = rows.filter(to_customuser__in=pk_set)
+            instance._follower_changes = dict.fromkeys(rows.values_list('to_customuser', flat=True), -1)
+        return
+    elif action in ('post_remove', 'post_clear'):
+        changes = instance.__dict__.pop('_follower_changes', {})
+    else:
+        return
+    CustomUser.add_followers(changes)
+    recount_in_username_trie(changes)
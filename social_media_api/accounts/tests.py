@@ -1,3 +1,293 @@
-from django.test import TestCase
+import asyncio
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from .blocking import is_blocked
+from .login import HashingPool, Overloaded
+from .models import CustomUser
+from . import provisioning
+from .provisioning import provision_users
+from .search import UsernameTrie, reset_username_trie, search_users
+
+
+class UserSearchTests(APITestCase):
+    def setUp(self):
+        reset_username_trie()
+        self.alice = CustomUser.objects.create_user(username='Alice', password='testpass')
+        self.alina = CustomUser.objects.create_user(username='alina', password='testpass')
+        self.bob = CustomUser.objects.create_user(username='bob', password='testpass')
+        self.bob.following.add(self.alina)
+
+    def tearDown(self):
+        reset_username_trie()
+
+    def test_prefix_is_case_insensitive_and_ranked_by_followers(self):
+        response = self.client.get(reverse('user-search'), {'q': 'AL'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['username'] for row in response.data], ['alina', 'Alice'])
+        self.assertEqual(response.data[0]['follower_count'], 1)
+
+    def test_limit(self):
+        response = self.client.get(reverse('user-search'), {'q': 'al', 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+
+    def test_trie_matches_db_and_picks_up_new_users(self):
+        db_results = search_users('al')
+        with self.settings(USER_SEARCH_TRIE=True):
+            self.assertEqual(search_users('al'), db_results)
+
+            CustomUser.objects.create_user(username='Alfred', password='testpass')
+            with self.assertNumQueries(0):
+                results = search_users('alf')
+        self.assertEqual([row['username'] for row in results], ['Alfred'])
+
+    def test_trie_follows_renames_and_deletes(self):
+        with self.settings(USER_SEARCH_TRIE=True):
+            search_users('al')
+            self.alina.username = 'Carol'
+            self.alina.save()
+            self.alice.delete()
+            with self.assertNumQueries(0):
+                self.assertEqual(search_users('al'), [])
+                self.assertEqual(search_users('car'), [{'id': self.alina.pk, 'username': 'Carol', 'follower_count': 1}])
+
+    def test_follower_count_follows_follows_and_unfollows(self):
+        stale = CustomUser.objects.get(pk=self.bob.pk)
+        self.alice.following.add(self.alina, self.bob)
+        self.alice.following.add(self.alina)  # already followed
+        self.bob.following.remove(self.alina)
+        self.bob.following.remove(self.alina)  # no longer followed
+        self.bob.followers.add(self.alina)
+        stale.bio = 'saved after the follows'
+        stale.save()
+
+        counts = dict(CustomUser.objects.values_list('username', 'follower_count'))
+        self.assertEqual(counts, {'Alice': 0, 'alina': 1, 'bob': 2})
+
+        self.alina.followers.clear()
+        self.assertEqual(CustomUser.objects.get(pk=self.alina.pk).follower_count, 0)
+
+    def test_trie_picks_up_follows(self):
+        with self.settings(USER_SEARCH_TRIE=True):
+            search_users('al')
+            self.alice.followers.add(self.bob)
+            self.bob.following.add(self.alice.pk)
+            self.alice.followers.add(self.alina)
+            self.bob.following.remove(self.alina)
+            with self.assertNumQueries(0):
+                results = search_users('al')
+        self.assertEqual(
+            [(row['username'], row['follower_count']) for row in results], [('Alice', 2), ('alina', 0)],
+        )
+
+    def test_full_trie_node_is_rebuilt_after_delete(self):
+        trie = UsernameTrie(top_k=1)
+        trie.insert(1, 'alice', 2)
+        trie.insert(2, 'alina', 1)
+        self.assertEqual([row['id'] for row in trie.search('al', 5)], [1])
+        # alina was never kept above 'ali', so the trie can't answer 'al' any more
+        self.assertFalse(trie.remove(1))
+        self.assertTrue(UsernameTrie(top_k=5).remove(1))
+
+
+class BlockMuteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.kelvin = CustomUser.objects.create_user(username='kelvin', password='testpass')
+        self.troll = CustomUser.objects.create_user(username='troll', password='testpass')
+
+    def test_blocked_user_cannot_follow(self):
+        self.troll.following.add(self.kelvin)
+        self.client.force_authenticate(self.kelvin)
+        self.client.post(reverse('block-user', args=[self.troll.pk]))
+
+        self.assertFalse(self.troll.following.filter(pk=self.kelvin.pk).exists())
+        self.client.force_authenticate(self.troll)
+        response = self.client.post(reverse('follow-user-by-id', args=[self.kelvin.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unblock_clears_cached_set(self):
+        self.kelvin.blocking.add(self.troll)
+        self.assertTrue(is_blocked(self.troll.pk, self.kelvin.pk))
+
+        self.kelvin.blocking.remove(self.troll)
+        self.assertFalse(is_blocked(self.troll.pk, self.kelvin.pk))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_user_model().objects.create_user(username='kelvin', password='testpass')
+
+    def login(self, password):
+        return self.client.post('/login/', {'username': 'kelvin', 'password': password})
+
+    def test_repeat_login_reads_existing_token(self):
+        token = self.login('testpass').data['token']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login('testpass')
+        self.assertEqual(response.data['token'], token)
+        self.assertFalse([q for q in queries if q['sql'].startswith('INSERT')])
+
+    @override_settings(LOGIN_GATE={'MAX_FAILURES_PER_USER': 2})
+    def test_repeat_offender_is_cut_off_before_hashing(self):
+        for _ in range(2):
+            self.assertEqual(self.login('wrong').status_code, 400)
+
+        with mock.patch('accounts.login.check_password') as check:
+            response = self.login('testpass')
+        self.assertEqual(response.status_code, 429)
+        check.assert_not_called()
+
+    def test_async_login_matches_sync_login(self):
+        token = self.login('testpass').data['token']
+        url = reverse('login-async')
+
+        response = self.client.post(url, {'username': 'kelvin', 'password': 'testpass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], token)
+        self.assertEqual(self.client.post(url, {'username': 'kelvin', 'password': 'wrong'}).status_code, 400)
+
+    def test_async_login_rejects_bad_json_with_400(self):
+        url = reverse('login-async')
+        for body in ('{"username": ', '[]', '"kelvin"'):
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_failed_logins_go_through_authenticate(self):
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials['username'])
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        self.login('wrong')
+        self.client.post(reverse('login-async'), {'username': 'kelvin', 'password': 'wrong'})
+        self.assertEqual(failures, ['kelvin', 'kelvin'])
+
+    def test_async_login_rejects_when_pool_is_full(self):
+        pool = HashingPool(workers=1, queue_size=0, timeout=1)
+        release = threading.Event()
+        pool.submit(release.wait)
+        try:
+            with mock.patch('accounts.login.get_hashing_pool', return_value=pool):
+                response = self.client.post(reverse('login-async'), {'username': 'kelvin', 'password': 'testpass'})
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 503)
+
+    def test_arun_awaits_the_pool(self):
+        pool = HashingPool(workers=1, queue_size=0, timeout=1)
+        self.assertEqual(asyncio.run(pool.arun(len, 'abc')), 3)
+
+    def test_full_pool_rejects_instead_of_queueing(self):
+        pool = HashingPool(workers=1, queue_size=0, timeout=1)
+        release = threading.Event()
+        pool.submit(release.wait)
+        try:
+            with self.assertRaises(Overloaded):
+                pool.submit(len, 'x')
+        finally:
+            release.set()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(TestCase):
+    def test_duplicates_are_reported_without_aborting(self):
+        User = get_user_model()
+        User.objects.create_user(username='taken', password='testpass')
+        rows = [
+            {'username': f'member{i}', 'email': f'member{i}@example.com', 'password': 'secret123'}
+            for i in range(5)
+        ]
+        rows += [
+            {'username': 'taken', 'email': 'taken@example.com', 'password': 'secret123'},
+            {'username': 'member0', 'email': 'again@example.com', 'password': 'secret123'},
+            {'username': 'nopassword', 'email': 'nope@example.com'},
+        ]
+
+        result = provision_users(rows, chunk_size=2, workers=2)
+
+        self.assertEqual(len(result['created']), 5)
+        self.assertCountEqual(result['duplicates'], ['taken', 'member0'])
+        self.assertEqual(result['invalid'][0]['row'], 7)
+        member = User.objects.get(username='member3')
+        self.assertTrue(member.check_password('secret123'))
+        self.assertTrue(Token.objects.filter(user=member).exists())
+
+    def test_names_taken_again_during_retry_are_dropped_too(self):
+        User = get_user_model()
+        insert_chunk, racers = provisioning._insert_chunk, ['member1', 'member2']
+
+        def racing_insert(users):
+            # another request registers one of the names before each attempt
+            if racers:
+                User.objects.create_user(username=racers.pop(0), password='testpass')
+            return insert_chunk(users)
+
+        rows = [
+            {'username': f'member{i}', 'email': f'member{i}@example.com', 'password': 'secret123'}
+            for i in range(4)
+        ]
+        with mock.patch.object(provisioning, '_insert_chunk', racing_insert):
+            result = provision_users(rows, workers=1)
+
+        self.assertEqual(sorted(result['created']), ['member0', 'member3'])
+        self.assertEqual(result['duplicates'], ['member1', 'member2'])
+
+    def test_endpoint_hashes_in_process_and_caps_rows(self):
+        admin = get_user_model().objects.create_superuser(username='admin', password='testpass')
+        client = APIClient()
+        client.force_authenticate(admin)
+        url = reverse('register-bulk')
+        rows = [{'username': 'member', 'email': 'member@example.com', 'password': 'secret123'}]
+
+        with mock.patch.object(provisioning, 'ProcessPoolExecutor') as pool:
+            response = client.post(url, {'users': rows}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        pool.assert_not_called()
+
+        too_many = rows * 1001
+        response = client.post(url, {'users': too_many}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_password_hashes_are_stored_without_hashing(self):
+        rows = [
+            {'username': 'imported', 'email': 'imported@example.com', 'password_hash': make_password('secret123')},
+            {'username': 'garbled', 'email': 'garbled@example.com', 'password_hash': 'plaintext'},
+            {'username': 'both', 'email': 'both@example.com', 'password': 'x', 'password_hash': make_password('x')},
+        ]
+        with mock.patch.object(provisioning, 'make_password') as hasher:
+            result = provision_users(rows, workers=1)
+        hasher.assert_not_called()
+        self.assertEqual(result['created'], ['imported'])
+        self.assertEqual([invalid['row'] for invalid in result['invalid']], [1, 2])
+        self.assertTrue(get_user_model().objects.get(username='imported').check_password('secret123'))
+
+    def test_rows_past_the_time_limit_are_skipped(self):
+        rows = [
+            {'username': f'member{i}', 'email': f'member{i}@example.com', 'password': 'secret123'}
+            for i in range(3)
+        ]
+        rows.append({'username': 'imported', 'email': 'imported@example.com', 'password_hash': make_password('x')})
+        result = provision_users(rows, workers=1, time_limit=0)
+
+        self.assertEqual(result['created'], ['imported'])
+        self.assertEqual(result['skipped'], [0, 1, 2])
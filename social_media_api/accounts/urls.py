@@ -1,9 +1,19 @@
 from django.urls import path
-from .views import RegisterView, LoginView, FollowUserView, UnfollowUserView
+from .views import (
+    RegisterView, BulkRegisterView, LoginView, AsyncLoginView, FollowUserView, UnfollowUserView, UserSearchView,
+    BlockUserView, UnblockUserView, MuteUserView, UnmuteUserView,
+)
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
+    path('register/bulk/', BulkRegisterView.as_view(), name='register-bulk'),
     path('login/', LoginView.as_view(), name='login'),
+    path('login/async/', AsyncLoginView.as_view(), name='login-async'),
     path('follow/<int:user_id>/', FollowUserView.as_view(), name='follow-user-by-id'),
     path('unfollow/<int:user_id>/', UnfollowUserView.as_view(), name='unfollow-user-by-id'),
+    path('block/<int:user_id>/', BlockUserView.as_view(), name='block-user'),
+    path('unblock/<int:user_id>/', UnblockUserView.as_view(), name='unblock-user'),
+    path('mute/<int:user_id>/', MuteUserView.as_view(), name='mute-user'),
+    path('unmute/<int:user_id>/', UnmuteUserView.as_view(), name='unmute-user'),
+    path('users/search/', UserSearchView.as_view(), name='user-search'),
 ]
\ No newline at end of file
@@ -1,11 +1,26 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 
+from .blocking import is_blocked
+from .login import (
+    LoginUnavailable, Overloaded, clear_failures, get_config,
+    get_token_key, is_locked_out, record_failure,
+)
 from .models import CustomUser
-from .serializers import RegisterSerializer, LoginSerializer
+from .provisioning import provision_users
+from .search import search_users
+from .serializers import RegisterSerializer, LoginSerializer, UserSearchSerializer
 
 # Register a new user
 class RegisterView(generics.GenericAPIView):
@@ -24,7 +39,36 @@ class RegisterView(generics.GenericAPIView):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-# Login an existing user
+# Create many users at once, e.g. when onboarding an organization. Plain
+# passwords are hashed in this process at about 0.4 s each, so a request
+# stops hashing after time_limit seconds and hands the rows it didn't get
+# to back as "skipped", to be sent again. Rows with a password_hash cost
+# no hashing; large imports with plain passwords go through the
+# provision_users command, which hashes in parallel.
+class BulkRegisterView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    max_rows = 1000
+    time_limit = 5
+
+    def post(self, request):
+        rows = request.data.get('users')
+        if not isinstance(rows, list):
+            return Response({'message': 'Expected a list under "users"'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.max_rows:
+            return Response(
+                {'message': f'At most {self.max_rows} users per request; use the provision_users command for more'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = provision_users(rows, workers=1, time_limit=self.time_limit)
+        return Response({
+            'created': len(result['created']),
+            'duplicates': result['duplicates'],
+            'invalid': result['invalid'],
+            'skipped': result['skipped'],
+        }, status=status.HTTP_201_CREATED)
+
+# Login an existing user. The hashing is bounded by the login pool, but the
+# request thread still waits for it here; AsyncLoginView below doesn't.
 class LoginView(generics.GenericAPIView):
     permission_classes = [AllowAny]
     serializer_class = LoginSerializer
@@ -41,33 +85,154 @@ class LoginView(generics.GenericAPIView):
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# The same login for ASGI deployments. DRF views can't be async, so this is
+# a plain Django view: while the password is hashed on the pool the request
+# awaits it on the event loop instead of holding a worker thread.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLoginView(View):
+    async def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or '{}')
+            except ValueError:
+                return JsonResponse({'detail': 'Malformed JSON.'}, status=400)
+            if not isinstance(data, dict):
+                return JsonResponse({'detail': 'Expected a JSON object.'}, status=400)
+        else:
+            data = request.POST
+        username, password = data.get('username'), data.get('password')
+        if not username or not password:
+            return JsonResponse({'non_field_errors': ['Username and password are required.']}, status=400)
+
+        ip = request.META.get('REMOTE_ADDR', '')
+        if await sync_to_async(is_locked_out)(username, ip):
+            window = get_config()['FAILURE_WINDOW']
+            return JsonResponse(
+                {'detail': 'Too many failed login attempts.'}, status=429, headers={'Retry-After': str(window)},
+            )
+
+        try:
+            user = await aauthenticate(request, username=username, password=password)
+        except (Overloaded, TimeoutError):
+            return JsonResponse({'detail': LoginUnavailable.default_detail}, status=LoginUnavailable.status_code)
+
+        if user is None:
+            await sync_to_async(record_failure)(username, ip)
+            return JsonResponse({'non_field_errors': ['Invalid Credentials']}, status=400)
+        await sync_to_async(clear_failures)(username)
+        return JsonResponse({
+            'message': 'Login successful',
+            'username': user.username,
+            'token': await sync_to_async(get_token_key)(user),
+        })
+
 # Follow another user
 class FollowUserView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = CustomUser.objects.all()  # Required for checker
 
-    def post(self, request, username):
+    def post(self, request, user_id):
         try:
-            user_to_follow = CustomUser.objects.get(username=username)
+            user_to_follow = CustomUser.objects.get(pk=user_id)
         except CustomUser.DoesNotExist:
             return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         if user_to_follow == request.user:
             return Response({'message': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
 
+        if is_blocked(request.user.pk, user_to_follow.pk):
+            return Response({'message': 'You cannot follow this user'}, status=status.HTTP_403_FORBIDDEN)
+
         request.user.following.add(user_to_follow)
-        return Response({'message': f'You are now following {username}'}, status=status.HTTP_200_OK)
+        return Response({'message': f'You are now following {user_to_follow.username}'}, status=status.HTTP_200_OK)
 
 # Unfollow a user
 class UnfollowUserView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = CustomUser.objects.all()  # Required for checker
 
-    def post(self, request, username):
+    def post(self, request, user_id):
         try:
-            user_to_unfollow = CustomUser.objects.get(username=username)
+            user_to_unfollow = CustomUser.objects.get(pk=user_id)
         except CustomUser.DoesNotExist:
             return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         request.user.following.remove(user_to_unfollow)
-        return Response({'message': f'You have unfollowed {username}'}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({'message': f'You have unfollowed {user_to_unfollow.username}'}, status=status.HTTP_200_OK)
+
+# Block a user, which also drops any follow between the two of you
+class BlockUserView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+
+    def post(self, request, user_id):
+        try:
+            user_to_block = CustomUser.objects.get(pk=user_id)
+        except CustomUser.DoesNotExist:
+            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if user_to_block == request.user:
+            return Response({'message': 'You cannot block yourself'}, status=status.HTTP_400_BAD_REQUEST)
+
+        request.user.blocking.add(user_to_block)
+        request.user.following.remove(user_to_block)
+        user_to_block.following.remove(request.user)
+        return Response({'message': f'You have blocked {user_to_block.username}'}, status=status.HTTP_200_OK)
+
+# Unblock a user
+class UnblockUserView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+
+    def post(self, request, user_id):
+        try:
+            user_to_unblock = CustomUser.objects.get(pk=user_id)
+        except CustomUser.DoesNotExist:
+            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        request.user.blocking.remove(user_to_unblock)
+        return Response({'message': f'You have unblocked {user_to_unblock.username}'}, status=status.HTTP_200_OK)
+
+# Mute a user, hiding their posts from your feed
+class MuteUserView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+
+    def post(self, request, user_id):
+        try:
+            user_to_mute = CustomUser.objects.get(pk=user_id)
+        except CustomUser.DoesNotExist:
+            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if user_to_mute == request.user:
+            return Response({'message': 'You cannot mute yourself'}, status=status.HTTP_400_BAD_REQUEST)
+
+        request.user.muting.add(user_to_mute)
+        return Response({'message': f'You have muted {user_to_mute.username}'}, status=status.HTTP_200_OK)
+
+# Unmute a user
+class UnmuteUserView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+
+    def post(self, request, user_id):
+        try:
+            user_to_unmute = CustomUser.objects.get(pk=user_id)
+        except CustomUser.DoesNotExist:
+            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        request.user.muting.remove(user_to_unmute)
+        return Response({'message': f'You have unmuted {user_to_unmute.username}'}, status=status.HTTP_200_OK)
+
+# Username prefix search for autocomplete, most followed first
+class UserSearchView(generics.GenericAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = UserSearchSerializer
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({'message': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        users = search_users(request.query_params.get('q', ''), limit)
+        return Response(self.get_serializer(users, many=True).data, status=status.HTTP_200_OK)
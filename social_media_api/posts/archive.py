@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+
+# Rows are moved with INSERT ... SELECT and plain DELETEs: bodies are copied
+# still compressed, auto_now fields keep their values, and no model signals
+# fire (so archiving never releases attachments or looks like a new post).
+
+# default when settings.ARCHIVE_AFTER_DAYS isn't set, read on every run
+ARCHIVE_AFTER_DAYS = 365
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _copy(source_table, source_columns, target_table, target_columns, ids):
+    # source_columns[0] is the column the ids are matched against
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    _execute(
+        f'INSERT INTO {quote(target_table)} ({", ".join(map(quote, target_columns))}) '
+        f'SELECT {", ".join(map(quote, source_columns))} FROM {quote(source_table)} '
+        f'WHERE {quote(source_columns[0])} IN ({placeholders})',
+        ids,
+    )
+
+
+def _delete(table, column, ids):
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    _execute(f'DELETE FROM {quote(table)} WHERE {quote(column)} IN ({placeholders})', ids)
+
+
+def _through(model):
+    # (post column, attachment column); the post column is named after the model
+    through = model.attachments.through
+    return through._meta.db_table, [f.column for f in through._meta.concrete_fields if f.name != 'id']
+
+
+def _move_posts(ids, source_post, source_comment, target_post, target_comment):
+    post_columns = [f.column for f in Post._meta.concrete_fields]
+    comment_columns = ['post_id'] + [f.column for f in Comment._meta.concrete_fields if f.column != 'post_id']
+    source_through, source_link = _through(source_post)
+    target_through, target_link = _through(target_post)
+
+    _copy(source_post._meta.db_table, post_columns, target_post._meta.db_table, post_columns, ids)
+    _copy(source_comment._meta.db_table, comment_columns, target_comment._meta.db_table, comment_columns, ids)
+    _copy(source_through, source_link, target_through, target_link, ids)
+
+    _delete(source_through, source_link[0], ids)
+    _delete(source_comment._meta.db_table, 'post_id', ids)
+    _delete(source_post._meta.db_table, 'id', ids)
+
+
+def archive_old_posts(older_than_days=None, batch_size=500):
+    """
+    Move posts older than the cutoff, with their comments, to the archive
+    tables. Posts with comments newer than the cutoff stay hot. Returns the
+    number of posts archived.
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    recent_comments = Comment.objects.filter(post=OuterRef('pk'), created_at__gte=cutoff)
+    candidates = (
+        Post.objects
+        .filter(created_at__lt=cutoff)
+        .exclude(Exists(recent_comments))
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+    archived = 0
+    while True:
+        ids = list(candidates[:batch_size])
+        if not ids:
+            return archived
+        with transaction.atomic():
+            _move_posts(ids, Post, Comment, ArchivedPost, ArchivedComment)
+        archived += len(ids)
+
+
+def restore_post(post_id):
+    """Move an archived post and its comments back to the hot tables."""
+    with transaction.atomic():
+        if not ArchivedPost.objects.filter(pk=post_id).exists():
+            return False
+        _move_posts([post_id], ArchivedPost, ArchivedComment, Post, Comment)
+    return True
+
+
+def restore_comment(comment_id):
+    post_id = ArchivedComment.objects.filter(pk=comment_id).values_list('post_id', flat=True).first()
+    return post_id is not None and restore_post(post_id)
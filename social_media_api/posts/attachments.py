@@ -0,0 +1,139 @@
+import hashlib
+import re
+
+from datetime import timedelta
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Attachment, local_storage
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# how long an upload may wait for a post to link it before it counts as unused
+UNUSED_AFTER = timedelta(days=1)
+
+# the only types attachments are stored and served as, by leading bytes;
+# the client's Content-Type is never trusted
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+IMAGE_TYPES = {content_type for _, content_type in IMAGE_SIGNATURES} | {'image/webp'}
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hashes each uploaded file as its chunks arrive and passes the data on
+    untouched, so the digest is ready as soon as the upload finishes.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self.hasher.hexdigest()
+        # let the next handler build the actual uploaded file
+        return None
+
+
+def image_type(uploaded_file):
+    """The raster image type the file's content starts with, or None."""
+    uploaded_file.seek(0)
+    head = uploaded_file.read(12)
+    uploaded_file.seek(0)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def store_upload(uploaded_file, sha256, content_type):
+    """
+    Return (attachment, created); known content returns the existing
+    attachment. Its ref_count only moves when a post links it.
+    `content_type` is the sniffed image type, see image_type().
+    """
+    existing = Attachment.objects.filter(sha256=sha256).first()
+    if existing is not None:
+        return existing, False
+
+    name = Attachment.storage_name(sha256)
+    if not local_storage.exists(name):
+        saved = local_storage.save(name, uploaded_file)
+        if saved != name:
+            # the same content was written under `name` meanwhile and the
+            # storage picked another name; nothing would ever point at it
+            local_storage.delete(saved)
+    try:
+        with transaction.atomic():
+            attachment = Attachment.objects.create(
+                sha256=sha256,
+                file=name,
+                size=uploaded_file.size,
+                content_type=content_type,
+            )
+    except IntegrityError:
+        # the same content finished uploading in another request first
+        return Attachment.objects.get(sha256=sha256), False
+    return attachment, True
+
+
+def delete_unused_attachments(older_than=UNUSED_AFTER):
+    """Remove uploads no post has linked since they were uploaded. Returns how many."""
+    unused = Attachment.objects.filter(ref_count=0, created_at__lt=timezone.now() - older_than)
+    count = 0
+    for attachment in unused.iterator():
+        attachment.remove()
+        count += 1
+    return count
+
+
+def parse_range(header, size):
+    """
+    Parse a single `bytes=` range into inclusive (start, end). Returns None
+    when the header should be ignored and raises ValueError when the range
+    can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # suffix range, the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(file, start, end, chunk_size=64 * 1024):
+    file.seek(start)
+    remaining = end - start + 1
+    try:
+        while remaining > 0:
+            data = file.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
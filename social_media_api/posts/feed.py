@@ -0,0 +1,95 @@
+import secrets
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts.blocking import visible_following_ids
+from common.metrics import record_cache
+from accounts.models import CustomUser
+from .models import Post
+
+
+# Unread counts are kept without touching followers when someone posts: each
+# author has a counter in the cache that a new post bumps once, and a
+# reader's cached count remembers the counters of the authors they saw, so a
+# read adds up how far those have moved. A missing or reset counter (or a
+# missing count) means it is unknown and the count is rebuilt from the db.
+# Follows, mutes and blocks change whose posts count, so those drop it too.
+#
+# All of this needs a cache shared by every process (memcached, Redis). With
+# the default local-memory cache each process keeps its own counters, and a
+# post made in one is never seen by readers served by another.
+def unread_key(user_id):
+    return f'feed-unread:{user_id}'
+
+
+def posted_key(author_id):
+    return f'feed-posted:{author_id}'
+
+
+# Counters start at a random multiple of ERA, so one recreated after an
+# eviction can't be mistaken for the one a reader compared against.
+ERA = 2 ** 32
+
+
+def record_new_post(post):
+    try:
+        cache.incr(posted_key(post.author_id))
+    except ValueError:
+        # no counter yet, so no reader is comparing against one
+        pass
+
+
+def _posted_counters(author_ids):
+    keys = {posted_key(author_id): author_id for author_id in author_ids}
+    counters = cache.get_many(keys)
+    missing = keys.keys() - counters.keys()
+    if missing:
+        for key in missing:
+            cache.add(key, secrets.randbelow(2 ** 31) * ERA, timeout=None)
+        counters.update(cache.get_many(missing))
+    return {keys[key]: value for key, value in counters.items()}
+
+
+def _posted_since(seen):
+    counters = cache.get_many([posted_key(author_id) for author_id in seen])
+    posted = 0
+    for author_id, value in seen.items():
+        current = counters.get(posted_key(author_id))
+        if current is None or not 0 <= current - value < ERA:
+            return None
+        posted += current - value
+    return posted
+
+
+def forget_unread_counts(*user_ids):
+    cache.delete_many([unread_key(user_id) for user_id in user_ids])
+
+
+def unread_count(user):
+    entry = cache.get(unread_key(user.pk))
+    posted = None if entry is None else _posted_since(entry[1])
+    record_cache('feed-unread', posted is not None)
+    if posted is not None:
+        return entry[0] + posted
+    authors = visible_following_ids(user)
+    # read before counting: a post made in between is counted twice rather
+    # than missed
+    seen = _posted_counters(authors)
+    posts = Post.objects.filter(author__in=authors)
+    if user.feed_seen_at:
+        posts = posts.filter(created_at__gt=user.feed_seen_at)
+    count = posts.count()
+    cache.set(unread_key(user.pk), (count, seen), timeout=None)
+    return count
+
+
+def mark_feed_read(user):
+    user.feed_seen_at = timezone.now()
+    CustomUser.objects.filter(pk=user.pk).update(feed_seen_at=user.feed_seen_at)
+    entry = cache.get(unread_key(user.pk))
+    if entry is None:
+        return
+    # start again from zero against the same authors
+    seen = _posted_counters(entry[1])
+    cache.set(unread_key(user.pk), (0, seen), timeout=None)
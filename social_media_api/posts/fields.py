@@ -0,0 +1,63 @@
+import zlib
+
+from django.db import models
+
+
+RAW = b'\x00'
+ZLIB = b'\x01'
+
+
+class CompressedTextField(models.TextField):
+    """
+    A TextField stored as a blob: one header byte saying how the body is
+    encoded, then the utf-8 text, zlib-compressed once it passes `threshold`
+    bytes. Python code, forms and serializers only ever see `str`.
+
+    The stored bytes can't be searched, so don't filter on this field with
+    text lookups like `icontains`.
+    """
+
+    def __init__(self, *args, threshold=256, level=6, **kwargs):
+        self.threshold = threshold
+        self.level = level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.threshold != 256:
+            kwargs['threshold'] = self.threshold
+        if self.level != 6:
+            kwargs['level'] = self.level
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        data = value.encode('utf-8')
+        if len(data) >= self.threshold:
+            compressed = zlib.compress(data, self.level)
+            if len(compressed) < len(data):
+                return ZLIB + compressed
+        return RAW + data
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, memoryview):
+            value = bytes(value)
+        if isinstance(value, bytes):
+            return decode(value)
+        # rows written before the column was compressed are still plain text
+        return super().to_python(value)
+
+
+def decode(data):
+    header, body = data[:1], data[1:]
+    if header == ZLIB:
+        body = zlib.decompress(body)
+    return body.decode('utf-8')
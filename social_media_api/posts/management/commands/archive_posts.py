@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.archive import archive_old_posts
+
+
+class Command(BaseCommand):
+    help = 'Move old posts and their comments out of the hot tables into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=None, help='Defaults to settings.ARCHIVE_AFTER_DAYS',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        archived = archive_old_posts(options['older_than_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} posts'))
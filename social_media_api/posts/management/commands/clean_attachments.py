@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.attachments import UNUSED_AFTER, delete_unused_attachments
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded attachments that no post has linked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=float, default=UNUSED_AFTER.total_seconds() / 3600)
+
+    def handle(self, *args, **options):
+        deleted = delete_unused_attachments(timedelta(hours=options['older_than_hours']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} unused attachments'))
@@ -0,0 +1,107 @@
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import CustomUser, fold_username
+from common.synthetic import TAGS, GenerateDataCommand, bulk_insert, explicit_timestamps, last_id, new_ids
+from posts.models import EXCERPT_LENGTH, Comment, Post
+
+
+def excerpt(content):
+    # same result as make_excerpt() for generated text (plain ascii), without
+    # Truncator's per-character unicode checks, which dominate the run time
+    if len(content) <= EXCERPT_LENGTH:
+        return content
+    return content[:EXCERPT_LENGTH - 1] + '…'
+
+
+class Command(GenerateDataCommand):
+    help = 'Fill the database with seeded synthetic users, follows, posts and comments'
+
+    counts = {'users': 10_000, 'posts': 100_000, 'comments': 300_000}
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--mean-followers', type=float, default=20)
+        parser.add_argument('--days', type=int, default=730, help='How far back posts go')
+
+    def generate(self, synthetic, counts, options):
+        using, chunk_size, seed = options['database'], options['chunk_size'], options['seed']
+
+        # every generated user has the password "password"; hashing it once keeps this fast
+        password = make_password('password', salt=f'synthetic{seed}')
+        after = last_id(CustomUser, using)
+        users = (
+            CustomUser(
+                username=f'user{seed}_{i}', username_folded=fold_username(f'user{seed}_{i}'),
+                email=f'user{seed}_{i}@example.com', password=password,
+            )
+            for i in range(counts['users'])
+        )
+        yield 'users', bulk_insert(CustomUser, users, chunk_size, using)
+        user_ids = new_ids(CustomUser, after, using)
+        if not user_ids:
+            return
+
+        # follower counts follow a power law, a handful of users are followed by most
+        Follow = CustomUser.following.through
+        follower_counts = synthetic.power_law(
+            len(user_ids), options['mean_followers'], maximum=len(user_ids) - 1,
+        )
+
+        def follows():
+            for followed, count in zip(user_ids, follower_counts):
+                for follower in synthetic.random.sample(user_ids, min(count + 1, len(user_ids))):
+                    if follower != followed and count:
+                        count -= 1
+                        yield Follow(from_customuser_id=follower, to_customuser_id=followed)
+
+        yield 'follows', bulk_insert(Follow, follows(), chunk_size, using)
+        # bulk inserts skip the m2m signal that keeps follower_count
+        followers = (
+            Follow.objects.filter(to_customuser=OuterRef('pk'))
+            .values('to_customuser').annotate(count=Count('*')).values('count')
+        )
+        CustomUser.objects.using(using).filter(pk__gt=after).update(follower_count=Coalesce(Subquery(followers), 0))
+
+        author_weights = synthetic.popularity(len(user_ids))
+        tag_weights = synthetic.popularity(len(TAGS))
+        post_times = synthetic.timestamps(counts['posts'], options['days'])
+
+        def posts():
+            for created_at in post_times:
+                tags = set(synthetic.pick(TAGS, tag_weights, synthetic.random.randint(0, 3)))
+                content = synthetic.body(tags=sorted(tags))
+                yield Post(
+                    author_id=synthetic.pick(user_ids, author_weights)[0],
+                    title=synthetic.title(), content=content, excerpt=excerpt(content),
+                    created_at=created_at, updated_at=created_at,
+                )
+
+        after = last_id(Post, using)
+        with explicit_timestamps(Post, Comment):
+            yield 'posts', bulk_insert(Post, posts(), chunk_size, using)
+            post_ids = new_ids(Post, after, using)
+            if not post_ids:
+                return
+            # a few posts draw most of the comments
+            post_weights = synthetic.popularity(len(post_ids))
+            post_starts = array('d', (created_at.timestamp() for created_at in post_times))
+            now = synthetic.now.timestamp()
+
+            def comments():
+                for _ in range(counts['comments']):
+                    index = synthetic.pick(range(len(post_ids)), post_weights)[0]
+                    created_at = synthetic.now.fromtimestamp(
+                        synthetic.random.uniform(post_starts[index], now), synthetic.now.tzinfo,
+                    )
+                    content = synthetic.body(median_words=15)
+                    yield Comment(
+                        post_id=post_ids[index], author_id=synthetic.pick(user_ids, author_weights)[0],
+                        content=content, excerpt=excerpt(content),
+                        created_at=created_at, updated_at=created_at,
+                    )
+
+            yield 'comments', bulk_insert(Comment, comments(), chunk_size, using)
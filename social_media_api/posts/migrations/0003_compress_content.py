@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:46
+
+import posts.fields
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+BATCH_SIZE = 500
+
+
+def compress_existing(apps, schema_editor):
+    # rewriting a row through the new field compresses it; walk by pk in batches
+    for model_name in ('Post', 'Comment'):
+        Model = apps.get_model('posts', model_name)
+        last_pk = 0
+        while True:
+            batch = list(Model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'content')[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                row.excerpt = Truncator(row.content).chars(200)
+            Model.objects.bulk_update(batch, ['content', 'excerpt'])
+            last_pk = batch[-1].pk
+
+
+def decompress_existing(apps, schema_editor):
+    # going back to a TextField, so write plain text with raw sql
+    connection = schema_editor.connection
+    for table in ('posts_post', 'posts_comment'):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, content FROM {table}')
+            rows = cursor.fetchall()
+        for pk, content in rows:
+            if isinstance(content, (bytes, memoryview)):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'UPDATE {table} SET content = %s WHERE id = %s',
+                        [posts.fields.decode(bytes(content)), pk],
+                    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_attachment_post_attachments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='content',
+            field=posts.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='content',
+            field=posts.fields.CompressedTextField(),
+        ),
+        migrations.RunPython(compress_existing, decompress_existing),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:57
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def links(through, field):
+    counts = (
+        through.objects.filter(attachment=OuterRef('pk')).order_by().values('attachment')
+        .annotate(n=Count(field)).values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def count_links(apps, schema_editor):
+    # ref_count used to count uploads; from here on it counts linking posts
+    Attachment = apps.get_model('posts', 'Attachment')
+    Post = apps.get_model('posts', 'Post')
+    ArchivedPost = apps.get_model('posts', 'ArchivedPost')
+    Attachment.objects.update(
+        ref_count=links(Post.attachments.through, 'post') + links(ArchivedPost.attachments.through, 'archivedpost'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attachment',
+            name='ref_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_links, migrations.RunPython.noop),
+    ]
@@ -1,26 +1,123 @@
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest, Now
+from django.utils.text import Truncator
 from accounts.models import CustomUser
+from .fields import CompressedTextField
+
+
+# Attachments always live on local disk so they can be served with byte ranges
+local_storage = FileSystemStorage()
+
+
+def attachment_storage():
+    return local_storage
+
+
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(text):
+    return Truncator(text).chars(EXCERPT_LENGTH)
+
+
+# bodies are compressed on disk, list views read the short excerpt column instead
+class ExcerptMixin:
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
 
 
 # Create your models here.
 
+# uploaded media, stored once per distinct content and shared between posts
+class Attachment(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(storage=attachment_storage)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    # posts (hot or archived) linking to this file, kept by posts/signals.py;
+    # uploads that never get linked are removed by delete_unused_attachments()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def storage_name(sha256):
+        return f'attachments/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+    @classmethod
+    def add_references(cls, counts):
+        """Apply {attachment id: change} to ref_count; files nothing links to any more are removed."""
+        by_change = {}
+        for pk, change in counts.items():
+            by_change.setdefault(change, []).append(pk)
+        for change, ids in by_change.items():
+            cls.objects.filter(pk__in=ids).update(ref_count=Greatest(F('ref_count') + change, 0))
+        released = [pk for pk, change in counts.items() if change < 0]
+        for attachment in cls.objects.filter(pk__in=released, ref_count=0):
+            attachment.remove()
+
+    def remove(self):
+        self.file.delete(save=False)
+        self.delete()
+
+    def __str__(self):
+        return self.sha256
+
 #models for post and comments 
-class Post(models.Model):
+class Post(ExcerptMixin, models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    content = models.TextField()
+    content = CompressedTextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
     title = models.CharField(max_length=100)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    attachments = models.ManyToManyField(Attachment, related_name='posts', blank=True)
 
     def __str__(self):
         return self.content
     
-class Comment(models.Model):
+class Comment(ExcerptMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    content = models.TextField()
+    content = CompressedTextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.content
\ No newline at end of file
+        return self.content
+
+
+# Cold storage for old posts and their comments (see posts/archive.py). Rows
+# keep their original ids and column values so they can be copied back as-is.
+class ArchivedPost(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    content = CompressedTextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    title = models.CharField(max_length=100)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    attachments = models.ManyToManyField(Attachment, related_name='+', blank=True)
+    archived_at = models.DateTimeField(db_default=Now())
+
+    def __str__(self):
+        return self.title
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name='comments')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    content = CompressedTextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(db_default=Now())
+
+    def __str__(self):
+        return self.excerpt
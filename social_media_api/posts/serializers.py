@@ -1,17 +1,42 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Post, Comment
+from .models import Attachment, Post, Comment
 
 
 
 class PostSerializer(serializers.ModelSerializer):
     class Meta:
         model = Post
-        fields = ['id', 'title', 'content', 'created_at', 'updated_at', 'author']
+        fields = ['id', 'title', 'content', 'created_at', 'updated_at', 'author', 'attachments']
+
+
+# list views return the stored excerpt so full bodies are never decompressed
+class PostListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'excerpt', 'created_at', 'updated_at', 'author', 'attachments']
 
 
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['id', 'content', 'created_at', 'updated_at', 'author', 'post']
+        # the author is whoever is signed in, see CommentViewSet.perform_create
+        read_only_fields = ['author']
+
+
+class CommentListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = ['id', 'excerpt', 'created_at', 'updated_at', 'author', 'post']
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Attachment
+        fields = ['id', 'sha256', 'size', 'content_type', 'url']
 
-    
\ No newline at end of file
+    def get_url(self, obj):
+        return reverse('attachment-file', args=[obj.sha256])
@@ -0,0 +1,77 @@
+from collections import Counter
+
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.models import CustomUser
+from .feed import forget_unread_counts, record_new_post
+from .models import ArchivedPost, Attachment, Post, Comment
+from .trending import aggregator, extract_hashtags
+
+
+@receiver(post_save, sender=Post)
+def record_post_event(sender, instance, created, update_fields, **kwargs):
+    if created:
+        aggregator.record('post', instance.pk, extract_hashtags(instance.content))
+    elif update_fields is None or 'content' in update_fields:
+        # an edit may change the hashtags that comments count towards
+        aggregator.update_post_hashtags(instance.pk, extract_hashtags(instance.content))
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        record_new_post(instance)
+
+
+# A cached unread count covers the authors that were visible when it was
+# taken, so whoever follows, mutes or blocks (or is blocked) counts afresh.
+@receiver(m2m_changed, sender=CustomUser.following.through)
+@receiver(m2m_changed, sender=CustomUser.muting.through)
+@receiver(m2m_changed, sender=CustomUser.blocking.through)
+def drop_unread_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set isn't sent for clear(), so collect the other side up front
+        side, other = ('to_customuser', 'from_customuser') if reverse else ('from_customuser', 'to_customuser')
+        pk_set = sender.objects.filter(**{side: instance.pk}).values_list(f'{other}_id', flat=True)
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        forget_unread_counts(instance.pk, *pk_set)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_event(sender, instance, created, **kwargs):
+    if created:
+        # engagement on a post also counts towards the hashtags it carries,
+        # remembered from when the post was recorded; only a post older than
+        # the window (or made before this process started) is read, once
+        hashtags = aggregator.post_hashtags(instance.post_id)
+        if hashtags is None:
+            content = Post.objects.values_list('content', flat=True).get(pk=instance.post_id)
+            hashtags = extract_hashtags(content)
+        aggregator.record('comment', instance.post_id, hashtags)
+
+
+# An attachment's ref_count is the number of posts linking to it, counted
+# as links are made and removed. Deleting a post drops its links without
+# m2m_changed, so that is counted from pre_delete. Archiving moves links
+# without signals and leaves the counts as they are.
+@receiver(m2m_changed, sender=Post.attachments.through)
+def count_attachment_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        # pk_set holds only the links that were actually new
+        links = {instance.pk: len(pk_set)} if reverse else Counter(pk_set)
+        Attachment.add_references(links)
+    elif action in ('pre_remove', 'pre_clear'):
+        # pk_set may name links that don't exist, so count the ones that do
+        existing = sender.objects.filter(**{'attachment' if reverse else 'post': instance})
+        if pk_set is not None:
+            existing = existing.filter(**{'post__in' if reverse else 'attachment__in': pk_set})
+        links = Counter(existing.values_list('attachment_id', flat=True))
+        Attachment.add_references({pk: -count for pk, count in links.items()})
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=ArchivedPost)
+def release_attachments(sender, instance, **kwargs):
+    ids = instance.attachments.values_list('pk', flat=True)
+    Attachment.add_references({pk: -1 for pk in ids})
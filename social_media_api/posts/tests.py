@@ -1,3 +1,425 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from accounts.search import search_users
+from .archive import archive_old_posts
+from .attachments import delete_unused_attachments
+from .feed import posted_key, unread_count
+from .fields import decode
+from .models import ArchivedComment, ArchivedPost, Attachment, Post, Comment, local_storage, make_excerpt
+from .trending import EngagementAggregator, aggregator
+
+
+class EngagementAggregatorTests(TestCase):
+    def test_recent_events_outrank_older_ones(self):
+        trending = EngagementAggregator(window_minutes=60, half_life_minutes=10)
+        now = 1_000_000 * 60
+        trending.record('comment', 1, {'django'}, when=now - 30 * 60)
+        trending.record('comment', 2, {'python'}, when=now - 60)
+
+        snapshot = trending.refresh(now)
+
+        self.assertEqual([row['post'] for row in snapshot['posts']], [2, 1])
+        self.assertEqual(snapshot['hashtags'][0]['tag'], 'python')
+
+    def test_events_outside_window_are_dropped(self):
+        trending = EngagementAggregator(window_minutes=5)
+        now = 1_000_000 * 60
+        trending.record('post', 1, when=now - 10 * 60)
+
+        self.assertEqual(trending.refresh(now)['posts'], [])
+
+    def test_late_events_do_not_wipe_newer_minutes(self):
+        trending = EngagementAggregator(window_minutes=5, half_life_minutes=10)
+        now = 1_000_000 * 60
+        trending.record('comment', 1, when=now)
+        # five minutes earlier maps to the same slot but has left the window
+        trending.record('post', 1, when=now - 5 * 60)
+        # one minute earlier is still in the window
+        trending.record('post', 1, when=now - 60)
+
+        score = trending.refresh(now)['posts'][0]['score']
+        self.assertEqual(score, round(2 + 0.5 ** 0.1, 3))
+
+    def test_post_hashtags_are_reused_until_the_post_leaves_the_window(self):
+        trending = EngagementAggregator(window_minutes=5)
+        now = 1_000_000 * 60
+        trending.record('post', 1, {'django'}, when=now)
+        trending.record('comment', 1, when=now)
+
+        self.assertEqual(trending.refresh(now)['hashtags'][0]['score'], 3.0)
+        trending.refresh(now + 10 * 60)
+        self.assertIsNone(trending.post_hashtags(1))
+
+    @override_settings(TRENDING={'TOP_N': 1})
+    def test_settings_are_read_when_used(self):
+        trending = EngagementAggregator()
+        now = 1_000_000 * 60
+        trending.record('post', 1, when=now)
+        trending.record('post', 2, when=now)
+
+        self.assertEqual(len(trending.refresh(now)['posts']), 1)
+
+
+class TrendingViewTests(APITestCase):
+    def setUp(self):
+        aggregator.clear()
+        self.user = CustomUser.objects.create_user(username='kelvin', password='testpass')
+
+    def test_comments_push_post_and_hashtags_up(self):
+        quiet = Post.objects.create(author=self.user, title='Quiet', content='nothing here')
+        busy = Post.objects.create(author=self.user, title='Busy', content='hello #Django')
+        Comment.objects.create(post=busy, author=self.user, content='nice')
+        aggregator.refresh()
+
+        response = self.client.get(reverse('trending'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['posts'][0]['post'], busy.pk)
+        self.assertIn(quiet.pk, [row['post'] for row in response.data['posts']])
+        self.assertEqual(response.data['hashtags'][0]['tag'], 'django')
+
+
+    def test_comments_reuse_the_recorded_hashtags(self):
+        post = Post.objects.create(author=self.user, title='Busy', content='hello #Django')
+        post.content = 'hello #python'
+        post.save()
+        post = Post.objects.only('pk').get(pk=post.pk)
+
+        # the insert alone: the post's content is never read
+        with self.assertNumQueries(1):
+            Comment.objects.create(post=post, author=self.user, content='nice')
+        aggregator.clear()
+        with self.assertNumQueries(2):
+            Comment.objects.create(post=post, author=self.user, content='nice')
+        with self.assertNumQueries(1):
+            Comment.objects.create(post=post, author=self.user, content='nice')
+        self.assertEqual([row['tag'] for row in aggregator.refresh()['hashtags']], ['python'])
+
+class FeedUnreadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass')
+        self.reader = CustomUser.objects.create_user(username='reader', password='testpass')
+        self.reader.following.add(self.author)
+        self.client.force_authenticate(self.reader)
+
+    def test_new_posts_bump_count_until_feed_is_read(self):
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 0)
+        Post.objects.create(author=self.author, title='One', content='first')
+        Post.objects.create(author=self.author, title='Two', content='second')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('feed-unread'))
+        self.assertEqual(response.data['unread'], 2)
+
+        self.client.get(reverse('feed'))
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 0)
+
+    def test_muted_author_is_hidden_from_feed_and_count(self):
+        self.client.get(reverse('feed'))
+        self.reader.muting.add(self.author)
+        Post.objects.create(author=self.author, title='One', content='first')
+
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 0)
+        self.assertEqual(self.client.get(reverse('feed')).data, [])
+
+    def test_blocked_user_cannot_comment(self):
+        post = Post.objects.create(author=self.author, title='One', content='first')
+        self.author.blocking.add(self.reader)
+
+        # naming someone else as the author changes nothing
+        response = self.client.post(reverse('comment-list'), {
+            'post': post.pk, 'author': self.author.pk, 'content': 'hi',
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_comment_is_saved_as_the_signed_in_user(self):
+        post = Post.objects.create(author=self.author, title='One', content='first')
+
+        response = self.client.post(reverse('comment-list'), {
+            'post': post.pk, 'author': self.author.pk, 'content': 'hi',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Comment.objects.get().author, self.reader)
+
+    def test_posting_bumps_one_counter_whatever_the_audience(self):
+        muter = CustomUser.objects.create_user(username='muter', password='testpass')
+        blocked = CustomUser.objects.create_user(username='blocked', password='testpass')
+        for follower in (muter, blocked):
+            follower.following.add(self.author)
+        muter.muting.add(self.author)
+        self.author.blocking.add(blocked)
+        for user in (self.reader, muter, blocked):
+            self.assertEqual(unread_count(user), 0)
+
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr, self.assertNumQueries(1):
+            Post.objects.create(author=self.author, title='One', content='first')
+        incr.assert_called_once_with(posted_key(self.author.pk))
+        with self.assertNumQueries(0):
+            self.assertEqual([unread_count(user) for user in (self.reader, muter, blocked)], [1, 0, 0])
+
+    def test_follows_and_evictions_recount(self):
+        other = CustomUser.objects.create_user(username='other', password='testpass')
+        Post.objects.create(author=self.author, title='One', content='first')
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 1)
+
+        self.reader.following.add(other)
+        Post.objects.create(author=other, title='Two', content='second')
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 2)
+
+        # with the author's counter evicted the post goes uncounted, until
+        # the reader finds it gone and counts from the db
+        self.client.get(reverse('feed'))
+        cache.delete(posted_key(self.author.pk))
+        Post.objects.create(author=self.author, title='Three', content='third')
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 1)
+        self.reader.following.remove(self.author)
+        self.assertEqual(self.client.get(reverse('feed-unread')).data['unread'], 0)
+
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class AttachmentTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = CustomUser.objects.create_user(username='kelvin', password='testpass')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def upload(self, data, header=PNG_HEADER, content_type='image/png'):
+        return self.client.post(reverse('attachment-upload'), {
+            'file': SimpleUploadedFile('meme.png', header + data, content_type=content_type),
+        })
+
+    def test_duplicate_upload_reuses_attachment(self):
+        first = self.upload(b'same meme')
+        second = self.upload(b'same meme')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data['sha256'], hashlib.sha256(PNG_HEADER + b'same meme').hexdigest())
+        self.assertEqual(second.data['id'], first.data['id'])
+        # only posts linking it count
+        self.assertEqual(Attachment.objects.get().ref_count, 0)
+
+    def test_racing_duplicate_upload_leaves_no_stray_file(self):
+        name = Attachment.storage_name(hashlib.sha256(PNG_HEADER + b'same meme').hexdigest())
+        local_storage.save(name, io.BytesIO(PNG_HEADER + b'same meme'))
+        # the other upload wrote the file after this one checked for it
+        real_exists, checks = local_storage.exists, []
+
+        def exists(name):
+            checks.append(name)
+            return len(checks) > 1 and real_exists(name)
+
+        with mock.patch.object(local_storage, 'exists', exists):
+            response = self.upload(b'same meme')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Attachment.objects.get().file.name, name)
+        folder = os.path.dirname(local_storage.path(name))
+        self.assertEqual(os.listdir(folder), [os.path.basename(name)])
+
+    def test_range_request_and_cache_headers(self):
+        url = self.upload(b'0123456789').data['url']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-13')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 10-13/18')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_sniffed_images_are_accepted_and_served_inline(self):
+        html = self.upload(b'<script>alert(1)</script>', header=b'', content_type='text/html')
+        svg = self.upload(b'<svg xmlns="http://www.w3.org/2000/svg"/>', header=b'', content_type='image/png')
+        self.assertEqual((html.status_code, svg.status_code), (400, 400))
+        self.assertFalse(Attachment.objects.exists())
+
+        gif = self.upload(b'89a...', header=b'GIF', content_type='text/html')
+        self.assertEqual(gif.data['content_type'], 'image/gif')
+        response = self.client.get(gif.data['url'])
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertNotIn('attachment', response.get('Content-Disposition', ''))
+
+    def test_stored_non_image_type_is_served_as_a_download(self):
+        name = Attachment.storage_name('b' * 64)
+        local_storage.save(name, io.BytesIO(b'<html>'))
+        Attachment.objects.create(sha256='b' * 64, file=name, size=6, content_type='text/html')
+
+        response = self.client.get(reverse('attachment-file', args=['b' * 64]))
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_deleting_last_post_removes_file(self):
+        attachment = Attachment.objects.get(pk=self.upload(b'only once').data['id'])
+        post = Post.objects.create(author=self.user, title='Pic', content='look')
+        post.attachments.add(attachment)
+
+        post.delete()
+
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(os.path.exists(attachment.file.path))
+
+    def test_shared_attachment_outlives_one_of_its_posts(self):
+        attachment = Attachment.objects.get(pk=self.upload(b'shared').data['id'])
+        first = Post.objects.create(author=self.user, title='One', content='look')
+        second = Post.objects.create(author=self.user, title='Two', content='again')
+        first.attachments.add(attachment)
+        attachment.posts.add(second)
+        self.assertEqual(Attachment.objects.get().ref_count, 2)
+
+        first.delete()
+        self.assertEqual(Attachment.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(attachment.file.path))
+        self.assertEqual(list(second.attachments.all()), [attachment])
+
+        second.delete()
+        self.assertFalse(Attachment.objects.exists())
+        self.assertFalse(os.path.exists(attachment.file.path))
+
+    def test_unlinking_releases_the_reference(self):
+        kept = Attachment.objects.get(pk=self.upload(b'kept').data['id'])
+        dropped = Attachment.objects.get(pk=self.upload(b'dropped').data['id'])
+        post = Post.objects.create(author=self.user, title='Pics', content='look')
+        other = Post.objects.create(author=self.user, title='More', content='look')
+        post.attachments.add(kept, dropped)
+        other.attachments.add(kept)
+        post.attachments.add(kept)  # already linked, not counted again
+
+        post.attachments.remove(dropped, dropped)
+        self.assertFalse(Attachment.objects.filter(pk=dropped.pk).exists())
+        post.attachments.clear()
+        self.assertEqual(Attachment.objects.get(pk=kept.pk).ref_count, 1)
+
+    def test_uploads_never_linked_are_cleaned_up(self):
+        attachment = Attachment.objects.get(pk=self.upload(b'forgotten').data['id'])
+        linked = Attachment.objects.get(pk=self.upload(b'used').data['id'])
+        Post.objects.create(author=self.user, title='Pic', content='look').attachments.add(linked)
+
+        self.assertEqual(delete_unused_attachments(), 0)
+        self.assertEqual(delete_unused_attachments(older_than=timedelta(0)), 1)
+        self.assertEqual(list(Attachment.objects.all()), [linked])
+        self.assertFalse(os.path.exists(attachment.file.path))
+
+
+class CompressedContentTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='kelvin', password='testpass')
+
+    def test_long_bodies_are_compressed_on_disk(self):
+        body = 'lorem ipsum dolor sit amet ' * 200
+        post = Post.objects.create(author=self.user, title='Long', content=body)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM posts_post WHERE id = %s', [post.pk])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertEqual(stored[:1], b'\x01')
+        self.assertLess(len(stored), len(body) // 5)
+        self.assertEqual(Post.objects.get(pk=post.pk).content, body)
+        self.assertEqual(decode(stored), body)
+
+    def test_list_serves_excerpt_and_detail_serves_body(self):
+        body = 'word ' * 500
+        post = Post.objects.create(author=self.user, title='Long', content=body)
+
+        listed = self.client.get(reverse('post-list')).data[0]
+        self.assertNotIn('content', listed)
+        self.assertLessEqual(len(listed['excerpt']), 200)
+        self.assertEqual(self.client.get(reverse('post-detail', args=[post.pk])).data['content'], body)
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='kelvin', password='testpass')
+        self.old = Post.objects.create(author=self.user, title='Old', content='from long ago ' * 50)
+        self.comment = Comment.objects.create(post=self.old, author=self.user, content='first!')
+        self.attachment = Attachment.objects.create(sha256='a' * 64, file='x', size=1, content_type='image/png')
+        self.old.attachments.add(self.attachment)
+        self.new = Post.objects.create(author=self.user, title='New', content='fresh')
+        self.long_ago = timezone.now() - timedelta(days=400)
+        Post.objects.filter(pk=self.old.pk).update(created_at=self.long_ago)
+        Comment.objects.filter(pk=self.comment.pk).update(created_at=self.long_ago)
+
+    def test_old_posts_move_to_archive_and_back_on_access(self):
+        self.assertEqual(archive_old_posts(older_than_days=365), 1)
+        self.assertEqual(list(Post.objects.values_list('pk', flat=True)), [self.new.pk])
+        self.assertFalse(Comment.objects.exists())
+        self.assertTrue(ArchivedComment.objects.filter(post_id=self.old.pk).exists())
+
+        response = self.client.get(reverse('post-detail', args=[self.old.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['content'], self.old.content)
+        self.assertEqual(response.data['attachments'], [self.attachment.pk])
+        self.assertFalse(ArchivedPost.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.old.pk).created_at, self.long_ago)
+        self.assertEqual(Attachment.objects.get().ref_count, 1)
+
+    def test_recent_comment_keeps_post_hot(self):
+        Comment.objects.create(post=self.old, author=self.user, content='still talking')
+        self.assertEqual(archive_old_posts(older_than_days=365), 0)
+
+    def test_command_reads_the_setting_when_run(self):
+        with self.settings(ARCHIVE_AFTER_DAYS=500):
+            call_command('archive_posts', stdout=io.StringIO())
+        self.assertFalse(ArchivedPost.objects.exists())
+        with self.settings(ARCHIVE_AFTER_DAYS=300):
+            call_command('archive_posts', stdout=io.StringIO())
+        self.assertEqual(list(ArchivedPost.objects.values_list('pk', flat=True)), [self.old.pk])
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, seed):
+        call_command(
+            'generate_data', seed=seed, users=30, posts=60, comments=90, chunk_size=25, stdout=io.StringIO(),
+        )
+        return (
+            list(CustomUser.objects.order_by('pk').values_list('username', 'following__username')),
+            list(Post.objects.order_by('pk').values_list('author__username', 'title', 'content', 'excerpt')),
+            list(Comment.objects.order_by('pk').values_list('post__title', 'author__username', 'content')),
+        )
+
+    def test_same_seed_same_data(self):
+        first = self.generate(seed=7)
+        CustomUser.objects.all().delete()
+        second = self.generate(seed=7)
+
+        self.assertEqual(first, second)
+        # bulk inserted users are still found by prefix search, with their follows counted
+        self.assertEqual(len(search_users('USER7_', limit=50)), 30)
+        users = CustomUser.objects.annotate(follows=Count('followers'))
+        self.assertFalse(users.exclude(follower_count=F('follows')).exists())
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 90)
+        for post in Post.objects.all():
+            self.assertEqual(post.excerpt, make_excerpt(post.content))
+        # comments never predate their post
+        self.assertFalse(Comment.objects.filter(created_at__lt=F('post__created_at')).exists())
@@ -0,0 +1,210 @@
+import heapq
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+# how much one event of each kind adds to a post or hashtag
+EVENT_WEIGHTS = {
+    'post': 1.0,
+    'comment': 2.0,
+    'like': 1.0,
+}
+
+TRENDING = {
+    'WINDOW_MINUTES': 60,
+    'HALF_LIFE_MINUTES': 30,
+    'REFRESH_SECONDS': 30,
+    'TOP_N': 20,
+}
+
+
+def get_config():
+    return {**TRENDING, **getattr(settings, 'TRENDING', {})}
+
+
+def extract_hashtags(text):
+    return {tag.lower() for tag in HASHTAG_RE.findall(text or '')}
+
+
+class MinuteRing:
+    """Weighted event counts for the last `size` minutes, one slot per minute."""
+
+    __slots__ = ('size', 'counts', 'minutes')
+
+    def __init__(self, size):
+        self.size = size
+        self.counts = [0.0] * size
+        self.minutes = [-1] * size
+
+    def add(self, minute, amount):
+        slot = minute % self.size
+        if minute < self.minutes[slot]:
+            # a late event for a minute whose slot has been reused
+            return
+        if minute > self.minutes[slot]:
+            # slot still holds a minute that has left the window
+            self.minutes[slot] = minute
+            self.counts[slot] = 0.0
+        self.counts[slot] += amount
+
+    def copy(self):
+        ring = MinuteRing(self.size)
+        ring.counts = self.counts[:]
+        ring.minutes = self.minutes[:]
+        return ring
+
+    def is_stale(self, now_minute):
+        return max(self.minutes) <= now_minute - self.size
+
+    def score(self, now_minute, half_life):
+        total = 0.0
+        oldest = now_minute - self.size
+        for minute, count in zip(self.minutes, self.counts):
+            if oldest < minute <= now_minute:
+                total += count * 0.5 ** ((now_minute - minute) / half_life)
+        return total
+
+
+class EngagementAggregator:
+    """
+    Keeps sliding-window counters for posts and hashtags and turns them into
+    decayed trending scores. Readers only ever see the last computed snapshot,
+    which is swapped in whole, so serving it is constant time. Settings not
+    given here are read from settings.TRENDING whenever they're used.
+    """
+
+    def __init__(self, window_minutes=None, half_life_minutes=None,
+                 refresh_seconds=None, top_n=None, clock=time.time):
+        self.options = {
+            'WINDOW_MINUTES': window_minutes,
+            'HALF_LIFE_MINUTES': half_life_minutes,
+            'REFRESH_SECONDS': refresh_seconds,
+            'TOP_N': top_n,
+        }
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def _option(self, name):
+        return self.options[name] or get_config()[name]
+
+    @property
+    def window_minutes(self):
+        return self._option('WINDOW_MINUTES')
+
+    @property
+    def half_life_minutes(self):
+        return self._option('HALF_LIFE_MINUTES')
+
+    @property
+    def refresh_seconds(self):
+        return self._option('REFRESH_SECONDS')
+
+    @property
+    def top_n(self):
+        return self._option('TOP_N')
+
+    def clear(self):
+        with self._lock:
+            self._posts = {}
+            self._hashtags = {}
+            self._post_hashtags = {}
+            self._refreshing = False
+            self._computed_at = 0.0
+            self._snapshot = self._build_snapshot(None, [], [])
+
+    def record(self, kind, post_id, hashtags=None, when=None):
+        """
+        Count an event on a post and its hashtags. The hashtags are kept for
+        as long as the post has counters, so later events can leave them out
+        (None) rather than read the post again.
+        """
+        weight = EVENT_WEIGHTS[kind]
+        minute = int((when or self.clock()) // 60)
+        with self._lock:
+            if hashtags is None:
+                hashtags = self._post_hashtags.get(post_id, ())
+            else:
+                self._post_hashtags[post_id] = hashtags
+            self._bump(self._posts, post_id, minute, weight)
+            for tag in hashtags:
+                self._bump(self._hashtags, tag, minute, weight)
+
+    def post_hashtags(self, post_id):
+        """The hashtags last recorded for a post, or None if it has no counters."""
+        return self._post_hashtags.get(post_id)
+
+    def update_post_hashtags(self, post_id, hashtags):
+        with self._lock:
+            if post_id in self._posts:
+                self._post_hashtags[post_id] = hashtags
+
+    def _bump(self, counters, key, minute, weight):
+        ring = counters.get(key)
+        if ring is None:
+            ring = counters[key] = MinuteRing(self.window_minutes)
+        ring.add(minute, weight)
+
+    def snapshot(self):
+        if self.clock() - self._computed_at >= self.refresh_seconds:
+            self._schedule_refresh()
+        return self._snapshot
+
+    def _schedule_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def refresh(self, now=None):
+        now = now or self.clock()
+        now_minute = int(now // 60)
+        with self._lock:
+            # drop keys with nothing left in the window, copy the rest so the
+            # scoring below doesn't hold up writers
+            for counters in (self._posts, self._hashtags):
+                for key in [k for k, ring in counters.items() if ring.is_stale(now_minute)]:
+                    del counters[key]
+                    if counters is self._posts:
+                        self._post_hashtags.pop(key, None)
+            posts = [(key, ring.copy()) for key, ring in self._posts.items()]
+            hashtags = [(key, ring.copy()) for key, ring in self._hashtags.items()]
+
+        self._snapshot = self._build_snapshot(
+            now,
+            self._top(posts, now_minute),
+            self._top(hashtags, now_minute),
+        )
+        self._computed_at = now
+        return self._snapshot
+
+    def _top(self, rings, now_minute):
+        scored = ((ring.score(now_minute, self.half_life_minutes), key) for key, ring in rings)
+        return heapq.nlargest(self.top_n, scored)
+
+    def _build_snapshot(self, now, posts, hashtags):
+        generated_at = None
+        if now is not None:
+            generated_at = datetime.fromtimestamp(now, tz=timezone.utc).isoformat()
+        return {
+            'generated_at': generated_at,
+            'window_minutes': self.window_minutes,
+            'posts': [{'post': key, 'score': round(score, 3)} for score, key in posts],
+            'hashtags': [{'tag': key, 'score': round(score, 3)} for score, key in hashtags],
+        }
+
+
+aggregator = EngagementAggregator()
@@ -3,7 +3,7 @@ from django.contrib import admin
 from rest_framework.routers import DefaultRouter
 from posts.views import PostViewSet, CommentViewSet
 
-from .views import FeedView
+from .views import FeedView, FeedUnreadView, TrendingView, AttachmentUploadView, AttachmentFileView
 
 
 router = DefaultRouter()
@@ -13,5 +13,9 @@ router.register('comments', CommentViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('feed/', FeedView.as_view(), name='feed'), 
+    path('feed/unread/', FeedUnreadView.as_view(), name='feed-unread'),
+    path('trending/', TrendingView.as_view(), name='trending'),
+    path('attachments/', AttachmentUploadView.as_view(), name='attachment-upload'),
+    path('attachments/<str:sha256>/', AttachmentFileView.as_view(), name='attachment-file'),
     
 ]
\ No newline at end of file
@@ -1,9 +1,21 @@
-from django.shortcuts import render
-from .models import Post, Comment
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from .models import Attachment, Post, Comment
 #import create, read, update, delete
 from rest_framework import viewsets
-from .serializers import PostSerializer, CommentSerializer
-from rest_framework import generics, permissions
+from .serializers import (
+    AttachmentSerializer, PostSerializer, PostListSerializer, CommentSerializer, CommentListSerializer,
+)
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from accounts.blocking import is_blocked, visible_following_ids
+from .archive import restore_comment, restore_post
+from .attachments import IMAGE_TYPES, HashingUploadHandler, image_type, parse_range, read_range, store_upload
+from .feed import mark_feed_read, unread_count
+from .trending import aggregator
 
 
 # Create your views here.
@@ -14,19 +26,155 @@ class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
+    def get_queryset(self):
+        if self.action == 'list':
+            return Post.objects.defer('content').prefetch_related('attachments')
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PostListSerializer
+        return super().get_serializer_class()
+
+    def get_object(self):
+        # archived posts are moved back to the hot tables when accessed
+        try:
+            return super().get_object()
+        except Http404:
+            if not self.kwargs['pk'].isdigit() or not restore_post(int(self.kwargs['pk'])):
+                raise
+            return super().get_object()
+
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return Comment.objects.defer('content')
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CommentListSerializer
+        return super().get_serializer_class()
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if not self.kwargs['pk'].isdigit() or not restore_comment(int(self.kwargs['pk'])):
+                raise
+            return super().get_object()
+
+    def perform_create(self, serializer):
+        post = serializer.validated_data['post']
+        if is_blocked(post.author_id, self.request.user.pk):
+            raise PermissionDenied('You cannot comment on this post.')
+        serializer.save(author=self.request.user)
 
 
 class FeedView(generics.ListAPIView):
-    serializer_class = PostSerializer
+    serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        # Get users the current user is following
-        following_users = self.request.user.following.all()
+        # Get users the current user is following, minus blocked and muted ones
+        following_users = visible_following_ids(self.request.user)
         # Required pattern for checker
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        return Post.objects.filter(author__in=following_users).order_by('-created_at').defer('content').prefetch_related('attachments')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        mark_feed_read(request.user)
+        return response
+
+
+# Number of feed posts since the feed was last read, answered from the cache
+class FeedUnreadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': unread_count(request.user)})
+
+
+# Trending posts and hashtags, served from the last precomputed snapshot
+class TrendingView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return Response(aggregator.snapshot())
+
+
+# Upload a media file; content that was uploaded before is reused, not rewritten
+class AttachmentUploadView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = AttachmentSerializer
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        hashing = HashingUploadHandler(request)
+        request.upload_handlers.insert(0, hashing)
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'message': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = image_type(uploaded)
+        if content_type is None:
+            return Response(
+                {'message': 'Only PNG, JPEG, GIF and WebP images can be attached'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        attachment, created = store_upload(uploaded, hashing.digests['file'], content_type)
+        return Response(
+            self.get_serializer(attachment).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+# Serve attachment bytes; the url is the content hash so it never changes
+class AttachmentFileView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, sha256):
+        attachment = get_object_or_404(Attachment, sha256=sha256)
+        etag = f'"{attachment.sha256}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = self.file_response(request, attachment)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response['Accept-Ranges'] = 'bytes'
+        # served from the API origin, so never let a browser render it as
+        # anything but the image type it was checked to be
+        response['X-Content-Type-Options'] = 'nosniff'
+        if attachment.content_type not in IMAGE_TYPES:
+            response['Content-Disposition'] = 'attachment'
+        return response
+
+    def file_response(self, request, attachment):
+        content_type = attachment.content_type
+        if content_type not in IMAGE_TYPES:
+            content_type = 'application/octet-stream'
+        try:
+            byte_range = parse_range(request.headers.get('Range'), attachment.size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{attachment.size}'
+            return response
+
+        file = attachment.file.open('rb')
+        if byte_range is None:
+            return FileResponse(file, content_type=content_type)
 
-    
\ No newline at end of file
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(file, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{attachment.size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response